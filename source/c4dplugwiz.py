@@ -164,14 +164,30 @@ from __future__ import print_function
 import sys
 import os
 import re
+import math
 import time
+import gc
+import json
+import mmap
 import codecs
+import struct
+import hashlib
+import functools
+import threading
 import shutil as su
-import unicodedata as ud
 
-from argparse import ArgumentParser
-from argparse import RawDescriptionHelpFormatter
-from subprocess import Popen, PIPE
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict, Mapping
+from contextlib import contextmanager
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+# argparse, subprocess, unicodedata, tarfile and zipfile are 
+# imported where they are used, to keep startup time down.
+# See tests/c4dplugwiz_startup.py.
 
 __all__ = ['PluginWizard', 'TextFX']
 __version__ = (0, 5)
@@ -194,6 +210,7 @@ PLUGIN_ID_TESTING = 1000001
 DEFAULT_ENV_AUTHOR = 'C4DPLUGWIZ_AUTHORNAME'
 DEFAULT_ENV_ORG = 'C4DPLUGWIZ_ORGNAME'
 DEFAULT_ENV_DATA = 'C4DPLUGWIZ_DATA'
+DEFAULT_ENV_CACHE = 'C4DPLUGWIZ_CACHE'
 
 DEFAULT_FILE_EXCLUDES = [
     '.DS_Store', 
@@ -217,6 +234,15 @@ DEFAULT_EXCLUDES = list(set(DEFAULT_FILE_EXCLUDES).union(set(DEFAULT_DIR_EXCLUDE
 
 DEFAULT_DATADIR = 'c4dplugwiz_data'
 DEFAULT_RULES_FILENAME = 'rules.py'
+DEFAULT_CACHEDIR = os.path.join('~', '.c4dplugwiz')
+DEFAULT_BLOBDIR = '.blobs'
+DEFAULT_MANIFEST_EXT = '.manifest'
+DEFAULT_BUNDLE_EXT = '.c4dtpl'
+
+BUNDLE_MAGIC = b'C4DTPL01'
+BUNDLE_PREFIX_FORMAT = '<8sI'   # magic, header size
+BUNDLE_FLAG_DIR = 1
+BUNDLE_FLAG_BINARY = 2
 
 BASE_NAME_FORMS = [
     'Entered',
@@ -232,6 +258,24 @@ BASE_NAME_FORMS = [
     'Initials'
 ]
 
+TEXTFX_CACHE_SIZE = 1024    # max. number of memoized results per TextFX transform
+AUTHOR_CACHE_TTL = 7 * 24 * 60 * 60     # seconds a looked up author name is kept in the cache dir
+CANCEL_CHECK_LINES = 4096   # lines of a file processed between checks for cancellation
+MTIME_TOLERANCE = 1e-6      # seconds two modification times may differ by and still count as equal
+ROLLBACK_SUFFIX = '.c4dplugwiz-old'     # an overwritten plugin is kept here until the new one is complete
+
+DEFAULT_PROFILE_FILENAME = 'c4dplugwiz.pstats'
+PROFILE_COLLAPSED_EXT = '.collapsed.txt'
+DEFAULT_SAMPLES_FILENAME = 'c4dplugwiz.samples' + PROFILE_COLLAPSED_EXT
+DEFAULT_HISTORY_FILENAME = 'history.ndjson'
+HISTORY_MAX_BYTES = 4 * 1024 * 1024     # the run history is rotated at this size, one older file is kept
+PROFILE_TOP = 20            # functions listed in the --profile summary
+PROFILE_MAX_DEPTH = 64      # frames per collapsed stack
+SAMPLING_RATE = 100.0       # stack samples per second taken by the sampling profiler
+SAMPLING_FLUSH_INTERVAL = 10.0  # seconds between writes of the sampled stacks
+TRACE_MEMORY_TOP = 10       # object types listed by --trace-memory
+MACH_TASK_BASIC_INFO = 20   # task_info() flavor on OS X
+
 g_verbose = 0
 
 # Use this section to set different token chars per OS
@@ -267,8 +311,148 @@ class CLIError(Exception):
         return self.msg
 
 
+class GenerationCancelled(CLIError):
+    '''Raised when a :py:class:`CancellationToken` was cancelled or its deadline has passed.'''
+    pass
+
+
+class LRUCache(object):
+    '''
+    Size-bounded mapping which discards the least recently used 
+    entry once ``maxsize`` is exceeded. Counts hits and misses 
+    so callers can instrument how effective the cache is.
+    
+    :param int maxsize: max. number of entries. 0 disables the cache.
+    '''
+    def __init__(self, maxsize=TEXTFX_CACHE_SIZE):
+        super(LRUCache, self).__init__()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        
+    def __len__(self):
+        return len(self._data)
+    
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def resize(self, maxsize):
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def info(self):
+        '''Return a dict with ``hits``, ``misses``, ``size`` and ``maxsize``.'''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize
+        }
+
+
+_MISSING = object()
+
+_optional_modules = {}
+
+def optional_import(name):
+    '''
+    Import and return the module ``name``, or None if it isn't 
+    installed. Used for modules not available everywhere, like ``resource``.
+    The outcome is remembered, so failed imports aren't retried.
+    '''
+    try:
+        return _optional_modules[name]
+    except KeyError:
+        pass
+    try:
+        module = __import__(name)
+    except ImportError:
+        module = None
+    _optional_modules[name] = module
+    return module
+
+class lazy_classattr(object):
+    '''
+    Decorator for class attributes that are costly to compute, 
+    such as lookup tables. The decorated function is called with 
+    the class on first access and its result replaces the 
+    attribute, so later accesses are plain attribute lookups.
+    '''
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+    
+    def __get__(self, instance, owner):
+        value = self.func(owner)
+        setattr(owner, self.func.__name__, value)
+        return value
+    
+
+def lru_memoize(cache):
+    '''
+    Decorator which memoizes the results of a function with 
+    hashable arguments in ``cache`` (an :py:class:`LRUCache`).
+    
+    The argument types are part of the key so that e.g. 
+    ``'abc'`` and ``u'abc'`` don't share a result.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if cache.maxsize <= 0:
+                return func(*args, **kwargs)
+            key = (args, tuple(type(a) for a in args), tuple(sorted(kwargs.iteritems())))
+            try:
+                result = cache.get(key, _MISSING)
+            except TypeError:
+                # unhashable arguments
+                return func(*args, **kwargs)
+            if result is _MISSING:
+                result = func(*args, **kwargs)
+                cache.put(key, result)
+            return result
+        wrapper.cache = cache
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
 class TextFX(object):
     '''Methods for processing and transforming text.'''
+    
+    # memoized results of the more expensive transforms, 
+    # see cache_info() and set_cache_size()
+    caches = {
+        'transform': LRUCache(),
+        'clean': LRUCache(),
+        'to_camelcase': LRUCache(),
+        'abbreviate': LRUCache()
+    }
     greek_chars = {
         'alpha':'a',
         'beta':'b',
@@ -360,8 +544,58 @@ class TextFX(object):
         u'ö': 'oe',
         u'ß': 'ss',
     }
+    
+    # translation tables for unicode.translate(), computed on first use
+    @lazy_classattr
+    def umlauts_table(cls):
+        return dict((ord(k), unicode(v)) for k, v in cls.phonetic_umlauts.iteritems())
+    
+    @lazy_classattr
+    def greek_table(cls):
+        return dict((ord(k), unicode(v)) for k, v in cls.greek_alphabet.iteritems())
+    
+    # combining diacritical marks (U+0300 - U+036F)
+    @lazy_classattr
+    def combining_marks(cls):
+        return frozenset(unichr(cp) for cp in xrange(0x0300, 0x0370))
+    
+    # combining diacritical marks mapped to None, so translate() drops them
+    @lazy_classattr
+    def combining_marks_table(cls):
+        return dict.fromkeys(ord(c) for c in cls.combining_marks)
+    
+    _disallowed_chars_regexes = {}
+    _underscore_word_regex = re.compile(ur'_+([^_]+)', re.UNICODE)
+    _space_word_regex = re.compile(ur' ([^ ]+)', re.UNICODE)
+    _camelcase_part_regex = re.compile(r'[A-Z]+[a-z]*', re.UNICODE)
+    _abbreviation_regex = re.compile(r"([A-Z])[A-Z]*[a-z]*")
+    
     def __init__(self):
         super(TextFX, self).__init__()
+    
+    @classmethod
+    def cache_info(cls):
+        '''
+        Get hit/miss counters and sizes of the memoization caches.
+        
+        :return: dict of ``{function name: LRUCache.info()}``
+        '''
+        return dict((name, cache.info()) for name, cache in cls.caches.iteritems())
+    
+    @classmethod
+    def set_cache_size(cls, maxsize):
+        '''
+        Set the max. number of memoized results kept per function. 
+        A ``maxsize`` of 0 disables memoization.
+        '''
+        for cache in cls.caches.itervalues():
+            cache.resize(maxsize)
+    
+    @classmethod
+    def clear_caches(cls):
+        '''Drop all memoized results and reset the hit/miss counters.'''
+        for cache in cls.caches.itervalues():
+            cache.clear()
         
     @staticmethod
     def precomp_unicode(word, canonical=True):
@@ -378,6 +612,7 @@ class TextFX(object):
         '''
         if not isinstance(word, unicode):
             raise TypeError("E: param 'word': expected unicode, got %s" % type(word))
+        import unicodedata as ud
         result = word
         try:
             if canonical:
@@ -407,6 +642,7 @@ class TextFX(object):
         '''
         if not isinstance(word, unicode):
             raise TypeError("E: param 'word': expected unicode, got %s" % type(word))
+        import unicodedata as ud
         result = word
         try:
             if canonical:
@@ -420,6 +656,7 @@ class TextFX(object):
         return result
     
     @staticmethod
+    @lru_memoize(caches['to_camelcase'])
     def to_camelcase(word, capitalize=True):
         u'''
         Convert 'word' to CamelCase.
@@ -443,21 +680,23 @@ class TextFX(object):
         :param bool capitalized: if ``True``, always capitalize 
             the first character of the result.
         '''
-        def __capitalizematch(matchobj):
-            grp1 = matchobj.group(1)
-            if grp1:
-                return grp1.capitalize()
-            else:
-                return matchobj.group(0)
         if word is None or len(word) == 0: return ''
         word = word.strip()
-        word = re.sub(ur'_+([^_]+)', __capitalizematch, word, re.UNICODE)
-        word = re.sub(ur' ([^ ]+)', __capitalizematch, word, re.UNICODE)
-        word = re.sub(' ', '', word, re.UNICODE)
-        if capitalize:
+        word = TextFX._underscore_word_regex.sub(TextFX._capitalize_match, word)
+        word = TextFX._space_word_regex.sub(TextFX._capitalize_match, word)
+        word = word.replace(' ', '')
+        if capitalize and len(word) > 0:
             word = '%s%s' % (word[0].upper(), word[1:])
         return word
     
+    @staticmethod
+    def _capitalize_match(matchobj):
+        grp1 = matchobj.group(1)
+        if grp1:
+            return grp1.capitalize()
+        else:
+            return matchobj.group(0)
+    
     @staticmethod
     def split_camelcase(word):
         '''
@@ -466,10 +705,10 @@ class TextFX(object):
         :param string word: the string to split
         '''
         if word is None or len(word) == 0: return ''
-        pat = re.compile(r'[A-Z]+[a-z]*', re.UNICODE)
-        return re.findall(pat, word)
+        return TextFX._camelcase_part_regex.findall(word)
 
     @staticmethod
+    @lru_memoize(caches['abbreviate'])
     def abbreviate(word, maxchars=-1):
         '''
         Reduce some string to an abbreviation of a given length.
@@ -485,9 +724,7 @@ class TextFX(object):
         '''
         if word is None or len(word) == 0: return ''
         word = word.strip()
-        #pat = re.compile(r'\b(\w)', re.UNICODE)
-        pat = re.compile(r"([A-Z])[A-Z]*[a-z]*")
-        word = re.findall(pat, word)
+        word = TextFX._abbreviation_regex.findall(word)
         if maxchars > 0:
             word = word[0:maxchars]
         return "".join(word)
@@ -534,73 +771,55 @@ class TextFX(object):
             translitterated name, e.g. 'π' becomes 'pi'.
         :param string allowed_chars: string of chars to leave unchanged. 
             Note that the string is used within a regex.
-        :param string errors: if 'strict' raise whatever exception occurred.
-            If 'replace', replace each character that causes an error during
-            processing with an underscore. Default is 'replace'.
+        :param string errors: if 'strict' raise whatever exception occurred
+            while decoding a byte string ``word``. If 'replace', replace each 
+            character that can't be decoded, which in turn gets replaced by 
+            ``safechar``. Default is 'replace'.
+        :param string encoding: the encoding to decode ``word`` with, if it 
+            is a byte string. Unicode strings are used as is.
         '''
         if word is None or len(word) == 0: return safechar
         allowed_chars += safechar
+        if not isinstance(word, unicode):
+            try:
+                word = word.decode(encoding)
+            except (UnicodeError, LookupError):
+                word = unicode(word, errors=errors)
         if ' ' not in allowed_chars:
-            word = re.sub(' ', safechar, word)
+            word = word.replace(u' ', safechar)
+        if not TextFX.is_ascii(word):
+            # none of the tables below contain ASCII code points,
+            # so pure ASCII input can skip straight to the final pass
+            if replace_umlauts:
+                word = word.translate(TextFX.umlauts_table)
+            if replace_diacritics:
+                # canonically decompose the word so we can "weed out" the diacritical marks
+                import unicodedata as ud
+                word = ud.normalize('NFKD', word).translate(TextFX.combining_marks_table)
+            if replace_greek:
+                word = word.translate(TextFX.greek_table)
+        return TextFX._disallowed_chars_regex(allowed_chars).sub(safechar, word)
+
+    @staticmethod
+    def is_ascii(word):
+        '''Return True if the unicode string ``word`` only contains ASCII characters.'''
         try:
-            word = unicode(word.decode(encoding).encode("utf-8"))
-        except:
-            word = unicode(word, errors="replace")
-        if replace_umlauts:
-            temp = u''
-            for c in word:
-                try:
-                    if c in TextFX.phonetic_umlauts:
-                        temp += TextFX.phonetic_umlauts[c]
-                    else:
-                        temp += c
-                except Exception as e:
-                    if errors == 'strict':
-                        raise(e)
-                    else:
-                        temp += safechar
-            word = temp
-        if replace_diacritics:
-            # canonically decompose the search string so we can "weed out" the diacritical marks
-            word = ud.normalize('NFKD', word)
-            # dynamically generate combining marks list
-            marks = []
-            for i in range(0, 7):
-                for j in range(0, 16):
-                    r = u"%su03%x%x" % ('\\', i, j)
-                    marks.append(r.decode('unicode_escape'))        
-            # loop through filename and filter out the diacritical marks
-            res = u''
-            for char in word:
-                try:
-                    if char in marks:
-                        pass
-                    else:
-                        res += char
-                except Exception as e:
-                    if errors == 'strict':
-                        raise(e)
-                    else:
-                        res += safechar
-            word = res
-        if replace_greek:
-            temp = ''
-            for c in word:
-                try:
-                    if c in TextFX.greek_alphabet:
-                        temp += TextFX.greek_alphabet[c]
-                    else:
-                        temp += c
-                except Exception as e:
-                    if errors == 'strict':
-                        raise(e)
-                    else:
-                        temp += safechar
-            word = temp
-        word = re.sub(ur'[^a-zA-Z0-9%s]' % allowed_chars, safechar, word)
-        return word
+            word.encode('ascii')
+        except UnicodeError:
+            return False
+        return True
+
+    @staticmethod
+    def _disallowed_chars_regex(allowed_chars):
+        try:
+            return TextFX._disallowed_chars_regexes[allowed_chars]
+        except KeyError:
+            regex = re.compile(ur'[^a-zA-Z0-9%s]' % allowed_chars)
+            TextFX._disallowed_chars_regexes[allowed_chars] = regex
+            return regex
 
     @staticmethod
+    @lru_memoize(caches['clean'])
     def clean(word, safechar='_'):
         if word is None or len(word) == 0:
             return ''
@@ -609,197 +828,227 @@ class TextFX(object):
             replace_umlauts=True, 
             replace_diacritics=True, 
             replace_greek=True, 
-            allowed_chars=r"_\-()'\+=!")
+            allowed_chars=TextFX.clean_allowed_chars)
         return cleaned_word
         
     @staticmethod
+    @lru_memoize(caches['transform'])
     def transform(word, form):
-        form = form.lower()
-        if form == "cleaned":
-            return TextFX.clean(word, safechar=' ')
-        elif form == "abbreviation":
-            return TextFX.abbreviate(word)
-        elif form == "uppercase":
-            return word.upper()
-        elif form == "lowercase":
-            return word.lower()
-        elif form == "initials":
-            return TextFX.abbreviate(word, maxchars=3)
-        elif form == "uppercaseid":
-            return TextFX.to_camelcase(TextFX.clean(word, safechar=' ')).upper()
-        elif form == "lowercaseid":
-            return TextFX.to_camelcase(TextFX.clean(word, safechar=' ')).lower()
-        elif form == "uppercaseidsep":
-            return TextFX.clean(word, safechar='_').upper()
-        elif form == "lowercaseidsep":
-            return TextFX.clean(word, safechar='_').lower()
-        elif form == "id":
-            if '_' in word:
-                result = TextFX.clean(word, safechar='_')
-                result = result[0].upper() + result[1:]
-                return result
-            else:
-                return TextFX.to_camelcase(TextFX.clean(word, safechar='_'), capitalize=True)
-        else:
+        '''
+        Transform ``word`` into one of the alternative forms 
+        listed in ``BASE_NAME_FORMS`` (case insensitive). 
+        Returns ``word`` unchanged if ``form`` is unknown.
+        '''
+        form = TextFX.form_names.get(form.lower())
+        if form is None:
             return word
-        
-
-class PluginWizard(object):
-    '''
-    CINEMA 4D plugin template wizard.
-    
-    Main class which provides methods for replacements in 
-    the names and contents of files contained within a folder 
-    structure.
-    '''
-    tokenchar_start   = g_mts
-    tokenchar_end     = g_mte
-    token_regex       = re.compile(r'%s(?P<token>\w+?)%s' % (tokenchar_start, tokenchar_end))
-    token_xform_regex = re.compile(r'%s(?P<token>\w+?)As(?P<form>\w+?)%s' % (tokenchar_start, tokenchar_end))  
+        return TextFX.all_forms(word, [form])[form]
     
-    # alternative forms 'registry' 
-    # this is purely for info print outs at the command line
-    # it won't be used by _fill_tokentable
-    token_forms = {
-        'ID': [
-            'Entered',
-        ],
-        'PluginName': BASE_NAME_FORMS,
-        'AuthorName': BASE_NAME_FORMS,
-        'OrgName': BASE_NAME_FORMS,
-        'DateTime': [
-            'Iso',
-            'Locale'
-        ],
-        'Date': [
-            'IsoSeparated',
-            'Iso',
-            'EnglishDashSeparated',
-            'EnglishSeparated',
-            'English',
-            'LocaleSeparated',
-            'Locale',
-            'NameOfDay',
-            'ShortNameOfDay'
-        ],
-        'Time': [
-            'EnglishSeparated',
-            'English',
-            'LocaleSeparated',
-            'Locale',
-            'SecondsSinceEpoch'
-        ]
-    }
-
-    def __init__(self, config, plugin_type=PLUGIN_TYPE_DEFAULT):
-        super(PluginWizard, self).__init__()
-        self._check_config(config)
-        self.config = config
-        if not 'excludedFiles' in config:
-            config['excludedFiles'] = DEFAULT_EXCLUDES
-        self.destdir = None
-        self.srcdir = os.path.realpath(config['srcdataPath'])
-        # determine fallback plugin type by trying to get the basename 
-        # of the first sub folder in srcdata dir. Ideally the plugin type
-        # should be supplied by commandline or gui
-        if plugin_type is None:
-            first_dir_path = get_first_dir_under_path(self.srcdir)
-            if first_dir_path is None:
-                raise CLIError("E: srcdata dir (given by srcdataPath) doesn't contain any sub folders to represent plugin types.")
-            else:
-                plugin_type = os.path.basename(first_dir_path)
-        self.plugin_type = plugin_type
-        self._token_table = {}
-        self._rules_list = []
-        self._rules_filename = DEFAULT_RULES_FILENAME
-        self._rules_filepath = None
-        self._fill_tokentable()
-        self._fill_ruleslist()
-
-    def _check_config(self, config):
-        if not 'pluginId' in config:
-            raise ValueError("E: plugin id not present in config object.")
-        if not 'srcdataPath' in config:
-            raise ValueError("E: source data path not present in config object.")
-        
-    def _check_destdir(self, somedir):
-        real_destdir = os.path.realpath(somedir)
-        if os.path.exists(real_destdir):
-            self.destdir = real_destdir
-        else:
-            raise CLIError("Invalid path for destination dir: '%s'" % real_destdir)
+    @staticmethod
+    def all_forms(word, forms=None):
+        '''
+        Transform ``word`` into several alternative forms at once.
         
-    def _find_rules_file(self):
-        ''' Find the rules file to use. 
+        Forms are derived following ``TextFX.form_graph`` so that 
+        intermediate results shared by multiple forms, e.g. the 
+        cleaned word, are only computed once per call.
         
-        Set ``self._rules_filepath`` to absolute path if found.        
-        Only accepts files with name equal to ``self._rules_filename``.
-                
-        Searches multiple locations with the following precedence:
+        >>> sorted(TextFX.all_forms('Make Awesome Button', ['ID', 'UppercaseIDSep', 'Initials']).items())
+        [('ID', u'MakeAwesomeButton'), ('Initials', 'MAB'), ('UppercaseIDSep', u'MAKE_AWESOME_BUTTON')]
         
-            1. path supplied by CLI arg
-            2. per plugin type (parent local)
-            3. per sourcedata rootdir (global)
-            
-        :raise: CLIError if a rules file couldn't be found.
-        :return: path to the rules file.
+        :param string word: the word to transform
+        :param list forms: names of the forms to compute. 
+            Defaults to all of ``BASE_NAME_FORMS``.
+        :return: dict of ``{form: transformed word}``
+        :raise: ValueError if one of ``forms`` is unknown.
         '''
-        if 'rulesFile' in self.config:
-            rules_file = self.config['rulesFile']
-        else:
-            rules_file = None
-        if rules_file is not None and os.path.exists(rules_file):
-            rules_filepath = self.config['rulesFile']
-        else:   
-            rules_filepath = None     
-            rules_filename = self._rules_filename
-            candidate_paths = [
-                os.path.realpath(os.path.join(self.config['srcdataPath'], self.plugin_type, rules_filename)),
-                os.path.realpath(os.path.join(self.config['srcdataPath'], rules_filename))
-            ]
-            for cpath in candidate_paths:
-                if os.path.exists(cpath):
-                    rules_filepath = cpath
-        if rules_filepath is None:
-            #if DEBUG: 
-            #    print("rules file not found. Paths searched: %s%s" % (os.linesep, os.linesep.join(candidate_paths)))
-            pass
-        else: 
-            rules_filepath_dir, rules_filepath_name = os.path.split(rules_filepath)  # IGNORE:W0612 @UnusedVariable
-            if rules_filepath_name != self._rules_filename:
-                raise CLIError("rules file name doesn't match name specified for rules files. " + 
-                               "Expected %r, got %r" % (self._rules_filename, rules_filepath_name))
-            rules_filepath = os.path.realpath(rules_filepath)
-        self._rules_filepath = rules_filepath
-        return rules_filepath
-         
-    def _fill_tokentable(self):
+        if forms is None:
+            forms = BASE_NAME_FORMS
+        return TextFX._derive_forms({'Entered': word}, forms)
+    
+    @staticmethod
+    def _derive_forms(values, forms):
         '''
-        Create and fill table of ``%!...!%`` magic tokens.
-        
-        Magic tokens are strings of text to replace where the 
-        replacement value can be inferred automatically (to a degree), 
-        with as little user input as possible.
-        
-        Examples are date, time and author name determined
-        from the logon environment.
+        Resolve ``forms`` via ``TextFX.form_graph``. ``values`` must 
+        contain the ``Entered`` form and may be seeded with other 
+        (intermediate) forms which then won't be computed again.
+        '''
+        graph = TextFX.form_graph
+        def resolve(form):
+            try:
+                return values[form]
+            except KeyError:
+                pass
+            try:
+                deps, func = graph[form]
+            except KeyError:
+                raise ValueError("E: unknown form %r" % form)
+            value = func(*[resolve(dep) for dep in deps])
+            values[form] = value
+            return value
+        return dict((form, resolve(form)) for form in forms)
+    
+    @staticmethod
+    def transform_many(words, forms=None):
+        u'''
+        Bulk version of :py:meth:`all_forms` for large lists of words, 
+        e.g. to validate or preview identifiers before bulk generation.
         
-        The table consists of a dict of metadata dicts, 
-        the latter of which can have multiple entries,
-        one for each form the datum point can be in. 
+        Duplicate words are only transformed once. Each form is derived 
+        for all distinct words in one go instead of resolving the form graph 
+        word by word, and without memoization, which can't pay off for 
+        distinct words and would only evict the entries of other callers. 
+        Results are identical to those of :py:meth:`all_forms`.
         
-        E.g. if the datum point is ``AuthorName``, it can have a 
-        form as identifier, as abbreviation, etc.
+        >>> [f['ID'] for f in TextFX.transform_many(['My Plugin', u'Déjà vu'], ['ID'])]
+        [u'MyPlugin', u'DejaVu']
         
-        :param string plugin_id: unique ID for the plugin
-        :param string plugin_name: name of the plugin as 
-            entered by the user
-        :param string author_name: name of the author as 
-            entered by the user
+        :param list words: the words to transform
+        :param list forms: names of the forms to compute. 
+            Defaults to all of ``BASE_NAME_FORMS``.
+        :return: list with one ``{form: transformed word}`` dict per word
+        :raise: ValueError if one of ``forms`` is unknown.
         '''
-        config = self.config
+        if forms is None:
+            forms = BASE_NAME_FORMS
+        unique = OrderedDict()
+        for word in words:
+            unique[(word, type(word))] = None
+        columns = {'Entered': [word for word, _ in unique]}
+        graph = TextFX.bulk_form_graph
+        def resolve(form):
+            try:
+                return columns[form]
+            except KeyError:
+                pass
+            try:
+                deps, func = graph[form]
+            except KeyError:
+                raise ValueError("E: unknown form %r" % form)
+            column = map(func, *[resolve(dep) for dep in deps])
+            columns[form] = column
+            return column
+        if len(forms) > 0:
+            rows = zip(*[resolve(form) for form in forms])
+        else:
+            rows = [()] * len(unique)
+        for key, row in zip(unique, rows):
+            unique[key] = row
+        return [dict(zip(forms, unique[(word, type(word))])) for word in words]
+    
+    clean_allowed_chars = r"_\-()'\+=!"
+    
+    @staticmethod
+    def _id_form(word, cleaned_sep, to_camelcase=None):
+        if '_' in word:
+            return cleaned_sep[0].upper() + cleaned_sep[1:]
+        if to_camelcase is None:
+            to_camelcase = TextFX.to_camelcase
+        return to_camelcase(cleaned_sep, capitalize=True)
+    
+    # How each form is derived: {form: (forms it depends on, function)}.
+    # Names starting with '~' are intermediates shared between forms.
+    # 'Entered' is the word itself and therefore has no entry.
+    form_graph = {
+        '~cleaned': (('Entered',), lambda word: TextFX.clean(word, safechar=' ')),
+        # clean(word, safechar='_') only differs in the safe char
+        '~cleaned_sep': (('~cleaned',), lambda cleaned: cleaned.replace(' ', '_')),
+        '~camelcase': (('~cleaned',), lambda cleaned: TextFX.to_camelcase(cleaned)),
+        'Cleaned': (('~cleaned',), lambda cleaned: cleaned),
+        'Uppercase': (('Entered',), lambda word: word.upper()),
+        'Lowercase': (('Entered',), lambda word: word.lower()),
+        'ID': (('Entered', '~cleaned_sep'), lambda word, cleaned_sep: TextFX._id_form(word, cleaned_sep)),
+        'UppercaseID': (('~camelcase',), lambda camelcase: camelcase.upper()),
+        'LowercaseID': (('~camelcase',), lambda camelcase: camelcase.lower()),
+        'UppercaseIDSep': (('~cleaned_sep',), lambda cleaned_sep: cleaned_sep.upper()),
+        'LowercaseIDSep': (('~cleaned_sep',), lambda cleaned_sep: cleaned_sep.lower()),
+        'Abbreviation': (('Entered',), lambda word: TextFX.abbreviate(word)),
+        # each abbreviation char stems from one regex match
+        'Initials': (('Abbreviation',), lambda abbreviation: abbreviation[:3])
+    }
+    form_names = dict((form.lower(), form) for form in BASE_NAME_FORMS)
+    
+    @lazy_classattr
+    def bulk_form_graph(cls):
+        # form_graph without the memoized functions, see transform_many()
+        clean = cls.clean.uncached
+        to_camelcase = cls.to_camelcase.uncached
+        abbreviate = cls.abbreviate.uncached
+        graph = dict(cls.form_graph)
+        graph.update({
+            '~cleaned': (('Entered',), lambda word: clean(word, safechar=' ')),
+            '~camelcase': (('~cleaned',), lambda cleaned: to_camelcase(cleaned)),
+            'ID': (('Entered', '~cleaned_sep'), 
+                   lambda word, cleaned_sep: cls._id_form(word, cleaned_sep, to_camelcase)),
+            'Abbreviation': (('Entered',), lambda word: abbreviate(word))
+        })
+        return graph
         
-        # Plugin ID
+
+class TokenTable(Mapping):
+    '''
+    Read-only mapping of datum points to dicts of their forms, 
+    e.g. ``table['PluginName']['UppercaseID']``.
+    
+    The forms of each datum point are only computed when it's looked 
+    up for the first time, by calling its builder. This way costly 
+    values, like the author name which may need to ask the OS, are 
+    never determined for templates that don't use them.
+    
+    :param builders: ordered mapping of datum point names to 
+        callables returning the dict of forms for that datum point.
+    '''
+    
+    # config keys the forms of each datum point are made from, 
+    # datum points not listed here only depend on the clock
+    config_keys = {
+        'ID': ('pluginId',),
+        'PluginName': ('pluginName',),
+        'AuthorName': ('author',),
+        'OrgName': ('org',)
+    }
+    
+    def __init__(self, builders):
+        super(TokenTable, self).__init__()
+        self._builders = builders
+        self._values = {}
+    
+    def __getitem__(self, datum):
+        try:
+            return self._values[datum]
+        except KeyError:
+            forms = self._builders[datum]()
+            self._values[datum] = forms
+            return forms
+    
+    def __iter__(self):
+        return iter(self._builders)
+    
+    def __len__(self):
+        return len(self._builders)
+    
+    def is_built(self, datum):
+        '''Tell if the forms of ``datum`` have been computed yet.'''
+        return datum in self._values
+    
+    @classmethod
+    def for_config(cls, config):
+        '''
+        Create the token table for a wizard ``config`` (see ``CONFIG_DEFAULT``). 
+        Only ``pluginId``, ``pluginName``, ``author`` and ``org`` are used.
+        '''
+        return cls(OrderedDict([
+            ('ID', functools.partial(cls._plugin_id_tokens, config)),
+            ('PluginName', functools.partial(cls._plugin_name_tokens, config)),
+            ('AuthorName', functools.partial(cls._author_name_tokens, config)),
+            ('OrgName', functools.partial(cls._org_name_tokens, config)),
+            ('DateTime', functools.partial(cls._datetime_tokens, config)),
+            ('Date', functools.partial(cls._date_tokens, config)),
+            ('Time', functools.partial(cls._time_tokens, config))
+        ]))
+    
+    @staticmethod
+    def _plugin_id_tokens(config):
         plugin_id = config['pluginId']
         if plugin_id is None or len(str(plugin_id)) == 0:
             plugin_id = PLUGIN_ID_TESTING
@@ -808,55 +1057,52 @@ class PluginWizard(object):
         pluginid_tokens = {}
         pluginid_tokens[''] = plugin_id
         pluginid_tokens['Entered'] = pluginid_tokens['']
-        self._token_table['ID'] = pluginid_tokens
-        
-        # Plugin Name
+        return pluginid_tokens
+    
+    @staticmethod
+    def _plugin_name_tokens(config):
         plugin_name = config['pluginName']
         if plugin_name is None or len(plugin_name) == 0:
             plugin_name = 'Unnamed Plugin'
         else:
             plugin_name = str(plugin_name)
-        pluginname_tokens = {}
-        pluginname_tokens['Entered'] = plugin_name
-        
-        for f in BASE_NAME_FORMS:
-            pluginname_tokens[f] = TextFX.transform(plugin_name, f)
-            
+        pluginname_tokens = TextFX.all_forms(plugin_name)
         pluginname_tokens[''] = pluginname_tokens['Entered']
-        self._token_table['PluginName'] = pluginname_tokens
-        
-        # Author Name
-        author_name = config['author']
-        authorname_tokens = {}
+        return pluginname_tokens
+    
+    @staticmethod
+    def _author_name_tokens(config):
+        # None means not given, so ask the environment
+        author_name = config.get('author')
+        if author_name is None:
+            author_name = get_author_name()
         if author_name is None or len(author_name) == 0:
             author_name = "Unnamed Author"
-            
-        for f in BASE_NAME_FORMS:
-            authorname_tokens[f] = TextFX.transform(author_name, f)
-            
+        authorname_tokens = TextFX.all_forms(author_name)
         authorname_tokens[''] = author_name
-        self._token_table['AuthorName'] = authorname_tokens
-            
-        # Organization Name
-        org_name = config['org']
-        orgname_tokens = {}
-        if org_name is None:
-            org_name = ''
+        return authorname_tokens
+    
+    @staticmethod
+    def _org_name_tokens(config):
+        org_name = config.get('org')
+        if org_name is None:
+            org_name = get_company_name()
+        orgname_tokens = {}
         if len(org_name) > 1:
-            for f in BASE_NAME_FORMS:
-                orgname_tokens[f] = TextFX.transform(org_name, f)
-            
+            orgname_tokens = TextFX.all_forms(org_name)
         orgname_tokens[''] = org_name
-        self._token_table['OrgName'] = orgname_tokens
-            
-        # Date+Time
+        return orgname_tokens
+    
+    @staticmethod
+    def _datetime_tokens(config):
         datetime_tokens = {}
         datetime_tokens[''] = time.strftime('%Y-%m-%dT%H:%M:%S')
         datetime_tokens['Iso'] = datetime_tokens['']
         datetime_tokens['Locale'] = time.strftime('%x %X')
-        self._token_table['DateTime'] = datetime_tokens
-        
-        # Date
+        return datetime_tokens
+    
+    @staticmethod
+    def _date_tokens(config):
         date_tokens = {}
         date_tokens['IsoSeparated'] = time.strftime('%Y-%m-%d')
         date_tokens['Iso'] = time.strftime('%Y%m%d')
@@ -868,9 +1114,10 @@ class PluginWizard(object):
         date_tokens['NameOfDay'] = time.strftime('%A')
         date_tokens['ShortNameOfDay'] = time.strftime('%a')
         date_tokens[''] = date_tokens['IsoSeparated']
-        self._token_table['Date'] = date_tokens
-        
-        # Time
+        return date_tokens
+    
+    @staticmethod
+    def _time_tokens(config):
         time_tokens = {}
         time_tokens[''] = TextFX.sanitize(time.strftime('%X'), safechar='', allowed_chars='')
         time_tokens['LocaleSeparated'] = time.strftime('%X')
@@ -878,7 +1125,839 @@ class PluginWizard(object):
         time_tokens['EnglishSeparated'] = time.strftime('%I:%M:%S %p')
         time_tokens['English'] = TextFX.sanitize(time_tokens['EnglishSeparated'], safechar='', allowed_chars='')
         time_tokens['SecondsSinceEpoch'] = str(time.time())
-        self._token_table['Time'] = time_tokens
+        return time_tokens
+    
+
+class NDJSONEventWriter(object):
+    '''
+    Event sink for :py:class:`PluginWizard` which writes each event 
+    as one line of JSON to ``stream`` (stdout by default). 
+    
+    Safe to share between the threads of 
+    :py:meth:`GenerationEngine.generate_many`.
+    '''
+    def __init__(self, stream=None):
+        super(NDJSONEventWriter, self).__init__()
+        self.stream = sys.stdout if stream is None else stream
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        line = json.dumps(event, sort_keys=True)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+
+class GenerationStats(object):
+    '''
+    Event sink for :py:class:`PluginWizard` which adds up wall and CPU 
+    time, files and bytes written per phase. Passes all events on to 
+    ``events``, if given.
+    
+    CPU time is that of the whole process, so with several runs at once 
+    (see :py:meth:`GenerationEngine.generate_many`) the CPU time of one 
+    phase includes the other threads.
+    '''
+    PHASES = ('rules', 'rmtree', 'copy', 'names', 'contents', 'generate')
+    
+    def __init__(self, events=None):
+        super(GenerationStats, self).__init__()
+        self.events = events
+        self.phases = {}
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        kind = event['event']
+        if kind == 'end' or kind == 'file' or (kind == 'skip' and event['reason'] == 'unchanged'):
+            phase = event['phase'] if kind == 'end' else 'contents'
+            with self._lock:
+                entry = self.phases.get(phase)
+                if entry is None:
+                    entry = self.phases[phase] = {'runs': 0, 'wall': 0.0, 'cpu': 0.0, 'files': 0, 'bytes': 0, 
+                                                  'skipped': 0}
+                if kind == 'end':
+                    entry['runs'] += 1
+                    entry['wall'] += event['elapsed']
+                    entry['cpu'] += event['cpu']
+                    entry['files'] += event.get('files', 0)
+                    entry['bytes'] += event.get('bytes', 0)
+                elif kind == 'file':
+                    entry['bytes'] += event['bytes']
+                else:
+                    entry['skipped'] += 1
+        if self.events is not None:
+            self.events(event)
+    
+    def summary(self):
+        '''
+        Return an ordered dict of ``{phase: {'runs', 'wall', 'cpu', 'files', 
+        'bytes', 'skipped', 'filesPerSec', 'mbPerSec'}}`` with times in seconds. 
+        ``skipped`` counts the files the template index said have nothing 
+        to replace.
+        
+        ``generate`` is the whole run: its files are those of the 
+        generated plugins and its bytes those written by ``contents``.
+        Throughput is None for phases without files or bytes.
+        '''
+        with self._lock:
+            phases = dict((phase, dict(entry)) for phase, entry in self.phases.items())
+        if 'generate' in phases:
+            phases['generate']['files'] = phases.get('names', {}).get('files', 0)
+            phases['generate']['bytes'] = phases.get('contents', {}).get('bytes', 0)
+        order = [p for p in self.PHASES if p in phases] + sorted(p for p in phases if p not in self.PHASES)
+        result = OrderedDict()
+        for phase in order:
+            entry = phases[phase]
+            wall = entry['wall']
+            entry['filesPerSec'] = entry['mbPerSec'] = None
+            if wall > 0:
+                if entry['files'] > 0:
+                    entry['filesPerSec'] = entry['files'] / wall
+                if entry['bytes'] > 0:
+                    entry['mbPerSec'] = entry['bytes'] / wall / (1024.0 * 1024.0)
+            result[phase] = entry
+        return result
+    
+    def format(self):
+        '''Return :py:meth:`summary` as a table.'''
+        lines = ["%-10s %10s %10s %7s %10s %9s %8s" % 
+                 ('phase', 'wall ms', 'cpu ms', 'files', 'bytes', 'files/s', 'MB/s')]
+        for phase, entry in self.summary().items():
+            throughput = ('-' if entry['filesPerSec'] is None else '%.1f' % entry['filesPerSec'],
+                          '-' if entry['mbPerSec'] is None else '%.2f' % entry['mbPerSec'])
+            lines.append("%-10s %10.2f %10.2f %7d %10d %9s %8s" % 
+                         ((phase, entry['wall'] * 1000.0, entry['cpu'] * 1000.0, entry['files'], entry['bytes']) + 
+                          throughput))
+        return os.linesep.join(lines)
+
+
+class MemoryTracer(object):
+    '''
+    Event sink for :py:class:`PluginWizard` which records the resident 
+    set size (RSS) of the process at the start and end of each phase 
+    and, as a stand-in for allocation sites, the number of new objects 
+    per type each phase leaves behind. Passes all events on to ``events``, 
+    if given.
+    
+    Objects are counted with :py:func:`gc.get_objects`, which only 
+    sees objects that can hold references to others (instances, lists, 
+    dicts etc.), not e.g. strings. Counting walks all of them, so this 
+    is only meant for diagnosing, not for every run.
+    
+    Call :py:meth:`start` before and :py:meth:`stop` after the runs. 
+    With several runs at once RSS and objects are those of the whole process.
+    '''
+    def __init__(self, events=None):
+        super(MemoryTracer, self).__init__()
+        self.events = events
+        self.phases = {}
+        self.types = {}     # phase -> {type name: new objects}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started = False
+    
+    def start(self):
+        self._started = True
+    
+    def stop(self):
+        self._started = False
+    
+    @staticmethod
+    def _count_types():
+        counts = {}
+        for obj in gc.get_objects():
+            name = type(obj).__name__
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+    
+    def __call__(self, event):
+        kind = event['event']
+        if self._started and (kind == 'start' or kind == 'end'):
+            stack = getattr(self._local, 'stack', None)
+            if stack is None:
+                stack = self._local.stack = []
+            if kind == 'start':
+                stack.append((current_rss(), self._count_types()))
+            elif len(stack) > 0:
+                rss_start, types_start = stack.pop()
+                rss_end = current_rss()
+                types_end = self._count_types()
+                with self._lock:
+                    entry = self.phases.get(event['phase'])
+                    if entry is None:
+                        entry = self.phases[event['phase']] = {'runs': 0, 'rssStart': None, 'rssEnd': None, 'rssGrowth': None}
+                    entry['runs'] += 1
+                    if rss_start is not None and rss_end is not None:
+                        entry['rssStart'] = rss_start if entry['rssStart'] is None else min(entry['rssStart'], rss_start)
+                        entry['rssEnd'] = rss_end if entry['rssEnd'] is None else max(entry['rssEnd'], rss_end)
+                        entry['rssGrowth'] = (entry['rssGrowth'] or 0) + rss_end - rss_start
+                    types = self.types.setdefault(event['phase'], {})
+                    for name, count in types_end.iteritems():
+                        new = count - types_start.get(name, 0)
+                        if new > 0:
+                            types[name] = types.get(name, 0) + new
+        if self.events is not None:
+            self.events(event)
+    
+    def summary(self):
+        '''
+        Return an ordered dict of ``{phase: {'runs', 'rssStart', 'rssEnd', 'rssGrowth'}}`` 
+        with the lowest RSS at the start, the highest at the end and the sum of 
+        the growth over all runs, in bytes, or None where the RSS isn't available.
+        '''
+        with self._lock:
+            phases = dict((phase, dict(entry)) for phase, entry in self.phases.items())
+        order = [p for p in GenerationStats.PHASES if p in phases] + sorted(p for p in phases if p not in GenerationStats.PHASES)
+        return OrderedDict((phase, phases[phase]) for phase in order)
+    
+    def top_types(self, top=TRACE_MEMORY_TOP):
+        '''
+        Return the ``top`` object types with the most new objects left 
+        behind by a phase as a list of ``(phase, type name, objects)``.
+        Phases include the ones they enclose, e.g. ``generate`` includes ``copy``.
+        '''
+        with self._lock:
+            types = [(phase, name, count) for phase, counts in self.types.items() 
+                     for name, count in counts.items()]
+        return sorted(types, key=lambda t: (-t[2], t[0], t[1]))[:top]
+    
+    def format(self, types=None):
+        '''Return :py:meth:`summary` and ``types`` (see :py:meth:`top_types`) as text.'''
+        def mb(value):
+            return '-' if value is None else '%.2f' % (value / (1024.0 * 1024.0))
+        lines = ["%-10s %5s %14s %12s %10s" % ('phase', 'runs', 'RSS start MB', 'RSS end MB', 'growth MB')]
+        for phase, entry in self.summary().items():
+            lines.append("%-10s %5d %14s %12s %10s" % (phase, entry['runs'], mb(entry['rssStart']), 
+                                                      mb(entry['rssEnd']), mb(entry['rssGrowth'])))
+        if types:
+            lines.append("")
+            lines.append("Top %d object types by new objects per phase:" % len(types))
+            for phase, name, count in types:
+                lines.append("%-10s %+10d  %s" % (phase, count, name))
+        return os.linesep.join(lines)
+
+
+class FileSystemCounter(object):
+    '''
+    Event sink for :py:class:`PluginWizard` which counts filesystem 
+    operations and their cumulative latency per operation and phase.
+    Passes all events on to ``events``, if given.
+    
+    While started, the functions listed in ``OPERATIONS`` are replaced 
+    by counting wrappers, so every call made in the process is counted, 
+    including the ones made by other functions. E.g. one ``shutil.copytree`` 
+    is counted along with each ``os.listdir``, ``open`` etc. it does.
+    ``SYSCALLS`` are the operations which each are one round-trip to 
+    the filesystem. Calls are attributed to the innermost phase of the 
+    calling thread, or to ``'other'`` outside of a phase.
+    '''
+    OPERATIONS = (
+        ('os', os, ('walk', 'listdir', 'stat', 'lstat', 'rename', 'remove', 'unlink', 
+                    'mkdir', 'makedirs', 'rmdir', 'chmod', 'utime')),
+        ('os.path', os.path, ('exists', 'isdir', 'isfile', 'islink', 'realpath', 'getsize')),
+        ('shutil', su, ('copytree', 'rmtree', 'copyfile', 'copy2', 'copystat', 'copymode')),
+        ('', builtins, ('open',)),
+    )
+    SYSCALLS = frozenset(['os.listdir', 'os.stat', 'os.lstat', 'os.rename', 'os.remove', 'os.unlink', 
+                          'os.mkdir', 'os.rmdir', 'os.chmod', 'os.utime', 'open'])
+    
+    def __init__(self, events=None):
+        super(FileSystemCounter, self).__init__()
+        self.events = events
+        self.counts = {}
+        self._originals = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _current_phase(self):
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else 'other'
+    
+    def _add(self, phase, name, elapsed):
+        with self._lock:
+            entry = self.counts.get((phase, name))
+            if entry is None:
+                self.counts[(phase, name)] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+    
+    def _wrap(self, name, func):
+        counter = self
+        if name == 'os.walk':
+            # a generator, the time is spent while iterating
+            def wrapper(*args, **kwargs):
+                phase = counter._current_phase()
+                elapsed = 0.0
+                try:
+                    start = time.time()
+                    walker = func(*args, **kwargs)
+                    while True:
+                        try:
+                            item = next(walker)
+                        except StopIteration:
+                            break
+                        finally:
+                            elapsed += time.time() - start
+                        yield item
+                        start = time.time()
+                finally:
+                    counter._add(phase, name, elapsed)
+        else:
+            def wrapper(*args, **kwargs):
+                phase = counter._current_phase()
+                start = time.time()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    counter._add(phase, name, time.time() - start)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    
+    def start(self):
+        '''Replace the filesystem functions by counting wrappers.'''
+        if len(self._originals) > 0:
+            return
+        for prefix, module, names in self.OPERATIONS:
+            for name in names:
+                func = getattr(module, name, None)
+                if func is None:
+                    continue
+                self._originals.append((module, name, func))
+                setattr(module, name, self._wrap('%s.%s' % (prefix, name) if prefix else name, func))
+    
+    def stop(self):
+        '''Put the original filesystem functions back.'''
+        for module, name, func in reversed(self._originals):
+            setattr(module, name, func)
+        self._originals = []
+    
+    def __call__(self, event):
+        kind = event['event']
+        if kind == 'start' or kind == 'end':
+            stack = getattr(self._local, 'stack', None)
+            if stack is None:
+                stack = self._local.stack = []
+            if kind == 'start':
+                stack.append(event['phase'])
+            elif len(stack) > 0:
+                stack.pop()
+        if self.events is not None:
+            self.events(event)
+    
+    def summary(self):
+        '''
+        Return an ordered dict of ``{phase: {'syscalls': count, 'time': seconds in syscalls, 
+        'operations': {operation: {'count', 'time'}}}}``.
+        '''
+        with self._lock:
+            counts = dict((key, tuple(value)) for key, value in self.counts.items())
+        phases = set(phase for phase, _ in counts)
+        order = ([p for p in GenerationStats.PHASES if p in phases] + 
+                 sorted(p for p in phases if p not in GenerationStats.PHASES and p != 'other') + 
+                 [p for p in ('other',) if p in phases])
+        result = OrderedDict()
+        for phase in order:
+            operations = OrderedDict()
+            syscalls = 0
+            elapsed = 0.0
+            for (p, name), (count, time_spent) in sorted(counts.items()):
+                if p != phase:
+                    continue
+                operations[name] = {'count': count, 'time': time_spent}
+                if name in self.SYSCALLS:
+                    syscalls += count
+                    elapsed += time_spent
+            result[phase] = {'syscalls': syscalls, 'time': elapsed, 'operations': operations}
+        return result
+    
+    def format(self):
+        '''Return :py:meth:`summary` as a table.'''
+        lines = ["%-10s %-18s %7s %10s %9s" % ('phase', 'operation', 'count', 'total ms', 'avg us')]
+        syscalls = 0
+        for phase, entry in self.summary().items():
+            for name, op in entry['operations'].items():
+                lines.append("%-10s %-18s %7d %10.2f %9.1f" % 
+                             (phase, name, op['count'], op['time'] * 1000.0, op['time'] * 1e6 / op['count']))
+            lines.append("%-10s %-18s %7d %10.2f" % (phase, '(syscalls)', entry['syscalls'], entry['time'] * 1000.0))
+            syscalls += entry['syscalls']
+        lines.append("")
+        lines.append("%d filesystem round-trips in total." % syscalls)
+        return os.linesep.join(lines)
+
+
+class SamplingProfiler(object):
+    '''
+    Low overhead profiler for long runs, e.g. of 
+    :py:meth:`GenerationEngine.generate_many`.
+    
+    A background thread records the stacks of the other threads 
+    ``rate`` times per second and writes the number of samples per 
+    stack to ``path`` in the collapsed stack format (see 
+    :py:func:`write_collapsed_stacks`) every ``flush_interval`` seconds 
+    and when stopped. Unlike cProfile it doesn't slow down each call, 
+    the cost is a stack walk per sample.
+    
+    Example::
+    
+        with SamplingProfiler('batch.collapsed.txt'):
+            engine.generate_many(configs, 'plugins')
+    
+    :param threads: idents of the threads to sample, default all.
+    :raise: ValueError if ``rate`` or ``flush_interval`` isn't positive.
+    '''
+    def __init__(self, path, rate=SAMPLING_RATE, flush_interval=SAMPLING_FLUSH_INTERVAL, threads=None):
+        super(SamplingProfiler, self).__init__()
+        if rate <= 0:
+            raise ValueError("sampling rate must be positive, got %r" % rate)
+        if flush_interval <= 0:
+            raise ValueError("flush interval must be positive, got %r" % flush_interval)
+        self.path = path
+        self.rate = rate
+        self.flush_interval = flush_interval
+        self.threads = threads
+        self.samples = 0
+        self.stacks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='SamplingProfiler')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        '''Stop sampling and write the stacks.'''
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+    
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_flush = time.time() + self.flush_interval
+        while not self._stop.wait(interval):
+            self.sample()
+            if time.time() >= next_flush:
+                self.flush()
+                next_flush = time.time() + self.flush_interval
+    
+    def sample(self):
+        '''Record the current stack of each sampled thread.'''
+        own = threading.current_thread().ident
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (self.threads is not None and ident not in self.threads):
+                continue
+            frames = []
+            while frame is not None and len(frames) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                frames.append(format_frame(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            frames.reverse()
+            stacks.append(tuple(frames))
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+    
+    def flush(self):
+        '''Write the stacks sampled so far.'''
+        with self._lock:
+            stacks = dict(self.stacks)
+        write_collapsed_stacks(stacks, self.path)
+
+
+class RunHistory(object):
+    '''
+    Local log of generation runs. Each run adds one line of JSON to 
+    ``history.ndjson`` in the cache dir (see :py:func:`get_cache_path`), 
+    which is moved to ``history.ndjson.old`` once larger than 
+    ``HISTORY_MAX_BYTES``. Summarized by ``c4dplugwiz stats``, see 
+    :py:func:`summarize_history`.
+    
+    A record has the keys ``time``, ``type`` (plugin type), ``source`` 
+    (source data path), ``files``, ``bytes``, ``wall`` and ``cpu`` (seconds), 
+    ``phases`` (wall seconds per phase) and ``cache`` with the hit rates 
+    of the template index (files skipped) and the TextFX caches, each 
+    None if not used.
+    '''
+    NUMBERS = ('time', 'files', 'bytes', 'wall')    # keys every record needs
+    
+    def __init__(self, path=None):
+        super(RunHistory, self).__init__()
+        if path is None:
+            path = os.path.join(get_cache_path(), DEFAULT_HISTORY_FILENAME)
+        self.path = path
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_record(wizard, stats, textfx=None):
+        '''
+        Make the record of a run of ``wizard`` from its :py:class:`GenerationStats`.
+        
+        :param dict textfx: :py:meth:`TextFX.cache_info` from before the run. 
+            The caches are shared by all threads, so with runs in parallel 
+            the hit rate is that of all of them.
+        '''
+        summary = stats.summary()
+        total = summary.get('generate', {})
+        contents = summary.get('contents', {})
+        def rate(hits, misses):
+            return None if hits + misses == 0 else round(hits / float(hits + misses), 4)
+        cache = {'index': None, 'textfx': None}
+        if wizard.index is not None and 'contents' in summary:
+            cache['index'] = rate(contents['skipped'], contents['files'])
+        if textfx is not None:
+            after = TextFX.cache_info()
+            hits = sum(info['hits'] - textfx.get(name, {}).get('hits', 0) for name, info in after.items())
+            misses = sum(info['misses'] - textfx.get(name, {}).get('misses', 0) for name, info in after.items())
+            cache['textfx'] = rate(hits, misses)
+        return {
+            'time': round(time.time(), 3),
+            'type': wizard.plugin_type,
+            'source': wizard.srcdir,
+            'files': total.get('files', 0),
+            'bytes': total.get('bytes', 0),
+            'wall': round(total.get('wall', 0.0), 6),
+            'cpu': round(total.get('cpu', 0.0), 6),
+            'phases': dict((phase, round(entry['wall'], 6)) for phase, entry in summary.items() 
+                           if phase != 'generate'),
+            'cache': cache
+        }
+    
+    def append(self, record):
+        '''Add ``record`` to the history. Errors are ignored, the history is only informational.'''
+        line = json.dumps(record, sort_keys=True, separators=(',', ':'))
+        with self._lock:
+            try:
+                dirpath = os.path.dirname(self.path)
+                if dirpath and not os.path.isdir(dirpath):
+                    os.makedirs(dirpath)
+                if os.path.exists(self.path) and os.path.getsize(self.path) > HISTORY_MAX_BYTES:
+                    old_path = self.path + '.old'
+                    if os.path.exists(old_path):
+                        os.remove(old_path)
+                    os.rename(self.path, old_path)
+                with open(self.path, 'ab') as f:
+                    f.write(line + '\n')
+            except (IOError, OSError):
+                pass
+    
+    def record(self, wizard, stats, textfx=None):
+        '''Add the record of a finished run, see :py:meth:`make_record`.'''
+        self.append(self.make_record(wizard, stats, textfx))
+    
+    @classmethod
+    def is_valid(cls, record):
+        '''Tell if ``record`` has everything :py:func:`summarize_history` needs.'''
+        if not isinstance(record, dict):
+            return False
+        for key in cls.NUMBERS:
+            if not isinstance(record.get(key), (int, long, float)) or isinstance(record[key], bool):
+                return False
+        return (isinstance(record.get('phases', {}), dict) and 
+                isinstance(record.get('cache', {}), dict))
+    
+    def records(self):
+        '''
+        Yield the records, oldest first. Unreadable lines and records 
+        missing keys (see :py:meth:`is_valid`) are skipped.
+        '''
+        for path in (self.path + '.old', self.path):
+            try:
+                with open(path, 'rb') as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # e.g. a line cut short by a crash
+                            continue
+                        if self.is_valid(record):
+                            yield record
+            except (IOError, OSError):
+                continue
+
+
+class CancellationToken(object):
+    '''
+    Lets another thread cancel a generation run, or bounds it by a deadline.
+    
+    :py:class:`PluginWizard` checks the token between files and every 
+    ``CANCEL_CHECK_LINES`` lines of a file and raises 
+    :py:class:`GenerationCancelled` once it is cancelled.
+    
+    :param float timeout: seconds from now until the deadline.
+    :param float deadline: deadline in seconds since the epoch.
+        The earlier of both is used.
+    '''
+    def __init__(self, timeout=None, deadline=None):
+        super(CancellationToken, self).__init__()
+        if timeout is not None:
+            until = time.time() + timeout
+            deadline = until if deadline is None else min(deadline, until)
+        self.deadline = deadline
+        self._cancelled = False
+    
+    def cancel(self):
+        self._cancelled = True
+    
+    @property
+    def cancelled(self):
+        return self._cancelled or (self.deadline is not None and time.time() >= self.deadline)
+    
+    def check(self):
+        ''':raise: GenerationCancelled if cancelled or past the deadline.'''
+        if self._cancelled:
+            raise GenerationCancelled("E: generation cancelled.")
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise GenerationCancelled("E: deadline exceeded.")
+
+
+class PluginWizard(object):
+    '''
+    CINEMA 4D plugin template wizard.
+    
+    Main class which provides methods for replacements in 
+    the names and contents of files contained within a folder 
+    structure.
+    '''
+    tokenchar_start   = g_mts
+    tokenchar_end     = g_mte
+    token_regex       = re.compile(r'%s(?P<token>\w+?)%s' % (tokenchar_start, tokenchar_end))
+    token_xform_regex = re.compile(r'%s(?P<token>\w+?)As(?P<form>\w+?)%s' % (tokenchar_start, tokenchar_end))  
+    
+    # alternative forms 'registry' 
+    # this is purely for info print outs at the command line
+    # it won't be used by _fill_tokentable
+    token_forms = {
+        'ID': [
+            'Entered',
+        ],
+        'PluginName': BASE_NAME_FORMS,
+        'AuthorName': BASE_NAME_FORMS,
+        'OrgName': BASE_NAME_FORMS,
+        'DateTime': [
+            'Iso',
+            'Locale'
+        ],
+        'Date': [
+            'IsoSeparated',
+            'Iso',
+            'EnglishDashSeparated',
+            'EnglishSeparated',
+            'English',
+            'LocaleSeparated',
+            'Locale',
+            'NameOfDay',
+            'ShortNameOfDay'
+        ],
+        'Time': [
+            'EnglishSeparated',
+            'English',
+            'LocaleSeparated',
+            'Locale',
+            'SecondsSinceEpoch'
+        ]
+    }
+
+    def __init__(self, config, plugin_type=PLUGIN_TYPE_DEFAULT, index=None, progress=None, rules=None, 
+                 events=None, template=None):
+        '''
+        :param dict config: see ``CONFIG_DEFAULT``
+        :param string plugin_type: name of the template folder structure to use.
+            If None, the first one found in the source data dir is used.
+        :param index: optional :py:class:`TemplateIndex` of the source data dir, 
+            used to skip files without anything to replace.
+        :param progress: optional callable ``progress(phase, done, total, path)``
+            called for each step of :py:meth:`generate`. ``phase`` is one of 
+            ``'copy'``, ``'names'`` or ``'contents'``. ``total`` is None where 
+            the number of steps isn't known up front. Exceptions raised by 
+            it abort the run.
+        :param tuple rules: optional ``(rules filepath, code object)`` as found
+            and compiled by another wizard for the same config and plugin type,
+            to skip finding and compiling the rules file again. The code is 
+            still executed anew so rules computed from e.g. the current date 
+            stay current.
+        :param events: optional event sink, a callable taking one dict 
+            per event. Each event has the keys ``event``, ``time`` (seconds 
+            since the epoch) and ``pluginId`` plus, depending on ``event``:
+            
+            ``start``, ``end``
+                ``phase`` (``'rules'``, ``'generate'``, ``'rmtree'``, ``'copy'``, 
+                ``'names'`` or ``'contents'``) and ``path``. ``end`` also has 
+                ``elapsed`` wall and ``cpu`` process time in seconds, ``files`` 
+                for ``'copy'``, ``'names'`` and ``'contents'`` and ``bytes`` 
+                for ``'copy'``. It is sent when a phase fails, too.
+            ``file``
+                ``path``, ``bytes`` written and ``elapsed`` for each file 
+                whose contents were processed.
+            ``rename``
+                ``path`` and ``newpath``.
+            ``skip``
+                ``path`` and ``reason``: ``'excluded'``, ``'exists'`` 
+                (rename target exists) or ``'unchanged'`` (nothing to 
+                replace according to the index).
+            ``error``
+                ``phase``, ``path`` and ``message``.
+            
+            Without a sink no events are created at all. See 
+            :py:class:`NDJSONEventWriter`.
+        :param template: optional :py:class:`TemplateSnapshot` of ``plugin_type`` 
+            to copy and process the files from, instead of reading the 
+            template and the copied files again. Takes precedence over ``index``.
+        '''
+        super(PluginWizard, self).__init__()
+        self.progress = progress
+        self.events = events
+        self._check_config(config)
+        self.config = config
+        if not 'excludedFiles' in config:
+            config['excludedFiles'] = DEFAULT_EXCLUDES
+        self.destdir = None
+        self.srcdir = os.path.realpath(config['srcdataPath'])
+        self.index = index
+        self.template = template
+        self._renamed = {}      # path -> path before process_names
+        self._inert = None      # template relpaths with nothing to replace
+        # determine fallback plugin type by trying to get the basename 
+        # of the first sub folder in srcdata dir. Ideally the plugin type
+        # should be supplied by commandline or gui
+        if plugin_type is None and index is not None and len(index.plugin_types) > 0:
+            plugin_type = index.plugin_types[0]
+        if plugin_type is None:
+            plugin_types = list_plugin_types(self.srcdir)
+            if len(plugin_types) == 0:
+                raise CLIError("E: srcdata dir (given by srcdataPath) doesn't contain any sub folders or manifests to represent plugin types.")
+            else:
+                plugin_type = plugin_types[0]
+        self.plugin_type = plugin_type
+        self._token_table = None
+        self._rules_list = []
+        self._rules_keys = ()
+        self._rules_filename = DEFAULT_RULES_FILENAME
+        self._rules_filepath = None
+        self._rules_code = None
+        # lazy, the tokens are computed while rendering names and contents
+        self._fill_tokentable()
+        if rules is not None:
+            self._rules_filepath, self._rules_code = rules
+        with self._phase('rules'):
+            self._fill_ruleslist()
+
+    def _emit(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = time.time()
+        fields['pluginId'] = self.config.get('pluginId')
+        self.events(fields)
+    
+    @contextmanager
+    def _phase(self, phase, path=None):
+        '''
+        Send ``start`` and ``end`` events for the enclosed phase. 
+        Counts put in the yielded dict are sent with the ``end`` event.
+        '''
+        if self.events is None:
+            yield {}
+            return
+        self._emit('start', phase=phase, path=path)
+        counts = {}
+        start = time.time()
+        cpu_start = cpu_time()
+        try:
+            yield counts
+        finally:
+            self._emit('end', phase=phase, path=path, elapsed=time.time() - start, 
+                       cpu=cpu_time() - cpu_start, **counts)
+
+    def _check_config(self, config):
+        if not 'pluginId' in config:
+            raise ValueError("E: plugin id not present in config object.")
+        if not 'srcdataPath' in config:
+            raise ValueError("E: source data path not present in config object.")
+        
+    def _check_destdir(self, somedir):
+        real_destdir = os.path.realpath(somedir)
+        if os.path.exists(real_destdir):
+            self.destdir = real_destdir
+        else:
+            raise CLIError("Invalid path for destination dir: '%s'" % real_destdir)
+        
+    def _find_rules_file(self):
+        ''' Find the rules file to use. 
+        
+        Set ``self._rules_filepath`` to absolute path if found.        
+        Only accepts files with name equal to ``self._rules_filename``.
+                
+        Searches multiple locations with the following precedence:
+        
+            1. path supplied by CLI arg
+            2. per plugin type (parent local)
+            3. per sourcedata rootdir (global)
+            
+        :raise: CLIError if a rules file couldn't be found.
+        :return: path to the rules file.
+        '''
+        if 'rulesFile' in self.config:
+            rules_file = self.config['rulesFile']
+        else:
+            rules_file = None
+        if rules_file is not None and os.path.exists(rules_file):
+            rules_filepath = self.config['rulesFile']
+        else:   
+            rules_filepath = find_rules_file(self.config['srcdataPath'], self.plugin_type, self._rules_filename)
+        if rules_filepath is None:
+            #if DEBUG: 
+            #    print("rules file not found. Paths searched: %s%s" % (os.linesep, os.linesep.join(candidate_paths)))
+            pass
+        else: 
+            rules_filepath_dir, rules_filepath_name = os.path.split(rules_filepath)  # IGNORE:W0612 @UnusedVariable
+            # rules files from the blob store are named after their hash
+            is_blob = rules_filepath_dir.startswith(os.path.realpath(os.path.join(self.srcdir, DEFAULT_BLOBDIR)))
+            if rules_filepath_name != self._rules_filename and not is_blob:
+                raise CLIError("rules file name doesn't match name specified for rules files. " + 
+                               "Expected %r, got %r" % (self._rules_filename, rules_filepath_name))
+            rules_filepath = os.path.realpath(rules_filepath)
+        self._rules_filepath = rules_filepath
+        return rules_filepath
+         
+    def _fill_tokentable(self):
+        '''
+        Create the table of ``%!...!%`` magic tokens.
+        
+        Magic tokens are strings of text to replace where the 
+        replacement value can be inferred automatically (to a degree), 
+        with as little user input as possible.
+        
+        Examples are date, time and author name determined
+        from the logon environment.
+        
+        The table is a :py:class:`TokenTable` of metadata dicts, 
+        the latter of which can have multiple entries,
+        one for each form the datum point can be in. 
+        
+        E.g. if the datum point is ``AuthorName``, it can have a 
+        form as identifier, as abbreviation, etc.
+        
+        Each datum point is only filled in once a token 
+        for it is encountered.
+        '''
+        self._token_table = TokenTable.for_config(self.config)
+        return self._token_table
     
     def _fill_ruleslist(self):
         r'''
@@ -892,30 +1971,31 @@ class PluginWizard(object):
         '''
         if self._rules_filepath is None:
             self._find_rules_file()
-        RULES = {}  # needs to be uppercase so it is shadowed from exec below
         ruleslist = []
         if self._rules_filepath is not None:
             rules_filepath = self._rules_filepath
             try:
-                rules_filedir, rules_filename = os.path.split(rules_filepath)   # IGNORE:W0612 @UnusedVariable
-                with open(rules_filepath, 'rb') as f:
-                    src = f.read()
-                # if the following succeeds RULES is aliased by the
-                # contents of RULES in rules file at self._rules_filepath 
-                exec(compile(src, rules_filename, 'exec'))  # IGNORE:W0122
+                if self._rules_code is None:
+                    self._rules_code = compile_rules(rules_filepath)
+                rules = load_rules(rules_filepath, self._rules_code)
             except Exception as e:
-                CLIError("E: while processing %s: %s" % (rules_filename, e))
+                CLIError("E: while processing %s: %s" % (os.path.basename(rules_filepath), e))
                 return None
-            for search, replace in RULES.iteritems():
+            for search, replace in rules.iteritems():
                 search = re.escape(search)
                 ruleslist.append((search, replace))
+            # unescaped, as the index and TemplateSnapshot look for them
+            self._rules_keys = tuple(sorted(key if isinstance(key, unicode) else key.decode('utf-8', 'replace') 
+                                            for key in rules.iterkeys()))
         self._rules_list = ruleslist
         return ruleslist
     
-    def _process_name(self, dirpath, fileordirname, force):
-        filepath = os.path.join(dirpath, fileordirname)
+    def render_name(self, fileordirname):
+        '''
+        Return ``fileordirname`` with rules and magic tokens replaced, 
+        or None if there is nothing to replace.
+        '''
         filename, fileext = os.path.splitext(fileordirname)
-        newpath = None
         newname = None
         
         # process rules (if we have a rules file)
@@ -928,7 +2008,6 @@ class PluginWizard(object):
                     replaced = True
             if replaced:
                 newname = filename + fileext
-                newpath = os.path.join(dirpath, newname)
                 replaced = False
         
         # process tokens
@@ -945,8 +2024,40 @@ class PluginWizard(object):
                 else:
                     token = mat
                     form = ''
-                newname = re.sub(re.escape(fulltoken), self._token_table[token][form], newname)
-                
+                newname = re.sub(re.escape(fulltoken), self._token_table[token][form], newname)
+        return newname
+    
+    def render_line(self, line):
+        '''Return ``line`` with rules and magic tokens replaced.'''
+        replaceline = line
+        matches = re.findall(PluginWizard.token_regex, line)
+        if len(matches) > 0:
+            for mat in matches:
+                if 'As' in mat:
+                    _mat = mat.split('As')
+                    token = _mat[0]
+                    form = _mat[1]
+                else:
+                    token = mat
+                    form = ''
+                try:
+                    replace = self._token_table[token][form]
+                    search = "%s%s%s" % (self.tokenchar_start, mat, self.tokenchar_end)
+                    replaceline = re.sub(search, replace, replaceline, flags=re.UNICODE)
+                except KeyError:
+                    # can't use "print" here, since it would end up in the written replaceline
+                    pass
+        if  len(self._rules_list) > 0:
+            for search, replace in self._rules_list:
+                if re.search(search, line):
+                    replaceline = re.sub(search, replace, replaceline, flags=re.UNICODE)
+        return replaceline
+    
+    def _process_name(self, dirpath, fileordirname, force):
+        filepath = os.path.join(dirpath, fileordirname)
+        newpath = None
+        newname = self.render_name(fileordirname)
+        if newname is not None:
             newpath = os.path.join(dirpath, newname)
             
         # do the actual renaming (if needed)
@@ -957,6 +2068,8 @@ class PluginWizard(object):
                 else:
                     if g_verbose > 0:
                         print("E: File at '%s' exists. Skipping...\nUse -f/--force to overwrite." % newpath)
+                    if self.events is not None:
+                        self._emit('skip', path=filepath, reason='exists')
                     return False
             if g_verbose > 0:
                 print("  Renaming '%s' to '%s'" % (fileordirname, newname))
@@ -965,62 +2078,102 @@ class PluginWizard(object):
                 os.rename(filepath, newpath)
             except Exception as e:
                 print("Renaming '%s' to '%s' failed: %s" % (filepath, newpath, e))
+                if self.events is not None:
+                    self._emit('error', phase='names', path=filepath, message=str(e))
+            else:
+                self._renamed[newpath] = filepath
+                if self.events is not None:
+                    self._emit('rename', path=filepath, newpath=newpath)
         
         return True
+    
+    def _source_relpath(self, filepath):
+        '''Return the path of the template file ``filepath`` in :py:attr:`destdir` was made from.'''
+        parts = []
+        path = filepath
+        while path != self.destdir and len(path) > len(self.destdir):
+            parts.append(os.path.basename(self._renamed.get(path, path)))
+            path = os.path.dirname(path)
+        relpath = os.path.join(*reversed(parts)) if len(parts) > 0 else ''
+        if isinstance(relpath, str):
+            # same as the index' paths
+            relpath = relpath.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+        return relpath
+    
+    def _inert_files(self):
+        '''Return the relpaths of template files the template snapshot or index says have nothing to replace.'''
+        if self.template is not None:
+            return self.template.inert_files(self._rules_keys)
+        if self.index is None:
+            return set()
+        return self.index.inert_files(self.plugin_type, self._rules_filepath)
         
-    def _process_content(self, dirpath, filename):
+    def _process_content(self, dirpath, filename, cancel=None):
         filepath = os.path.join(dirpath, filename)
         if filename in self.config['excludedFiles']:
+            if self.events is not None:
+                self._emit('skip', path=filepath, reason='excluded')
             return False
         if os.path.exists(filepath):
             if g_verbose > 0:
                 print("Processing '%s'" %  (format_relpath(filepath)))
-
-            # Backup
-            
-            # rename this file to filename.bak
-            backup_filename = '%s%s%s' % (filename, os.extsep, "bak")
-            backup_filepath = os.path.join(dirpath, backup_filename)
-            try: 
-                # remove filename.bak from last run if it is present
-                os.remove(backup_filepath)
-            except OSError: 
-                pass
-            os.rename(filepath, backup_filepath)
-            
+            if self.events is not None:
+                start = time.time()
+            content = None
+            if self.template is not None:
+                content = self.template.render(self._source_relpath(filepath), self.render_line, 
+                                               self._rules_keys, cancel)
+            if content is not None:
+                # rendered in memory, so the copy can simply be overwritten
+                with open(filepath, 'wb') as f:
+                    f.write(content)
+                size = len(content)
+            else:
+                size = self._rewrite_file(dirpath, filename, cancel)
+            if self.events is not None:
+                self._emit('file', path=filepath, bytes=size, elapsed=time.time() - start)
+        return True
+    
+    def _rewrite_file(self, dirpath, filename, cancel):
+        '''Process the file ``filename`` in ``dirpath`` line by line and return the number of bytes written.'''
+        filepath = os.path.join(dirpath, filename)
+        
+        # Backup
+        
+        # rename this file to filename.bak
+        backup_filename = '%s%s%s' % (filename, os.extsep, "bak")
+        backup_filepath = os.path.join(dirpath, backup_filename)
+        try: 
+            # remove filename.bak from last run if it is present
+            os.remove(backup_filepath)
+        except OSError: 
+            pass
+        os.rename(filepath, backup_filepath)
+        
+        try:
             with codecs.open(filepath, mode='w', encoding='utf-8') as processed_file:
                 # then open a new file with this file's old name (w/o ".bak")
                 # where we can write the processed lines to
                 with codecs.open(backup_filepath, mode='r', encoding='utf-8') as curfile:
+                    lines = 0
                     for line in curfile:
-                        replaceline = line
-                        matches = re.findall(PluginWizard.token_regex, line)
-                        if len(matches) > 0:
-                            for mat in matches:
-                                if 'As' in mat:
-                                    _mat = mat.split('As')
-                                    token = _mat[0]
-                                    form = _mat[1]
-                                else:
-                                    token = mat
-                                    form = ''
-                                try:
-                                    replace = self._token_table[token][form]
-                                    search = "%s%s%s" % (self.tokenchar_start, mat, self.tokenchar_end)
-                                    replaceline = re.sub(search, replace, replaceline, flags=re.UNICODE)
-                                except KeyError:
-                                    # can't use "print" here, since it would end up in the written replaceline
-                                    pass
-                        if  len(self._rules_list) > 0:
-                            for search, replace in self._rules_list:
-                                if re.search(search, line):
-                                    replaceline = re.sub(search, replace, replaceline, flags=re.UNICODE)
-                        processed_file.write(replaceline)
-            # done with the backup file, remove it
-            os.remove(backup_filepath)
-        return True
+                        processed_file.write(self.render_line(line))
+                        if cancel is not None:
+                            lines += 1
+                            if lines % CANCEL_CHECK_LINES == 0:
+                                cancel.check()
+                # bytes written so far, saves a stat of the file
+                size = processed_file.tell()
+        except GenerationCancelled:
+            # put the unprocessed file back
+            os.remove(filepath)
+            os.rename(backup_filepath, filepath)
+            raise
+        # done with the backup file, remove it
+        os.remove(backup_filepath)
+        return size
 
-    def process_names(self, overwrite=False):
+    def process_names(self, overwrite=False, cancel=None):
         '''
         Do magic token and rule based replacements in file and rootdir names.
         
@@ -1040,6 +2193,9 @@ class PluginWizard(object):
         
         :param bool overwrite: if True, rename a file or rootdir even 
             if it would replace an already existing file or rootdir.
+        :param cancel: optional :py:class:`CancellationToken`, checked 
+            before each file. Files renamed so far stay renamed.
+        :raise: GenerationCancelled
         '''
         if self.destdir is None:
             raise ValueError("E: dest dir can't be None. Did you forget to call set_destdir()?")
@@ -1048,22 +2204,31 @@ class PluginWizard(object):
             if self._rules_filepath is not None:
                 rules_filename = os.path.basename(self._rules_filepath)
                 dest_rules_file = os.path.join(self.destdir, rules_filename)
-            try:
-                # remove copied rules file if there was one in the 
-                # source data dir for our plugin type
-                os.remove(dest_rules_file)
-            except OSError:
-                pass
-        for dirpath, dirnames, filenames in os.walk(self.destdir):
-            for somedir in dirnames:
-                self._process_name(dirpath, somedir, overwrite)
-            for somefile in filenames:
-                if somefile in self.config['excludedFiles']:
-                    continue                    
-                self._process_name(dirpath, somefile, overwrite)
+                try:
+                    # remove copied rules file if there was one in the 
+                    # source data dir for our plugin type
+                    os.remove(dest_rules_file)
+                except OSError:
+                    pass
+        progress = self.progress
+        done = 0
+        with self._phase('names', self.destdir) as counts:
+            for dirpath, dirnames, filenames in os.walk(self.destdir):
+                for somedir in dirnames:
+                    self._process_name(dirpath, somedir, overwrite)
+                for somefile in filenames:
+                    if somefile in self.config['excludedFiles']:
+                        continue                    
+                    if cancel is not None:
+                        cancel.check()
+                    done += 1
+                    if progress is not None:
+                        progress('names', done, None, os.path.join(dirpath, somefile))
+                    self._process_name(dirpath, somefile, overwrite)
+            counts['files'] = done
         return True
         
-    def process_contents(self, exclude=None):
+    def process_contents(self, exclude=None, cancel=None):
         '''
         Replace tokens in file contents based on rules.py
         
@@ -1071,38 +2236,1171 @@ class PluginWizard(object):
             matches this regex, the file is excluded from 
             being processed. Note that ``self.excluded_files``
             are being skipped by default.
+        :param cancel: optional :py:class:`CancellationToken`, checked 
+            before each file and every ``CANCEL_CHECK_LINES`` lines. A 
+            file being processed when cancelled is put back as it was, 
+            files processed before stay processed.
+        :raise: GenerationCancelled
         '''
         if self.destdir is None:
             raise ValueError("E: dest dir can't be None. Did you forget to call set_destdir()?")
-        for dirpath, dirnames, filenames in os.walk(self.destdir):  # IGNORE:W0612 #@UnusedVariable
-            for somefile in filenames:
-                if exclude and re.match(exclude, somefile, re.UNICODE):
-                    continue
-                self._process_content(dirpath, somefile)
+        with self._phase('contents', self.destdir) as counts:
+            if self._inert is None:
+                self._inert = self._inert_files()
+            todo = []
+            for dirpath, dirnames, filenames in os.walk(self.destdir):  # IGNORE:W0612 #@UnusedVariable
+                for somefile in filenames:
+                    if exclude and re.match(exclude, somefile, re.UNICODE):
+                        continue
+                    if len(self._inert) > 0:
+                        filepath = os.path.join(dirpath, somefile)
+                        if self._source_relpath(filepath) in self._inert:
+                            if g_verbose > 1:
+                                print("Skipping '%s': nothing to replace." % format_relpath(filepath))
+                            if self.events is not None:
+                                self._emit('skip', path=filepath, reason='unchanged')
+                            continue
+                    todo.append((dirpath, somefile))
+            counts['files'] = len(todo)
+            progress = self.progress
+            for done, (dirpath, somefile) in enumerate(todo, 1):
+                if cancel is not None:
+                    cancel.check()
+                self._process_content(dirpath, somefile, cancel)
+                if progress is not None:
+                    progress('contents', done, len(todo), os.path.join(dirpath, somefile))
         return True
+    
+    def generate(self, destpath, overwrite=False, createdir=False, cancel=None):
+        '''
+        Create the plugin in a folder named after the plugin name in ``destpath``.
+        
+        Copies the template folder structure and does the name and 
+        content replacements.
+        
+        :param bool overwrite: replace an existing plugin folder.
+        :param bool createdir: create ``destpath`` if it doesn't exist.
+        :param cancel: optional :py:class:`CancellationToken`. When cancelled, 
+            the partially generated plugin folder is removed and a plugin 
+            folder it was about to overwrite is put back.
+        :raise: CLIError if the destination can't be created or
+            the plugin folder exists and ``overwrite`` is False.
+            GenerationCancelled if ``cancel`` was cancelled.
+        :return: path to the new plugin folder.
+        '''
+        if self.events is None:
+            return self._generate(destpath, overwrite, createdir, cancel)
+        with self._phase('generate', destpath):
+            try:
+                return self._generate(destpath, overwrite, createdir, cancel)
+            except Exception as e:
+                self._emit('error', phase='generate', path=destpath, message=str(e))
+                raise
+    
+    def _generate(self, destpath, overwrite, createdir, cancel):
+        plugin_type = self.plugin_type
+        plugin_name = self.config['pluginName']
+        
+        real_destpath = canonicalize_path(os.path.realpath(destpath))
+        full_destpath = os.path.join(real_destpath, plugin_type)
+        named_fulldestpath = canonicalize_path(os.path.join(real_destpath, plugin_name))
+        dest_parentdir, destdir = real_destpath, plugin_type  # IGNORE:W0612 #@UnusedVariable
+        
+        if not os.path.exists(dest_parentdir):
+            if createdir:
+                os.makedirs(dest_parentdir, mode=0o755)
+                if not os.path.exists(dest_parentdir):
+                    raise CLIError("creating parent dir for destination '%s'  failed. skipping..." % destpath)
+            else:
+                raise CLIError("destination '%s' doesn't exist. skipping..." % destpath)
+        
+        if self.progress is not None:
+            self.progress('copy', 0, None, named_fulldestpath)
+        if cancel is not None:
+            cancel.check()
+        
+        backup_path = None
+        if overwrite and cancel is not None and os.path.exists(named_fulldestpath):
+            # keep the existing plugin until the new one is complete, 
+            # so a cancelled run can put it back
+            backup_path = named_fulldestpath + ROLLBACK_SUFFIX
+            if os.path.exists(backup_path):
+                su.rmtree(backup_path, onerror=rmtree_onerror)
+            os.rename(named_fulldestpath, backup_path)
+        
+        # decided from the template itself, the copies all have new 
+        # modification times and may be renamed
+        self._inert = self._inert_files()
+        self._renamed = {}
+        
+        try:
+            # 2. Copy folder structure(s)
+            if overwrite and os.path.exists(named_fulldestpath):
+                if g_verbose > 0:
+                    print("Overwriting destination dir at '%s'" %  (os.path.relpath(named_fulldestpath, 
+                                                                                    os.path.realpath(os.curdir))))
+                try:
+                    with self._phase('rmtree', named_fulldestpath):
+                        su.rmtree(named_fulldestpath, onerror=rmtree_onerror)
+                    with self._phase('copy', named_fulldestpath) as counts:
+                        counts['files'], counts['bytes'] = self._copy_template(named_fulldestpath)
+                except Exception as e:
+                    raise CLIError("E: %s" % str(e))
+            else:
+                try:
+                    if g_verbose > 0:
+                        print("Copying template folder structure to destination.")
+                    with self._phase('copy', named_fulldestpath) as counts:
+                        counts['files'], counts['bytes'] = self._copy_template(named_fulldestpath)
+                except OSError, e:
+                    if 'exists' in str(e):
+                        raise CLIError("dir exists: '%s'%sUse -f/--force to overwrite" % (full_destpath, os.linesep))          
+            
+            if cancel is not None:
+                cancel.check()
+            self.set_destdir(named_fulldestpath)
+        
+            # 3. Do file name replacements
+            self.process_names(overwrite=overwrite, cancel=cancel)
+        
+            # 4. Do file content replacements
+            self.process_contents(cancel=cancel)
+        except GenerationCancelled:
+            self._rollback(named_fulldestpath, backup_path)
+            raise
+        except Exception:
+            if backup_path is not None:
+                self._rollback(named_fulldestpath, backup_path)
+            raise
+        if backup_path is not None:
+            with self._phase('rmtree', backup_path):
+                su.rmtree(backup_path, onerror=rmtree_onerror)
+        
+        return named_fulldestpath
+
+    def _copy_template(self, destpath):
+        if self.template is not None:
+            return self.template.copy_to(destpath)
+        return copy_template(self.config['srcdataPath'], self.plugin_type, destpath)
+    
+    @staticmethod
+    def _rollback(path, backup_path):
+        '''Remove the partially generated plugin at ``path`` and put back the one at ``backup_path``, if any.'''
+        su.rmtree(path, ignore_errors=True)
+        if backup_path is not None:
+            os.rename(backup_path, path)
 
     @classmethod
-    def get_tokentable_listing(cls, indent=3):
+    def get_tokentable_listing(cls, indent=3, table=None, datums=None):
         '''
         Get a string with all data entries of the token table, including forms.
         
+        Only needs the class level ``token_forms``, so no wizard 
+        (and no source data) is needed just to list tokens.
+        
         :param int indent: how many spaces for indentation.
+        :param table: optional :py:class:`TokenTable`. If given, each 
+            token is listed with its value from the table. Values are 
+            only computed for the data entries listed.
+        :param list datums: only list these data entries.
         '''
         result = ""
         spaces = " " * indent
-        for k, v in cls.token_forms.iteritems():
-            result += ("%s:" % k) + os.linesep
+        if datums is None:
+            datums = cls.token_forms.keys()
+        for k in datums:
+            v = cls.token_forms[k]
+            if table is None:
+                result += ("%s:" % k) + os.linesep
+            else:
+                result += ("%s: %s" % (k, table[k].get('', ''))) + os.linesep
             for entry in v:
                 if entry == '': # default form
                     continue
-                else:
+                elif table is None:
                     result += ("%s%sAs%s" % (spaces, k, entry)) + os.linesep
+                else:
+                    result += ("%s%sAs%s: %s" % (spaces, k, entry, table[k].get(entry, ''))) + os.linesep
             result += os.linesep
         return result
 
-    def set_destdir(self, somepath):
-        self._check_destdir(somepath)
-        self.destdir = somepath
+    def set_destdir(self, somepath):
+        self._check_destdir(somepath)
+        self.destdir = somepath
+    
+
+class GenerationEngine(object):
+    '''
+    Generates plugins in-process and keeps what can be reused between 
+    runs: a :py:class:`TemplateSnapshot` and the rules file and compiled 
+    rules of each plugin type.
+    
+    The first run of a plugin type reads its template into memory, later 
+    runs copy and process it from there and only render the lines with 
+    something to replace. Templates are read again when any of their 
+    files changed, rules when their file changed. One engine can be 
+    used by several threads at once.
+    
+    Example::
+    
+        engine = GenerationEngine()
+        for plugin_id, plugin_name in plugins:
+            config = dict(CONFIG_DEFAULT, pluginId=plugin_id, pluginName=plugin_name)
+            engine.generate(config, 'plugins', 'shaderplugin')
+    '''
+    def __init__(self, history=None):
+        '''
+        :param history: optional :py:class:`RunHistory` to add each 
+            successful run of :py:meth:`generate` to.
+        '''
+        super(GenerationEngine, self).__init__()
+        self.history = history
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._templates = {}
+        self._rules = {}
+    
+    def index(self, srcdata_path):
+        '''Return the current :py:class:`TemplateIndex` of ``srcdata_path``, or None if it can't be built.'''
+        srcdir = os.path.realpath(srcdata_path)
+        with self._lock:
+            index = self._indexes.get(srcdir)
+            try:
+                if index is None:
+                    index = TemplateIndex(srcdir)
+                    # only saved by 'c4dplugwiz index', which is 
+                    # what makes the CLI use an index
+                    if not index.load() or index.is_stale():
+                        index.build()
+                elif index.is_stale():
+                    index.build()
+            except (IOError, OSError) as e:
+                if g_verbose > 0:
+                    print("W: not using template index: %s" % e)
+                index = None
+            self._indexes[srcdir] = index
+            return index
+    
+    def template(self, srcdata_path, plugin_type):
+        '''
+        Return the current :py:class:`TemplateSnapshot` of ``plugin_type`` 
+        in ``srcdata_path``, or None if the template can't be read.
+        '''
+        key = (os.path.realpath(srcdata_path), plugin_type)
+        with self._lock:
+            template = self._templates.get(key)
+        if template is None or template.is_stale():
+            # read outside the lock, runs of other plugin types needn't wait
+            try:
+                template = TemplateSnapshot(srcdata_path, plugin_type)
+            except (IOError, OSError) as e:
+                if g_verbose > 0:
+                    print("W: not using template snapshot: %s" % e)
+                return None
+            with self._lock:
+                self._templates[key] = template
+        return template
+    
+    @staticmethod
+    def _rules_stamp(rules_filepath, srcdata_path):
+        if rules_filepath is None:
+            return None
+        try:
+            return os.stat(rules_filepath).st_mtime
+        except OSError:
+            # rules file inside a template archive
+            return os.stat(srcdata_path).st_mtime
+    
+    def wizard(self, config, plugin_type=None, progress=None, events=None):
+        '''
+        Create a :py:class:`PluginWizard` for ``config`` using the warm 
+        template and rules. See :py:class:`PluginWizard` for the parameters.
+        '''
+        srcdata_path = config['srcdataPath']
+        key = (os.path.realpath(srcdata_path), plugin_type, config.get('rulesFile'))
+        with self._lock:
+            cached = self._rules.get(key)
+        rules = None
+        if cached is not None and cached[0] == self._rules_stamp(cached[1][0], srcdata_path):
+            rules = cached[1]
+        pw = PluginWizard(config, plugin_type, progress=progress, rules=rules, events=events)
+        # plugin_type may only be known now
+        pw.template = self.template(srcdata_path, pw.plugin_type)
+        if rules is None:
+            rules = (pw._rules_filepath, pw._rules_code)
+            with self._lock:
+                self._rules[key] = (self._rules_stamp(rules[0], srcdata_path), rules)
+        return pw
+    
+    def generate(self, config, destpath, plugin_type=None, overwrite=False, createdir=False, progress=None, 
+                 events=None, cancel=None):
+        '''
+        Generate a plugin, see :py:meth:`PluginWizard.generate`.
+        
+        :return: path to the new plugin folder.
+        '''
+        if self.history is None:
+            pw = self.wizard(config, plugin_type, progress=progress, events=events)
+            return pw.generate(destpath, overwrite=overwrite, createdir=createdir, cancel=cancel)
+        stats = GenerationStats(events)
+        textfx = TextFX.cache_info()
+        pw = self.wizard(config, plugin_type, progress=progress, events=stats)
+        path = pw.generate(destpath, overwrite=overwrite, createdir=createdir, cancel=cancel)
+        self.history.record(pw, stats, textfx)
+        return path
+    
+    def generate_many(self, configs, destpath, plugin_type=None, overwrite=False, createdir=False, 
+                      workers=4, done=None, events=None, cancel=None):
+        '''
+        Generate one plugin per config in ``configs`` on up to ``workers`` 
+        threads. All runs share this engine's templates and rules, so the 
+        templates are only read and the rules only loaded once.
+        
+        ``configs`` is consumed lazily, one config per started run, 
+        so a generator can stop the batch early.
+        
+        :param done: optional callable ``done(i, path, error)``, called 
+            from the worker thread when the run for the ``i``-th config 
+            finished, with either the path to the new plugin folder or 
+            the exception it failed with.
+        :param events: optional event sink shared by all runs, see 
+            :py:class:`PluginWizard`. Called from several threads at once.
+        :param cancel: optional :py:class:`CancellationToken` for the whole 
+            batch. Once cancelled no more runs are started and the runs 
+            in progress fail with :py:class:`GenerationCancelled` and are 
+            rolled back.
+        :return: list of ``(i, path, error)`` tuples in order of completion.
+        '''
+        jobs = enumerate(configs)
+        lock = threading.Lock()
+        results = []
+        def work():
+            while True:
+                if cancel is not None and cancel.cancelled:
+                    return
+                with lock:
+                    try:
+                        i, config = next(jobs)
+                    except StopIteration:
+                        return
+                path = error = None
+                try:
+                    path = self.generate(config, destpath, plugin_type, overwrite=overwrite, createdir=createdir, 
+                                         events=events, cancel=cancel)
+                except Exception as e:
+                    error = e
+                with lock:
+                    results.append((i, path, error))
+                if done is not None:
+                    done(i, path, error)
+        threads = [threading.Thread(target=work) for _ in range(max(1, workers))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+class TemplatePreview(object):
+    '''
+    Renders names and file contents of a plugin type the way 
+    :py:meth:`PluginWizard.generate` would, without copying anything.
+    
+    Template files are only read once. Each rendered name and file is 
+    kept together with the config values its tokens depend on, so after 
+    :py:meth:`update` only what uses a changed value is rendered again.
+    
+    :param dict config: see ``CONFIG_DEFAULT``
+    :param string plugin_type: name of the template folder structure to use.
+    '''
+    def __init__(self, config, plugin_type=None):
+        super(TemplatePreview, self).__init__()
+        self.wizard = PluginWizard(dict(config), plugin_type)
+        self.plugin_type = self.wizard.plugin_type
+        self.srcdir = self.wizard.config['srcdataPath']
+        self._dirs, self._files = list_template_contents(self.srcdir, self.plugin_type)
+        rules_filepath = self.wizard._rules_filepath
+        if rules_filepath is not None:
+            # the copied rules file is removed by process_names
+            rules_filename = os.path.basename(rules_filepath)
+            self._files = [f for f in self._files if f != rules_filename]
+        self._contents = {}
+        self._rendered = {}
+    
+    def update(self, config):
+        '''Use the ``pluginId``, ``pluginName``, ``author`` and ``org`` of ``config`` from now on.'''
+        wizard = self.wizard
+        for key in ('pluginId', 'pluginName', 'author', 'org'):
+            if key in config:
+                wizard.config[key] = config[key]
+        wizard._fill_tokentable()
+    
+    def _depends_on(self, text):
+        datums = set(mat.split('As')[0] for mat in re.findall(PluginWizard.token_regex, text))
+        config = self.wizard.config
+        return tuple((key, config.get(key)) for datum in sorted(datums) 
+                     for key in TokenTable.config_keys.get(datum, ()))
+    
+    def _render(self, kind, key, text, func):
+        deps = self._depends_on(text)
+        cached = self._rendered.get((kind, key))
+        if cached is not None and cached[0] == deps:
+            return cached[1]
+        result = func(text)
+        self._rendered[(kind, key)] = (deps, result)
+        return result
+    
+    def render_name(self, name):
+        newname = self._render('name', name, name, self.wizard.render_name)
+        return name if newname is None else newname
+    
+    def tree(self):
+        '''
+        :return: sorted list of ``(relpath, rendered relpath, isdir)`` 
+            tuples for all folders and files of the plugin type.
+        '''
+        excluded = self.wizard.config['excludedFiles']
+        result = []
+        for paths, isdir in ((self._dirs, True), (self._files, False)):
+            for relpath in paths:
+                parts = relpath.split(os.sep)
+                rendered = [self.render_name(part) for part in parts[:-1]]
+                if isdir or parts[-1] not in excluded:
+                    rendered.append(self.render_name(parts[-1]))
+                else:
+                    rendered.append(parts[-1])
+                result.append((relpath, os.sep.join(rendered), isdir))
+        result.sort()
+        return result
+    
+    def read(self, relpath):
+        '''Return the contents of the template file at ``relpath`` as unicode.'''
+        content = self._contents.get(relpath)
+        if content is None:
+            content = read_template_file(self.srcdir, self.plugin_type, relpath)
+            content = content.decode('utf-8', 'replace')
+            self._contents[relpath] = content
+        return content
+    
+    def render_file(self, relpath):
+        '''Return the contents of the template file at ``relpath`` with rules and tokens replaced.'''
+        if os.path.basename(relpath) in self.wizard.config['excludedFiles']:
+            return self.read(relpath)
+        render_line = self.wizard.render_line
+        return self._render('file', relpath, self.read(relpath), 
+                            lambda text: u''.join(render_line(line) for line in text.splitlines(True)))
+
+
+class TemplateSnapshot(object):
+    '''
+    The template folder structure of a plugin type, read into memory.
+    
+    Every file is read and decoded once, whether it comes from a folder,
+    a manifest or a :py:class:`TemplateArchive`. Which lines contain a
+    magic token or rule key is found once per set of rule keys, so
+    :py:class:`GenerationEngine` can copy and process later runs
+    without reading or searching the template again.
+    
+    Unlike :py:class:`TemplateIndex`, :py:meth:`is_stale` compares size
+    and modification time of every file and folder (or of the manifest
+    or archive) and so also catches files edited in place.
+    
+    :param string srcdata_path: path to the source data repository
+    :param string plugin_type: name of the template folder structure to read.
+    '''
+    def __init__(self, srcdata_path, plugin_type):
+        super(TemplateSnapshot, self).__init__()
+        self.srcdir = os.path.realpath(srcdata_path)
+        self.plugin_type = plugin_type
+        self.dirs = []
+        self.files = {}         # relpath -> (mode, content)
+        self._stamps = {}       # path -> (size, mtime) when read
+        self._lines = {}        # relpath -> list of unicode lines, None if binary
+        self._hot = {}          # (relpath, rule keys) -> indices of lines to render
+        self._read()
+        for relpath, (_, content) in self.files.iteritems():
+            lines = None
+            if not '\0' in content:
+                try:
+                    # same line breaks as reading the copy with codecs
+                    lines = content.decode('utf-8').splitlines(True)
+                except UnicodeDecodeError:
+                    pass
+            self._lines[relpath] = lines
+    
+    def _stamp(self, path):
+        st = os.stat(path)
+        self._stamps[path] = (st.st_size, st.st_mtime)
+        return st
+    
+    def _read(self):
+        srcdir = self.srcdir
+        plugin_type = self.plugin_type
+        # stamped before reading, so changes made meanwhile make it stale
+        self._stamp(srcdir)
+        archive = open_template_archive(srcdir)
+        if archive is not None:
+            if not archive.isdir(plugin_type):
+                raise CLIError("couldn't find template folder structure for plugin type '%s' in '%s'" %
+                               (plugin_type, archive.path))
+            self._stamp(archive.path)
+            self.dirs = [relpath.replace('/', os.sep) for relpath in archive.dirs(plugin_type)]
+            for relpath in archive.files(plugin_type):
+                name = '%s/%s' % (plugin_type, relpath)
+                self.files[relpath.replace('/', os.sep)] = (archive.mode(name), archive.read(name))
+            return
+        typedir = os.path.join(srcdir, plugin_type)
+        if os.path.isdir(typedir):
+            # the same files copy_template would copy
+            for dirpath, dirnames, filenames in os.walk(typedir, followlinks=True):
+                self._stamp(dirpath)
+                dirnames[:] = [d for d in dirnames if d not in DEFAULT_DIR_EXCLUDES]
+                for dirname in dirnames:
+                    self.dirs.append(os.path.relpath(os.path.join(dirpath, dirname), typedir))
+                for filename in filenames:
+                    if filename in DEFAULT_DIR_EXCLUDES:
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    st = self._stamp(filepath)
+                    with open(filepath, 'rb') as f:
+                        content = f.read()
+                    relpath = os.path.relpath(filepath, typedir)
+                    if isinstance(relpath, str):
+                        # same as PluginWizard._source_relpath
+                        relpath = relpath.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+                    self.files[relpath] = (st.st_mode & 0o7777, content)
+            return
+        try:
+            self._stamp(get_manifest_path(srcdir, plugin_type))
+        except OSError:
+            raise CLIError("couldn't find template folder structure or manifest for plugin type '%s' at '%s'" %
+                           (plugin_type, typedir))
+        manifest = read_manifest(srcdir, plugin_type)
+        store = BlobStore(os.path.join(srcdir, DEFAULT_BLOBDIR))
+        self.dirs = list(manifest['dirs'])
+        for relpath, item in manifest['files'].iteritems():
+            self.files[relpath] = (item['mode'], store.read(item['blob']))
+    
+    def is_stale(self):
+        '''Tell if any file or folder of the template changed since it was read.'''
+        for path, (size, mtime) in self._stamps.iteritems():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return True
+            if st.st_size != size or abs(st.st_mtime - mtime) >= MTIME_TOLERANCE:
+                return True
+        return False
+    
+    def copy_to(self, destpath):
+        '''
+        Write the template folder structure to ``destpath``,
+        which must not exist yet.
+        
+        :return: tuple of the number of files and bytes written.
+        '''
+        os.makedirs(destpath)
+        for relpath in sorted(self.dirs):
+            os.makedirs(os.path.join(destpath, relpath))
+        size = 0
+        for relpath, (mode, content) in self.files.iteritems():
+            filepath = os.path.join(destpath, relpath)
+            with open(filepath, 'wb') as f:
+                f.write(content)
+            os.chmod(filepath, mode)
+            size += len(content)
+        return len(self.files), size
+    
+    def _hot_lines(self, relpath, rule_keys):
+        key = (relpath, rule_keys)
+        hot = self._hot.get(key)
+        if hot is None:
+            # render_line can only change lines with a token or rule key,
+            # whichever thread gets here first, the result is the same
+            hot = tuple(i for i, line in enumerate(self._lines[relpath])
+                        if PluginWizard.tokenchar_start in line or any(k in line for k in rule_keys))
+            self._hot[key] = hot
+        return hot
+    
+    def inert_files(self, rule_keys=()):
+        '''
+        Return the set of relpaths of files which are binary or have
+        neither magic tokens nor any of ``rule_keys`` in them.
+        '''
+        return set(relpath for relpath, lines in self._lines.iteritems()
+                   if lines is None or len(self._hot_lines(relpath, rule_keys)) == 0)
+    
+    def render(self, relpath, render_line, rule_keys=(), cancel=None):
+        '''
+        Return the contents of the file at ``relpath`` with each line that
+        has a magic token or one of ``rule_keys`` passed through ``render_line``,
+        encoded as UTF-8. Returns None for binary and unknown files.
+        
+        :param cancel: optional :py:class:`CancellationToken`, checked
+            every ``CANCEL_CHECK_LINES`` rendered lines.
+        '''
+        lines = self._lines.get(relpath)
+        if lines is None:
+            return None
+        rendered = list(lines)
+        for done, i in enumerate(self._hot_lines(relpath, rule_keys), 1):
+            rendered[i] = render_line(lines[i])
+            if cancel is not None and done % CANCEL_CHECK_LINES == 0:
+                cancel.check()
+        return u''.join(rendered).encode('utf-8')
+
+
+class TemplateIndex(object):
+    '''
+    Persistent index of a source data repository.
+    
+    Scanning the repository once records the plugin types it contains, 
+    every file of each plugin type with its size, modification time, SHA-1 
+    hash and binary flag, as well as the magic tokens (in contents and 
+    names) and rule keys found in each file. The index is stored as JSON 
+    in the cache dir (see :py:func:`get_cache_path`), so later runs can 
+    answer from it instead of walking the repository again.
+    
+    Revalidation only compares directory modification times, which 
+    catches added, removed and renamed files. Files edited in place 
+    don't change their directory's modification time, so use 
+    ``is_stale(check_files=True)`` or ``c4dplugwiz index --rebuild`` 
+    after editing templates.
+    
+    Example::
+    
+        index = TemplateIndex('c4dplugwiz_data/cpp').update()
+        index.plugin_types         # ['shaderplugin', 'shaderplugin_r14']
+        index.tokens('shaderplugin')
+    
+    :param string srcdata_path: path to the source data repository
+    :param string index_path: path to the index file. Defaults to a 
+        file in the cache dir named after a hash of ``srcdata_path``.
+    '''
+    version = 3
+    
+    def __init__(self, srcdata_path, index_path=None):
+        super(TemplateIndex, self).__init__()
+        self.srcdir = os.path.realpath(srcdata_path)
+        if index_path is None:
+            name = hashlib.sha1(self.srcdir.encode('utf-8')).hexdigest()[:16]
+            index_path = os.path.join(get_cache_path(), 'index-%s.json' % name)
+        self.index_path = index_path
+        self.data = None
+        self._rules_digests = {}
+    
+    @staticmethod
+    def _digest_rules(rules_filepath):
+        try:
+            return hashlib.sha1(read_source_file(rules_filepath)).hexdigest()
+        except (IOError, OSError):
+            return None
+    
+    def _rules_digest(self, rules_filepath):
+        # hashed once per load or build, not for every file
+        digest = self._rules_digests.get(rules_filepath, _MISSING)
+        if digest is _MISSING:
+            digest = self._rules_digests[rules_filepath] = self._digest_rules(rules_filepath)
+        return digest
+    
+    @property
+    def plugin_types(self):
+        '''Sorted list of plugin types (template folder names).'''
+        return sorted(self.data['types'].keys())
+    
+    def files(self, plugin_type):
+        '''Return a dict of ``{relpath: file entry}`` for all files of ``plugin_type``.'''
+        return self.data['types'][plugin_type]['files']
+    
+    def tokens(self, plugin_type):
+        '''Return a sorted list of all magic tokens used by ``plugin_type``, in contents and names.'''
+        tokens = set()
+        for entry in self.files(plugin_type).itervalues():
+            tokens.update(entry['tokens'])
+            tokens.update(entry['nameTokens'])
+        return sorted(tokens)
+    
+    def rule_keys(self, plugin_type):
+        '''Return a sorted list of the rule keys used in the contents of ``plugin_type``'s files.'''
+        keys = set()
+        for entry in self.files(plugin_type).itervalues():
+            keys.update(entry['ruleKeys'])
+        return sorted(keys)
+    
+    def rules_file(self, plugin_type):
+        '''Return the path of the rules file that applies to ``plugin_type`` or None.'''
+        return self.data['types'][plugin_type]['rulesFile']
+    
+    @staticmethod
+    def _matches(entry, st):
+        # modification times only to the microsecond, copies 
+        # and JSON don't always keep more than that
+        return (st.st_size == entry['size'] and entry['mtime'] is not None and 
+                abs(st.st_mtime - entry['mtime']) < MTIME_TOLERANCE)
+    
+    def needs_processing(self, plugin_type, relpath, rules_filepath):
+        '''
+        Tell if the copy of the file ``relpath`` from the template 
+        of ``plugin_type`` may contain anything to replace. 
+        
+        Returns True, i.e. process it to be safe, unless the index has an entry 
+        for ``relpath`` which still matches the template file's size and modification 
+        time and is either binary or has neither magic tokens nor, if ``rules_filepath`` 
+        has the same contents as the rules file the index was built with, rule keys in it.
+        '''
+        if isinstance(relpath, str):
+            relpath = relpath.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+        try:
+            typeinfo = self.data['types'][plugin_type]
+            entry = typeinfo['files'][relpath]
+            # files in the blob store or an archive have no mtime, 
+            # they are covered by the manifest's or archive's stamp
+            if entry['mtime'] is not None and not self._matches(entry, os.stat(os.path.join(self.srcdir, plugin_type, relpath))):
+                return True
+        except (KeyError, TypeError, OSError):
+            return True
+        if entry['binary']:
+            return False
+        if len(entry['tokens']) > 0:
+            return True
+        if rules_filepath is not None and (rules_filepath != typeinfo['rulesFile'] or 
+                                           self._rules_digest(rules_filepath) != typeinfo['rulesSha1']):
+            return True
+        return len(entry['ruleKeys']) > 0
+    
+    def inert_files(self, plugin_type, rules_filepath):
+        '''Return the set of relpaths of files of ``plugin_type`` which don't need processing, see :py:meth:`needs_processing`.'''
+        if self.data is None or plugin_type not in self.data['types']:
+            return set()
+        return set(relpath for relpath in self.files(plugin_type) 
+                   if not self.needs_processing(plugin_type, relpath, rules_filepath))
+    
+    def load(self):
+        '''Load the index file. Returns False if it doesn't exist or can't be used.'''
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get('version') != self.version or data.get('srcdir') != self.srcdir:
+            return False
+        self.data = data
+        self._rules_digests = {}
+        return True
+    
+    def save(self):
+        dirpath = os.path.dirname(self.index_path)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        # write to a temp file first so concurrent readers never see a partial index
+        temp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            json.dump(self.data, f)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+        os.rename(temp_path, self.index_path)
+    
+    def is_stale(self, check_files=False):
+        '''
+        Tell if the index no longer reflects the repository.
+        
+        :param bool check_files: also compare size and modification 
+            time of every file, to catch files edited in place.
+        '''
+        if self.data is None:
+            return True
+        for relpath, mtime in self.data['dirs'].iteritems():
+            try:
+                if os.stat(os.path.join(self.srcdir, relpath)).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        for path, mtime in self.data['stamps'].iteritems():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        if check_files:
+            for plugin_type in self.plugin_types:
+                typeinfo = self.data['types'][plugin_type]
+                if typeinfo.get('manifest') is not None or typeinfo.get('archive') is not None:
+                    # covered by the manifest's or archive's stamp
+                    continue
+                for relpath, entry in self.files(plugin_type).iteritems():
+                    try:
+                        st = os.stat(os.path.join(self.srcdir, plugin_type, relpath))
+                    except OSError:
+                        return True
+                    if not self._matches(entry, st):
+                        return True
+        return False
+    
+    def update(self, rebuild=False, check_files=False):
+        '''
+        Load the index, then rebuild and save it if needed.
+        
+        :param bool rebuild: rebuild from scratch even if the index seems current.
+        :return: self
+        '''
+        if rebuild or not self.load() or self.is_stale(check_files):
+            self.build(reuse=not rebuild)
+            self.save()
+        return self
+    
+    def build(self, reuse=True):
+        '''
+        Scan the repository and (re)build the index in memory.
+        
+        Plugin types can be folder structures or manifests pointing into 
+        the repository's :py:class:`BlobStore`. Either way the contents 
+        of each distinct file are classified and searched for tokens only 
+        once, however many plugin types share them. Results are kept in 
+        the index and reused by the next build.
+        
+        :param bool reuse: keep the entries of files whose size and 
+            modification time didn't change since the last build instead 
+            of reading and hashing them again. As long as the rules keep 
+            the same keys, only new and modified files are read.
+        '''
+        srcdir = unicode(self.srcdir)
+        data = {
+            'version': self.version,
+            'srcdir': self.srcdir,
+            'created': time.time(),
+            'dirs': {'': os.stat(srcdir).st_mtime},
+            'stamps': {},
+            'types': {},
+            'ruleKeys': [],
+            'blobs': {}
+        }
+        type_rule_keys = {}
+        self._rules_digests = {}
+        archive = open_template_archive(srcdir)
+        for name in list_plugin_types(srcdir):
+            rules_filepath = find_rules_file(srcdir, name)
+            rule_keys = []
+            if rules_filepath is not None and archive is None:
+                data['stamps'][rules_filepath] = os.stat(rules_filepath).st_mtime
+            if rules_filepath is not None:
+                try:
+                    rule_keys = [key if isinstance(key, unicode) else key.decode('utf-8', 'replace') 
+                                 for key in load_rules(rules_filepath).iterkeys()]
+                except Exception:
+                    pass
+            type_rule_keys[name] = (rules_filepath, rule_keys)
+        # blobs are searched for the rule keys of all plugin types at once,
+        # so parse results from the last build can only be reused if those match
+        data['ruleKeys'] = sorted(set(sum((keys for _, keys in type_rule_keys.itervalues()), [])))
+        if reuse and self.data is not None and self.data.get('ruleKeys') == data['ruleKeys']:
+            data['blobs'] = self.data.get('blobs', {})
+        for name in sorted(type_rule_keys):
+            rules_filepath, rule_keys = type_rule_keys[name]
+            typedir = os.path.join(srcdir, name)
+            files = {}
+            previous = {}
+            if reuse and self.data is not None and name in self.data['types']:
+                previous = self.data['types'][name]['files']
+            manifest = None
+            if archive is not None:
+                # the archive's mtime, stamped as dir '', covers all of it
+                for relpath in archive.files(name):
+                    content = archive.read('%s/%s' % (name, relpath))
+                    digest = hashlib.sha1(content).hexdigest()
+                    files[relpath.replace('/', os.sep)] = self._file_entry(data, digest, content, relpath, 
+                                                                           rule_keys, len(content), None)
+            elif os.path.isdir(typedir):
+                for dirpath, dirnames, filenames in os.walk(typedir):
+                    dirnames[:] = [d for d in dirnames if d not in DEFAULT_DIR_EXCLUDES]
+                    data['dirs'][os.path.relpath(dirpath, srcdir)] = os.stat(dirpath).st_mtime
+                    for filename in filenames:
+                        if filename in DEFAULT_FILE_EXCLUDES:
+                            continue
+                        filepath = os.path.join(dirpath, filename)
+                        relpath = os.path.relpath(filepath, typedir)
+                        st = os.stat(filepath)
+                        entry = previous.get(relpath)
+                        if entry is not None and self._matches(entry, st) and entry['sha1'] in data['blobs']:
+                            digest, content = entry['sha1'], None
+                        else:
+                            with open(filepath, 'rb') as f:
+                                content = f.read()
+                            digest = hashlib.sha1(content).hexdigest()
+                        files[relpath] = self._file_entry(data, digest, content, relpath, rule_keys, 
+                                                          st.st_size, st.st_mtime)
+            else:
+                manifest = get_manifest_path(srcdir, name)
+                data['stamps'][manifest] = os.stat(manifest).st_mtime
+                store = BlobStore(os.path.join(srcdir, DEFAULT_BLOBDIR))
+                for relpath, item in read_manifest(srcdir, name)['files'].iteritems():
+                    digest = item['blob']
+                    content = None
+                    if digest not in data['blobs']:
+                        content = store.read(digest)
+                    files[relpath] = self._file_entry(data, digest, content, relpath, rule_keys, 
+                                                      item['size'], None)
+            data['types'][name] = {
+                'rulesFile': rules_filepath,
+                'rulesSha1': self._rules_digest(rules_filepath) if rules_filepath is not None else None,
+                'manifest': manifest,
+                'archive': archive.path if archive is not None else None,
+                'files': files
+            }
+        self.data = data
+        return self
+    
+    @staticmethod
+    def _file_entry(data, digest, content, relpath, rule_keys, size, mtime):
+        blob = data['blobs'].get(digest)
+        if blob is None:
+            blob = TemplateIndex._scan_content(content, data['ruleKeys'])
+            data['blobs'][digest] = blob
+        return {
+            'size': size,
+            'mtime': mtime,
+            'sha1': digest,
+            'binary': blob['binary'],
+            'tokens': blob['tokens'],
+            'ruleKeys': [key for key in blob['ruleKeys'] if key in rule_keys],
+            'nameTokens': sorted(set(PluginWizard.token_regex.findall(relpath)))
+        }
+    
+    @staticmethod
+    def _scan_content(content, rule_keys):
+        binary = '\0' in content
+        text = None
+        if not binary:
+            try:
+                text = content.decode('utf-8')
+            except UnicodeDecodeError:
+                binary = True
+        blob = {
+            'binary': binary,
+            'tokens': [],
+            'ruleKeys': []
+        }
+        if text is not None:
+            blob['tokens'] = sorted(set(PluginWizard.token_regex.findall(text)))
+            blob['ruleKeys'] = sorted(key for key in rule_keys if key in text)
+        return blob
+    
+
+class BlobStore(object):
+    '''
+    Content-addressed store for template files.
+    
+    Each distinct file content is stored once, under the hex SHA-1 
+    of its contents, no matter how many plugin types use it. A plugin 
+    type kept in the store is described by a manifest (see 
+    :py:func:`dedup_templates`) mapping its relative file paths 
+    to blob hashes.
+    
+    Blobs are made read-only since they may be shared.
+    
+    :param string root: path to the store, usually 
+        ``DEFAULT_BLOBDIR`` within a source data repository.
+    '''
+    def __init__(self, root):
+        super(BlobStore, self).__init__()
+        self.root = root
+    
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+    
+    @staticmethod
+    def digest_file(filepath, blocksize=65536):
+        '''Return the hex SHA-1 of the contents of the file at ``filepath``.'''
+        sha1 = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(blocksize), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+    
+    def path(self, digest):
+        '''Return the path of the blob with hash ``digest``.'''
+        return os.path.join(self.root, digest[:2], digest[2:])
+    
+    def read(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+    
+    def put(self, filepath):
+        '''
+        Add the contents of the file at ``filepath`` to the 
+        store unless already present.
+        
+        :return: hex SHA-1 of the contents
+        '''
+        digest = self.digest_file(filepath)
+        blob_path = self.path(digest)
+        if not os.path.exists(blob_path):
+            dirpath = os.path.dirname(blob_path)
+            if not os.path.isdir(dirpath):
+                os.makedirs(dirpath)
+            temp_path = '%s.%d.tmp' % (blob_path, os.getpid())
+            su.copyfile(filepath, temp_path)
+            os.chmod(temp_path, 0o444)
+            os.rename(temp_path, blob_path)
+        return digest
+    
+
+class TemplateArchive(object):
+    '''
+    Read-only source data repository packed into a single file.
+    
+    The file is memory-mapped when opened and entries are read as 
+    needed, nothing is extracted up front. Paths of entries are relative 
+    to the repository's root and use ``/`` as separator, e.g. 
+    ``shaderplugin/source/main.cpp`` or ``rules.py``.
+    
+    Use :py:func:`open_template_archive` to get the right subclass 
+    for a file. Zip and tar files may also hold the repository's folder 
+    itself, which is then left out of the paths.
+    
+    :param string path: path to the archive file
+    '''
+    __metaclass__ = ABCMeta
+    
+    def __init__(self, path):
+        super(TemplateArchive, self).__init__()
+        self.path = os.path.realpath(path)
+        self.mtime = os.stat(self.path).st_mtime
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._files = {}     # path -> (mode, locator used by read())
+        self._dirs = set()
+        self._read_entries()
+        for name in self._files.keys():
+            parts = name.split('/')
+            for i in xrange(1, len(parts)):
+                self._dirs.add('/'.join(parts[:i]))
+    
+    @abstractmethod
+    def _read_entries(self):
+        '''Add all file and folder entries of the archive with :py:meth:`_add_entry`.'''
+    
+    def _add_entry(self, name, mode, locator, isdir=False):
+        name = name.replace('\\', '/').strip('/')
+        if name.startswith('./'):
+            name = name[2:]
+        if isinstance(name, str):
+            name = name.decode('utf-8', 'replace')
+        parts = name.split('/')
+        if len(name) == 0 or any(part in DEFAULT_EXCLUDES for part in parts):
+            return
+        if isdir:
+            self._dirs.add(name)
+        else:
+            self._files[name] = (mode & 0o777 or 0o644, locator)
+    
+    def _strip_root(self):
+        '''
+        Drop the folder all entries are in, if there is just one and it looks 
+        like the repository's root rather than a plugin type's folder (no files 
+        in it besides the rules file and manifests), as for an archive made 
+        with e.g. ``tar czf data.tgz data`` or the Finder's "Compress".
+        '''
+        names = list(self._files) + list(self._dirs)
+        roots = set(name.split('/', 1)[0] for name in names)
+        if len(roots) != 1 or roots.pop() in self._files:
+            return
+        root = names[0].split('/', 1)[0]
+        for name in self._files:
+            if name.count('/') == 1:
+                filename = name.split('/')[1]
+                if filename != DEFAULT_RULES_FILENAME and not filename.endswith(DEFAULT_MANIFEST_EXT):
+                    return
+        prefix = root + '/'
+        self._files = dict((name[len(prefix):], entry) for name, entry in self._files.iteritems() 
+                           if name.startswith(prefix))
+        self._dirs = set(name[len(prefix):] for name in self._dirs if name.startswith(prefix))
+    
+    def close(self):
+        self._map.close()
+        self._file.close()
+    
+    def isfile(self, name):
+        return name in self._files
+    
+    def isdir(self, name):
+        return name in self._dirs
+    
+    @property
+    def plugin_types(self):
+        '''Sorted list of plugin types, i.e. top level folders.'''
+        return sorted(name for name in self._dirs if '/' not in name and name != DEFAULT_BLOBDIR)
+    
+    def files(self, plugin_type):
+        '''Return a sorted list of the paths of all files of ``plugin_type``, relative to its folder.'''
+        prefix = plugin_type + '/'
+        return sorted(name[len(prefix):] for name in self._files if name.startswith(prefix))
+    
+    def dirs(self, plugin_type):
+        '''Return a sorted list of the paths of all sub folders of ``plugin_type``, relative to its folder.'''
+        prefix = plugin_type + '/'
+        return sorted(name[len(prefix):] for name in self._dirs if name.startswith(prefix))
+    
+    def mode(self, name):
+        return self._files[name][0]
+    
+    @abstractmethod
+    def read(self, name):
+        '''Return the contents of the file entry ``name``.'''
+    
+
+class TemplateBundle(TemplateArchive):
+    '''
+    Template bundle as written by :py:func:`pack_templates`.
+    
+    The file starts with ``BUNDLE_MAGIC`` followed by the length of 
+    the header as unsigned 32-bit little endian integer and the header 
+    itself, a JSON list with one ``[path, offset, size, flags, mode]`` 
+    entry per file or folder. Offsets are relative to the end of the 
+    header. Files with equal contents share the same offset.
+    '''
+    def _read_entries(self):
+        prefix_size = struct.calcsize(BUNDLE_PREFIX_FORMAT)
+        magic, header_size = struct.unpack(BUNDLE_PREFIX_FORMAT, self._map[:prefix_size])
+        if magic != BUNDLE_MAGIC:
+            raise CLIError("E: not a template bundle: '%s'" % self.path)
+        header = json.loads(self._map[prefix_size:prefix_size + header_size])
+        start = prefix_size + header_size
+        for name, offset, size, flags, mode in header['entries']:
+            self._add_entry(name, mode, (start + offset, size), isdir=bool(flags & BUNDLE_FLAG_DIR))
+    
+    def read(self, name):
+        offset, size = self._files[name][1]
+        return self._map[offset:offset + size]
+    
+
+class ZipTemplateArchive(TemplateArchive):
+    '''Source data repository in a zip file.'''
+    def _read_entries(self):
+        import zipfile
+        # zipfile needs a file object whose read() takes no size, which mmap doesn't offer on Python 2
+        self._zip = zipfile.ZipFile(self._file)
+        for info in self._zip.infolist():
+            self._add_entry(info.filename, info.external_attr >> 16, info, 
+                            isdir=info.filename.endswith('/'))
+        self._strip_root()
+    
+    def read(self, name):
+        return self._zip.read(self._files[name][1])
+    
+
+class TarTemplateArchive(TemplateArchive):
+    '''Source data repository in a (optionally compressed) tar file.'''
+    def _read_entries(self):
+        import tarfile
+        self._tar = tarfile.open(fileobj=self._map, mode='r:*')
+        for member in self._tar.getmembers():
+            if member.isdir() or member.isfile():
+                self._add_entry(member.name, member.mode, member, isdir=member.isdir())
+        self._strip_root()
+    
+    def read(self, name):
+        return self._tar.extractfile(self._files[name][1]).read()
     
 
 def get_parent_dirpath(somepath):
@@ -1110,20 +3408,662 @@ def get_parent_dirpath(somepath):
         return os.path.realpath(os.path.join(somepath, os.pardir))
     return None
     
-def get_first_dir_under_path(somepath):
+def find_rules_file(srcdata_path, plugin_type, rules_filename=DEFAULT_RULES_FILENAME):
     '''
-    Return first directory from an alphabetical listing 
-    under ``somepath``, or None if there are no subdirs. 
+    Look for a rules file belonging to ``plugin_type`` within the 
+    source data repository at ``srcdata_path``: at the root level of 
+    the plugin type's folder structure and at the root level of the 
+    repository itself.
+    
+    :return: real path to the rules file or None if there is none.
     '''
-    if os.path.exists(somepath):
-        root = os.path.realpath(somepath)
-        entries = os.listdir(root)
-        for entry in entries:
-            candidate = os.path.join(root, entry)
-            if os.path.isdir(candidate):
-                return candidate
+    rules_filepath = None
+    candidate_paths = [
+        os.path.realpath(os.path.join(srcdata_path, plugin_type, rules_filename)),
+        os.path.realpath(os.path.join(srcdata_path, rules_filename))
+    ]
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        for name in ['%s/%s' % (plugin_type, rules_filename), rules_filename]:
+            if archive.isfile(name):
+                rules_filepath = os.path.join(archive.path, *name.split('/'))
+        return rules_filepath
+    if not os.path.isdir(os.path.join(srcdata_path, plugin_type)):
+        # plugin type kept in the blob store, its rules file is a blob
+        manifest = read_manifest(srcdata_path, plugin_type)
+        if manifest is not None and rules_filename in manifest['files']:
+            store = BlobStore(os.path.join(srcdata_path, DEFAULT_BLOBDIR))
+            candidate_paths[0] = os.path.realpath(store.path(manifest['files'][rules_filename]['blob']))
+    for cpath in candidate_paths:
+        if os.path.exists(cpath):
+            rules_filepath = cpath
+    return rules_filepath
+
+def compile_rules(rules_filepath):
+    '''Compile the rules file at ``rules_filepath`` and return the code object.'''
+    src = read_source_file(rules_filepath)
+    return compile(src, os.path.basename(rules_filepath), 'exec')
+
+def load_rules(rules_filepath, code=None):
+    '''
+    Execute the rules file at ``rules_filepath`` and return 
+    its ``RULES`` dict (empty if the file doesn't define one).
+    
+    The rules file sees the globals of this module, 
+    same as if it were executed from within.
+    
+    :param code: optional code object from :py:func:`compile_rules` 
+        to execute instead of reading and compiling the file again.
+    '''
+    if code is None:
+        code = compile_rules(rules_filepath)
+    namespace = dict(globals())
+    namespace['RULES'] = {}
+    exec(code, namespace)  # IGNORE:W0122
+    return namespace['RULES']
+
+def get_manifest_path(srcdata_path, plugin_type):
+    return os.path.join(srcdata_path, plugin_type + DEFAULT_MANIFEST_EXT)
+
+def read_manifest(srcdata_path, plugin_type):
+    '''
+    Read the manifest of ``plugin_type`` in the source data 
+    repository at ``srcdata_path``.
+    
+    :return: the manifest as dict or None if there is none.
+    '''
+    try:
+        with open(get_manifest_path(srcdata_path, plugin_type), 'rb') as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+def list_plugin_types(srcdata_path):
+    '''
+    Return a sorted list of the plugin types available in the source 
+    data repository at ``srcdata_path``, from folder structures as well 
+    as from manifests.
+    '''
+    plugin_types = set()
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        return archive.plugin_types
+    if not os.path.isdir(srcdata_path):
+        return []
+    for name in os.listdir(srcdata_path):
+        if name in DEFAULT_DIR_EXCLUDES or name == DEFAULT_BLOBDIR:
+            continue
+        path = os.path.join(srcdata_path, name)
+        if os.path.isdir(path):
+            plugin_types.add(name)
+        elif name.endswith(DEFAULT_MANIFEST_EXT) and os.path.isfile(path):
+            plugin_types.add(name[:-len(DEFAULT_MANIFEST_EXT)])
+    return sorted(plugin_types)
+
+def template_exists(srcdata_path, plugin_type):
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        return archive.isdir(plugin_type)
+    return (os.path.isdir(os.path.join(srcdata_path, plugin_type)) or 
+            os.path.isfile(get_manifest_path(srcdata_path, plugin_type)))
+
+def copy_template(srcdata_path, plugin_type, destpath):
+    '''
+    Copy the template folder structure of ``plugin_type`` to ``destpath``, 
+    which must not exist yet. 
+    
+    A folder structure takes precedence over a manifest of the same name. 
+    Files of a manifest are copied out of the blob store, 
+    files of a :py:class:`TemplateArchive` out of the archive.
+    
+    :return: tuple of the number of files and bytes copied.
+    '''
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        if not archive.isdir(plugin_type):
+            raise CLIError("couldn't find template folder structure for plugin type '%s' in '%s'" % 
+                           (plugin_type, archive.path))
+        os.makedirs(destpath)
+        for relpath in archive.dirs(plugin_type):
+            os.makedirs(os.path.join(destpath, *relpath.split('/')))
+        files = size = 0
+        for relpath in archive.files(plugin_type):
+            name = '%s/%s' % (plugin_type, relpath)
+            filepath = os.path.join(destpath, *relpath.split('/'))
+            content = archive.read(name)
+            with open(filepath, 'wb') as f:
+                f.write(content)
+            os.chmod(filepath, archive.mode(name))
+            files += 1
+            size += len(content)
+        return files, size
+    source = os.path.join(srcdata_path, plugin_type)
+    if os.path.isdir(source):
+        su.copytree(source, destpath, ignore=copytree_ignore)
+        files = size = 0
+        for dirpath, _, filenames in os.walk(destpath):
+            for filename in filenames:
+                files += 1
+                size += os.path.getsize(os.path.join(dirpath, filename))
+        return files, size
+    manifest = read_manifest(srcdata_path, plugin_type)
+    if manifest is None:
+        raise CLIError("couldn't find template folder structure or manifest for plugin type '%s' at '%s'" % 
+                       (plugin_type, source))
+    store = BlobStore(os.path.join(srcdata_path, DEFAULT_BLOBDIR))
+    os.makedirs(destpath)
+    for relpath in sorted(manifest['dirs']):
+        os.makedirs(os.path.join(destpath, relpath))
+    size = 0
+    for relpath, item in manifest['files'].iteritems():
+        filepath = os.path.join(destpath, relpath)
+        su.copyfile(store.path(item['blob']), filepath)
+        os.chmod(filepath, item['mode'])
+        size += item['size']
+    return len(manifest['files']), size
+
+def list_template_contents(srcdata_path, plugin_type):
+    '''
+    List the template folder structure of ``plugin_type``, whether
+    it is a folder, a manifest or part of a :py:class:`TemplateArchive`.
+    
+    :return: tuple of sorted lists of the relative paths of all folders and all files.
+    '''
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        dirs = [relpath.replace('/', os.sep) for relpath in archive.dirs(plugin_type)]
+        files = [relpath.replace('/', os.sep) for relpath in archive.files(plugin_type)]
+        return sorted(dirs), sorted(files)
+    typedir = os.path.join(srcdata_path, plugin_type)
+    if os.path.isdir(typedir):
+        dirs = []
+        files = []
+        for dirpath, dirnames, filenames in os.walk(typedir):
+            dirnames[:] = [d for d in dirnames if d not in DEFAULT_DIR_EXCLUDES]
+            for dirname in dirnames:
+                dirs.append(os.path.relpath(os.path.join(dirpath, dirname), typedir))
+            for filename in filenames:
+                if filename not in DEFAULT_FILE_EXCLUDES:
+                    files.append(os.path.relpath(os.path.join(dirpath, filename), typedir))
+        return sorted(dirs), sorted(files)
+    manifest = read_manifest(srcdata_path, plugin_type)
+    if manifest is None:
+        raise CLIError("couldn't find template folder structure or manifest for plugin type '%s' at '%s'" % 
+                       (plugin_type, typedir))
+    return sorted(manifest['dirs']), sorted(manifest['files'])
+
+def read_template_file(srcdata_path, plugin_type, relpath):
+    '''Return the contents of the file at ``relpath`` in the template folder structure of ``plugin_type``.'''
+    archive = open_template_archive(srcdata_path)
+    if archive is not None:
+        return archive.read('%s/%s' % (plugin_type, relpath.replace(os.sep, '/')))
+    filepath = os.path.join(srcdata_path, plugin_type, relpath)
+    if os.path.isdir(os.path.join(srcdata_path, plugin_type)):
+        with open(filepath, 'rb') as f:
+            return f.read()
+    manifest = read_manifest(srcdata_path, plugin_type)
+    if manifest is None or relpath not in manifest['files']:
+        raise CLIError("couldn't find template file '%s' of plugin type '%s'" % (relpath, plugin_type))
+    return BlobStore(os.path.join(srcdata_path, DEFAULT_BLOBDIR)).read(manifest['files'][relpath]['blob'])
+
+def get_template_info(srcdata_path, plugin_type, index=None):
+    '''
+    Summarize the template folder structure of ``plugin_type``.
+    
+    :param index: current :py:class:`TemplateIndex` of ``srcdata_path``.
+        If given, the summary comes from its entries and no template 
+        file is read. Binary files then don't add to the ``tokens``.
+    :return: dict with the number of ``files``, their total size 
+        in ``bytes``, the sorted list of magic ``tokens`` used in 
+        names and contents (without ``%!`` and ``!%``) and the path 
+        of the ``rulesFile`` that applies to it, or None.
+    '''
+    token_regex = PluginWizard.token_regex
+    if index is not None and plugin_type in index.data['types']:
+        files = index.files(plugin_type)
+        tokens = set(index.tokens(plugin_type))
+        # folders without files don't show up in the file entries
+        prefix = plugin_type + os.sep
+        for relpath in index.data['dirs']:
+            if relpath.startswith(prefix):
+                tokens.update(token_regex.findall(relpath[len(prefix):]))
+        return {
+            'files': len(files),
+            'bytes': sum(entry['size'] for entry in files.itervalues()),
+            'tokens': sorted(tokens),
+            'rulesFile': index.rules_file(plugin_type)
+        }
+    dirs, files = list_template_contents(srcdata_path, plugin_type)
+    tokens = set()
+    size = 0
+    for relpath in dirs:
+        tokens.update(token_regex.findall(relpath))
+    for relpath in files:
+        content = read_template_file(srcdata_path, plugin_type, relpath)
+        size += len(content)
+        tokens.update(token_regex.findall(relpath))
+        tokens.update(token_regex.findall(content))
+    return {
+        'files': len(files),
+        'bytes': size,
+        'tokens': sorted(tokens),
+        'rulesFile': find_rules_file(srcdata_path, plugin_type)
+    }
+
+def load_template_index(srcdata_path):
+    '''
+    Return the up to date :py:class:`TemplateIndex` of ``srcdata_path`` 
+    if one was created with ``c4dplugwiz index``, None otherwise.
+    '''
+    index = TemplateIndex(srcdata_path)
+    try:
+        if os.path.exists(index.index_path):
+            index.update()
+        else:
+            index = None
+    except (IOError, OSError) as e:
+        if g_verbose > 0:
+            print("W: not using template index: %s" % e)
+        index = None
+    return index
+
+def dedup_templates(srcdata_path, plugin_types=None, remove=False):
+    '''
+    Move the template folder structures of the source data repository at 
+    ``srcdata_path`` into its :py:class:`BlobStore`.
+    
+    For every plugin type a manifest ``<plugin type>.manifest`` is written 
+    next to the folder structure, recording its sub folders and, for each 
+    file, the hash of its contents, its size and its mode. Files with the 
+    same contents, e.g. in templates for different SDK versions, are 
+    stored only once.
+    
+    :param list plugin_types: plugin types to store. Defaults to all 
+        folder structures.
+    :param bool remove: delete the folder structures once stored, so 
+        that the manifests are used instead.
+    :return: dict with the number of files, of distinct blobs 
+        among them, and their total and stored sizes in bytes.
+    '''
+    srcdata_path = unicode(srcdata_path)
+    store = BlobStore(os.path.join(srcdata_path, DEFAULT_BLOBDIR))
+    if plugin_types is None:
+        plugin_types = [name for name in list_plugin_types(srcdata_path) 
+                        if os.path.isdir(os.path.join(srcdata_path, name))]
+    stats = {'files': 0, 'blobs': 0, 'bytes': 0, 'storedBytes': 0}
+    seen = set()
+    for plugin_type in plugin_types:
+        typedir = os.path.join(srcdata_path, plugin_type)
+        if not os.path.isdir(typedir):
+            raise CLIError("couldn't find template folder structure for plugin type '%s' at '%s'" % 
+                           (plugin_type, typedir))
+        manifest = {'version': 1, 'dirs': [], 'files': {}}
+        for dirpath, dirnames, filenames in os.walk(typedir):
+            dirnames[:] = [d for d in dirnames if d not in DEFAULT_DIR_EXCLUDES]
+            for dirname in dirnames:
+                manifest['dirs'].append(os.path.relpath(os.path.join(dirpath, dirname), typedir))
+            for filename in filenames:
+                if filename in DEFAULT_FILE_EXCLUDES:
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                st = os.stat(filepath)
+                digest = store.put(filepath)
+                manifest['files'][os.path.relpath(filepath, typedir)] = {
+                    'blob': digest,
+                    'size': st.st_size,
+                    'mode': st.st_mode & 0o777
+                }
+                stats['files'] += 1
+                stats['bytes'] += st.st_size
+                if digest not in seen:
+                    seen.add(digest)
+                    stats['blobs'] += 1
+                    stats['storedBytes'] += st.st_size
+        manifest['dirs'].sort()
+        manifest_path = get_manifest_path(srcdata_path, plugin_type)
+        temp_path = '%s.%d.tmp' % (manifest_path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        os.rename(temp_path, manifest_path)
+        if remove:
+            su.rmtree(typedir, onerror=rmtree_onerror)
+    return stats
+
+_template_archives = {}
+
+def open_template_archive(path):
+    '''
+    Open the template bundle, zip or tar file at ``path``.
+    
+    Archives stay open and are reused by later calls 
+    until the file is modified.
+    
+    :return: a :py:class:`TemplateArchive` or None if ``path`` 
+        isn't a file or not in one of the supported formats.
+    '''
+    if path is None or not os.path.isfile(path):
+        return None
+    realpath = os.path.realpath(path)
+    archive = _template_archives.get(realpath)
+    if archive is not None:
+        if archive.mtime == os.stat(realpath).st_mtime:
+            return archive
+        archive.close()
+    with open(realpath, 'rb') as f:
+        magic = f.read(len(BUNDLE_MAGIC))
+    import tarfile
+    import zipfile
+    if magic == BUNDLE_MAGIC:
+        cls = TemplateBundle
+    elif zipfile.is_zipfile(realpath):
+        cls = ZipTemplateArchive
+    elif tarfile.is_tarfile(realpath):
+        cls = TarTemplateArchive
+    else:
+        return None
+    archive = cls(realpath)
+    _template_archives[realpath] = archive
+    return archive
+
+def read_source_file(path):
+    '''
+    Return the contents of the file at ``path``, which 
+    may also point to a file within a :py:class:`TemplateArchive`, 
+    e.g. ``c4dplugwiz_data.c4dtpl/rules.py``.
+    '''
+    if not os.path.isfile(path):
+        archive_path = path
+        while not os.path.isfile(archive_path):
+            parent = os.path.dirname(archive_path)
+            if parent == archive_path:
+                break
+            archive_path = parent
+        archive = open_template_archive(archive_path)
+        if archive is not None:
+            name = os.path.relpath(path, archive_path).replace(os.sep, '/')
+            if archive.isfile(name):
+                return archive.read(name)
+    with open(path, 'rb') as f:
+        return f.read()
+
+def pack_templates(srcdata_path, bundle_path):
+    '''
+    Compile the source data repository at ``srcdata_path`` into a 
+    :py:class:`TemplateBundle` at ``bundle_path``.
+    
+    The bundle holds all plugin types, from folder structures and manifests, 
+    as well as the repository's rules file. Files with equal contents are 
+    stored only once.
+    
+    :return: dict with the number of entries, of distinct contents 
+        among them and the size of the bundle in bytes.
+    '''
+    srcdata_path = unicode(srcdata_path)
+    entries = []                # [path, sha1 (offset once written), size, flags, mode]
+    contents = OrderedDict()    # sha1 -> contents
+    
+    def add_file(name, content, mode):
+        digest = hashlib.sha1(content).hexdigest()
+        contents.setdefault(digest, content)
+        flags = 0
+        if TemplateIndex._scan_content(content, [])['binary']:
+            flags |= BUNDLE_FLAG_BINARY
+        entries.append([name, digest, len(content), flags, mode])
+    
+    for plugin_type in list_plugin_types(srcdata_path):
+        typedir = os.path.join(srcdata_path, plugin_type)
+        entries.append([plugin_type, 0, 0, BUNDLE_FLAG_DIR, 0o755])
+        if os.path.isdir(typedir):
+            for dirpath, dirnames, filenames in os.walk(typedir):
+                dirnames[:] = [d for d in sorted(dirnames) if d not in DEFAULT_DIR_EXCLUDES]
+                for dirname in dirnames:
+                    relpath = os.path.relpath(os.path.join(dirpath, dirname), srcdata_path)
+                    entries.append([relpath.replace(os.sep, '/'), 0, 0, BUNDLE_FLAG_DIR, 0o755])
+                for filename in sorted(filenames):
+                    if filename in DEFAULT_FILE_EXCLUDES:
+                        continue
+                    filepath = os.path.join(dirpath, filename)
+                    with open(filepath, 'rb') as f:
+                        content = f.read()
+                    relpath = os.path.relpath(filepath, srcdata_path).replace(os.sep, '/')
+                    add_file(relpath, content, os.stat(filepath).st_mode & 0o777)
+        else:
+            manifest = read_manifest(srcdata_path, plugin_type)
+            store = BlobStore(os.path.join(srcdata_path, DEFAULT_BLOBDIR))
+            for relpath in manifest['dirs']:
+                entries.append(['%s/%s' % (plugin_type, relpath.replace(os.sep, '/')), 0, 0, BUNDLE_FLAG_DIR, 0o755])
+            for relpath, item in sorted(manifest['files'].iteritems()):
+                name = '%s/%s' % (plugin_type, relpath.replace(os.sep, '/'))
+                add_file(name, store.read(item['blob']), item['mode'])
+    rules_filepath = os.path.join(srcdata_path, DEFAULT_RULES_FILENAME)
+    if os.path.isfile(rules_filepath):
+        with open(rules_filepath, 'rb') as f:
+            add_file(DEFAULT_RULES_FILENAME, f.read(), 0o644)
+    
+    offsets = {}
+    offset = 0
+    for digest, content in contents.iteritems():
+        offsets[digest] = offset
+        offset += len(content)
+    for entry in entries:
+        entry[1] = offsets.get(entry[1], 0)
+    header = json.dumps({'version': 1, 'entries': entries}, separators=(',', ':'))
+    if isinstance(header, unicode):
+        header = header.encode('utf-8')
+    temp_path = '%s.%d.tmp' % (bundle_path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(struct.pack(BUNDLE_PREFIX_FORMAT, BUNDLE_MAGIC, len(header)))
+        f.write(header)
+        for content in contents.itervalues():
+            f.write(content)
+    if os.path.exists(bundle_path):
+        os.remove(bundle_path)
+    os.rename(temp_path, bundle_path)
+    return {'entries': len(entries), 'contents': len(contents), 'bytes': os.path.getsize(bundle_path)}
+
+def cpu_time():
+    '''Return the CPU time (user + system) this process used so far, in seconds.'''
+    # os.times only counts clock ticks (10 ms on most systems)
+    resource = optional_import('resource')
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    times = os.times()
+    return times[0] + times[1]
+
+def _make_rss_reader():
+    # platform specific, returns a function returning the RSS in bytes, or None
+    ctypes = optional_import('ctypes')
+    if 'darwin' in sys.platform and ctypes is not None:
+        class MachTaskBasicInfo(ctypes.Structure):
+            _fields_ = [('virtual_size', ctypes.c_uint64), ('resident_size', ctypes.c_uint64), 
+                        ('resident_size_max', ctypes.c_uint64), ('user_time', ctypes.c_int32 * 2), 
+                        ('system_time', ctypes.c_int32 * 2), ('policy', ctypes.c_int32), 
+                        ('suspend_count', ctypes.c_int32)]
+        libc = ctypes.CDLL('/usr/lib/libSystem.dylib')
+        task = ctypes.c_uint32.in_dll(libc, 'mach_task_self_')
+        def read():
+            info = MachTaskBasicInfo()
+            count = ctypes.c_uint32(ctypes.sizeof(info) // ctypes.sizeof(ctypes.c_uint32))
+            if libc.task_info(task, MACH_TASK_BASIC_INFO, ctypes.byref(info), ctypes.byref(count)) != 0:
+                return None
+            return info.resident_size
+        return read
+    elif sys.platform == 'win32' and ctypes is not None:
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.c_uint32), ('PageFaultCount', ctypes.c_uint32)] + \
+                       [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 
+                                                            'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage', 
+                                                            'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 
+                                                            'PagefileUsage', 'PeakPagefileUsage')]
+        get_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_process.restype = ctypes.c_void_p
+        get_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        def read():
+            counters = ProcessMemoryCounters()
+            counters.cb = ctypes.sizeof(counters)
+            if not get_info(ctypes.c_void_p(get_process()), ctypes.byref(counters), counters.cb):
+                return None
+            return counters.WorkingSetSize
+        return read
+    elif os.path.isfile('/proc/self/statm'):
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        def read():
+            with open('/proc/self/statm', 'rb') as f:
+                return int(f.read().split()[1]) * page_size
+        return read
     return None
 
+_rss_reader = _MISSING
+
+def current_rss():
+    '''
+    Return the current resident set size of this process in bytes, 
+    or None if unknown. Unlike ``ru_maxrss``, which only ever grows, 
+    this also goes down when memory is given back.
+    
+    Uses ``task_info`` on OS X, ``GetProcessMemoryInfo`` on Windows 
+    and ``/proc/self/statm`` on Linux.
+    '''
+    global _rss_reader
+    try:
+        if _rss_reader is _MISSING:
+            _rss_reader = _make_rss_reader()
+        if _rss_reader is not None:
+            return _rss_reader()
+    except (OSError, IOError, AttributeError, ValueError):
+        _rss_reader = None
+    return None
+
+def percentile(values, percent):
+    '''Return the ``percent`` percentile of ``values`` (nearest rank), or None if empty.'''
+    if len(values) == 0:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+def summarize_history(records, by=None, plugin_type=None):
+    '''
+    Summarize :py:class:`RunHistory` records per plugin type and, if 
+    ``by`` is ``'day'``, ``'week'`` or ``'month'``, per period.
+    
+    :return: list of dicts with ``type``, ``period`` (None without ``by``), 
+        ``runs``, ``first`` and ``last`` (times), ``p50`` and ``p95`` wall 
+        seconds, ``filesPerSec`` and ``mbPerSec`` (medians), ``phases`` 
+        (median wall seconds per phase) and ``cache`` (mean hit rates), 
+        sorted by type and period.
+    '''
+    formats = {'day': '%Y-%m-%d', 'week': '%Y-W%W', 'month': '%Y-%m'}
+    groups = OrderedDict()
+    for record in records:
+        if plugin_type is not None and record.get('type') != plugin_type:
+            continue
+        period = None if by is None else time.strftime(formats[by], time.localtime(record['time']))
+        groups.setdefault((record.get('type'), period), []).append(record)
+    result = []
+    for (rtype, period), runs in sorted(groups.items()):
+        walls = [r['wall'] for r in runs]
+        timed = [r for r in runs if r['wall'] > 0]
+        phases = {}
+        for r in runs:
+            for phase, wall in r.get('phases', {}).items():
+                phases.setdefault(phase, []).append(wall)
+        cache = {}
+        for name in ('index', 'textfx'):
+            rates = [r['cache'][name] for r in runs if r.get('cache', {}).get(name) is not None]
+            cache[name] = sum(rates) / len(rates) if len(rates) > 0 else None
+        result.append({
+            'type': rtype,
+            'period': period,
+            'runs': len(runs),
+            'first': min(r['time'] for r in runs),
+            'last': max(r['time'] for r in runs),
+            'p50': percentile(walls, 50),
+            'p95': percentile(walls, 95),
+            'filesPerSec': percentile([r['files'] / r['wall'] for r in timed], 50),
+            'mbPerSec': percentile([r['bytes'] / r['wall'] / (1024.0 * 1024.0) for r in timed], 50),
+            'phases': dict((phase, percentile(values, 50)) for phase, values in phases.items()),
+            'cache': cache
+        })
+    return result
+
+def format_frame(filename, lineno, name):
+    '''Name of a stack frame in collapsed stacks, e.g. ``c4dplugwiz.py:1542(render_line)``.'''
+    return '%s:%d(%s)' % (os.path.basename(filename), lineno, name)
+
+def write_collapsed_stacks(stacks, path):
+    '''
+    Write ``stacks``, a dict of ``{tuple of frame names: count}`` with the 
+    outermost frame first, to ``path`` in the collapsed stack format 
+    read by flame graph tools: one ``frame;frame;frame count`` line per stack.
+    '''
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write('%s %d\n' % (';'.join(stack), count))
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+
+def profile_stacks(stats, max_depth=PROFILE_MAX_DEPTH):
+    '''
+    Collapsed stacks from a :py:class:`pstats.Stats` object.
+    
+    cProfile only records pairs of caller and callee, not whole stacks, 
+    so the time of a function is split between its callers in proportion 
+    to the time spent at each call site.
+    
+    :return: dict of ``{tuple of frame names: microseconds}``.
+    '''
+    entries = stats.stats
+    children = {}
+    for func, entry in entries.items():
+        for caller, edge in entry[4].items():
+            children.setdefault(caller, []).append((func, edge[3]))
+    stacks = {}
+    def walk(func, frames, funcs, time):
+        tt, ct = entries[func][2:4]
+        if ct <= 0:
+            return
+        scale = min(1.0, time / ct)
+        frames = frames + (format_frame(*func),)
+        own = int(tt * scale * 1e6)
+        if own > 0:
+            stacks[frames] = stacks.get(frames, 0) + own
+        if len(frames) >= max_depth:
+            return
+        for child, child_time in children.get(func, ()):
+            # skip recursion and call sites below 1 microsecond
+            if child not in funcs and child_time * scale >= 1e-6:
+                walk(child, frames, funcs | set([child]), child_time * scale)
+    for func, entry in entries.items():
+        if len(entry[4]) == 0:
+            walk(func, (), set([func]), entry[3])
+    return stacks
+
+def save_profile(profiler, path, top=PROFILE_TOP, stream=None):
+    '''
+    Save the results of a :py:class:`cProfile.Profile` to ``path`` 
+    (for :py:mod:`pstats`) and as collapsed stacks next to it, then 
+    print the ``top`` functions by own time to ``stream`` (stderr by default).
+    
+    :return: path to the collapsed stacks file.
+    '''
+    import pstats
+    if stream is None:
+        stream = sys.stderr
+    profiler.dump_stats(path)
+    stats = pstats.Stats(path, stream=stream)
+    collapsed_path = os.path.splitext(path)[0] + PROFILE_COLLAPSED_EXT
+    write_collapsed_stacks(profile_stacks(stats), collapsed_path)
+    print("Profile written to '%s', collapsed stacks to '%s'." % (path, collapsed_path), file=stream)
+    print("Top %d functions by own time:" % top, file=stream)
+    stats.strip_dirs().sort_stats('tottime').print_stats(top)
+    return collapsed_path
+
 def format_relpath(path, start=os.curdir):
     '''
     Make ``path`` into a relative path with ``start`` 
@@ -1164,6 +4104,10 @@ def truncate_path(path, max_size, alignment, ellipsis="..."):
 def is_valid_path(path):
     return os.path.isdir(path)
 
+def is_valid_source(path):
+    '''Tell if ``path`` is a source data folder or a :py:class:`TemplateArchive`.'''
+    return is_valid_path(path) or open_template_archive(path) is not None
+
 
 def is_valid_plugin_id(someId):
     ''' Test if 'someId' is a valid Plugin Cafe ID. '''
@@ -1181,35 +4125,70 @@ def is_valid_plugin_name(someName):
     return (len(someName) > 0)
 
 def get_author_name():
-    result = None
+    '''
+    Return the full name of the logged on user, to be used as author name.
+    
+    The environment variable ``C4DPLUGWIZ_AUTHORNAME`` takes precedence. 
+    Otherwise the name is asked from the OS, which on OS X means running 
+    ``osascript``, so the result is kept in memory and in the cache dir 
+    for ``AUTHOR_CACHE_TTL`` seconds.
+    '''
     if DEFAULT_ENV_AUTHOR in os.environ:
-        result = os.environ[DEFAULT_ENV_AUTHOR]
+        return os.environ[DEFAULT_ENV_AUTHOR]
+    if get_author_name.cached is not None:
+        return get_author_name.cached
+    cache_filepath = os.path.join(get_cache_path(), 'author.json')
+    try:
+        with open(cache_filepath, 'rb') as f:
+            cache = json.load(f)
+        if 0 <= time.time() - cache['time'] < AUTHOR_CACHE_TTL:
+            get_author_name.cached = cache['name']
+            return cache['name']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    result = _lookup_author_name()
+    get_author_name.cached = result
+    if not result:
+        # don't keep a failed lookup around for days
+        return result
+    try:
+        dirpath = os.path.dirname(cache_filepath)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        with open(cache_filepath, 'wb') as f:
+            json.dump({'name': result, 'time': time.time()}, f)
+    except (IOError, OSError):
+        pass
+    return result
+get_author_name.cached = None
+
+def _lookup_author_name():
+    fulluser = None
+    if g_osx:
+        from subprocess import Popen, PIPE
+        user = os.environ['USER']
+        try:
+            out, err = Popen(
+                ['/bin/sh -c "osascript -e \'long user name of (system info)\'"'],
+                stdout=PIPE, shell=True
+            ).communicate()
+            if err: 
+                print(err)
+            else:
+                fulluser = out
+        except:
+            fulluser = user
+    elif g_win:
+        user = os.environ['USERNAME']
+        try:
+            import win32api # IGNORE:F0401 @UnresolvedImport
+            fulluser = win32api.GetUserName()
+        except:
+            fulluser = user
+    if fulluser is None:
+        result = "Unknown Author"
     else:
-        fulluser = None
-        if g_osx:
-            user = os.environ['USER']
-            try:
-                out, err = Popen(
-                    ['/bin/sh -c "osascript -e \'long user name of (system info)\'"'],
-                    stdout=PIPE, shell=True
-                ).communicate()
-                if err: 
-                    print(err)
-                else:
-                    fulluser = out
-            except:
-                fulluser = user
-        elif g_win:
-            user = os.environ['USERNAME']
-            try:
-                import win32api # IGNORE:F0401 @UnresolvedImport
-                fulluser = win32api.GetUserName()
-            except:
-                fulluser = user
-        if fulluser is None:
-            result = "Unknown Author"
-        else:
-            result = fulluser.strip() # IGNORE:E1103
+        result = fulluser.strip() # IGNORE:E1103
     return result
 
 
@@ -1219,6 +4198,16 @@ def get_company_name():
         return os.environ[DEFAULT_ENV_ORG]
     return default
 
+def get_cache_path():
+    '''
+    Return the path to the dir where local caches, such 
+    as template indexes, are kept. Can be set with the 
+    environment variable ``C4DPLUGWIZ_CACHE``.
+    '''
+    if DEFAULT_ENV_CACHE in os.environ:
+        return os.environ[DEFAULT_ENV_CACHE]
+    return os.path.expanduser(DEFAULT_CACHEDIR)
+
 def get_data_path():
     default = os.path.realpath(DEFAULT_DATADIR)
     if DEFAULT_ENV_DATA in os.environ:
@@ -1250,6 +4239,7 @@ def system(cmd, args=None):
         args = ["'{}'".format(s.replace(r'\\', r'\\\\')
                                .replace("'", r"\'")) for s in args]
         fullcmd = "%s %s" % (cmd, ' '.join(args))
+    from subprocess import Popen, PIPE
     out, err = Popen(fullcmd, stdout=PIPE, shell=True).communicate()
     system.out = out
     system.err = err
@@ -1298,14 +4288,218 @@ def copytree_ignore(src, names):  # IGNORE:W0613
 CONFIG_DEFAULT = {
     'pluginId': str(PLUGIN_ID_TESTING),    # required
     'pluginName': 'Unnamed Plugin',        # optional
-    'author': get_author_name(),           # optional
-    'org': get_company_name(),             # optional
+    'author': None,                        # optional, if None looked up when needed, see get_author_name()
+    'org': None,                           # optional, if None taken from the environment when needed
     'rulesFile': None,                     # optional, will be set later by search in sourcedata_path
     'srcdataPath': get_data_path(),        # required
     'excludedFiles': DEFAULT_EXCLUDES      # optional
 }
 
 
+def main_index(argv):
+    '''
+    ``c4dplugwiz index``: create or refresh the :py:class:`TemplateIndex` 
+    of a source data repository and print a summary.
+    
+    :param list argv: the arguments following ``index``.
+    '''
+    from argparse import ArgumentParser
+    try:
+        parser = ArgumentParser(prog="c4dplugwiz index", 
+                                description="Scan a source data repository and store an index of its "
+                                            "templates, so later runs don't need to walk it again.")
+        parser.add_argument('-s', '--source-data', dest='src', help="path to rootdir with source folder structures, or a template bundle, zip or tar file. You can also set the environment variable '" + DEFAULT_ENV_DATA + "'. [default: %(default)s]")
+        parser.add_argument('-i', '--index-file', dest='index_file', metavar='path', help="where to store the index. [default: a file in '" + get_cache_path() + "']")
+        parser.add_argument('--rebuild', dest='rebuild', action='store_true', help="rebuild the index even if it seems current.")
+        parser.add_argument('--deep', dest='deep', action='store_true', help="also check size and modification time of every file to decide if the index is current.")
+        parser.add_argument('--check', dest='check', action='store_true', help="only check if the index is current. Exits with 1 if it isn't.")
+        parser.add_argument('--json', dest='json', action='store_true', help="print the index as JSON.")
+        parser.set_defaults(src=get_data_path())
+        args = parser.parse_args(argv)
+        
+        source_datapath = canonicalize_path(args.src)
+        if not is_valid_source(source_datapath):
+            raise CLIError("E: source data path invalid.")
+        index = TemplateIndex(source_datapath, args.index_file)
+        if args.check:
+            stale = not index.load() or index.is_stale(check_files=args.deep)
+            print("Index at '%s' is %s." % (index.index_path, "stale" if stale else "current"))
+            return 1 if stale else 0
+        index.update(rebuild=args.rebuild, check_files=args.deep)
+        if args.json:
+            print(json.dumps(index.data, indent=1, sort_keys=True))
+            return 0
+        print("Index of '%s' at '%s'" % (index.srcdir, index.index_path))
+        print("")
+        for plugin_type in index.plugin_types:
+            files = index.files(plugin_type)
+            size = sum(entry['size'] for entry in files.itervalues())
+            binary = sum(1 for entry in files.itervalues() if entry['binary'])
+            print("%s: %d files (%d binary), %d bytes" % (plugin_type, len(files), binary, size))
+            print("   rules file: %s" % index.rules_file(plugin_type))
+            print("   tokens: %s" % ", ".join(index.tokens(plugin_type)))
+            print("   rule keys: %s" % ", ".join(index.rule_keys(plugin_type)))
+            print("")
+        return 0
+    except Exception as e:
+        if DEBUG or TESTRUN:
+            raise(e)
+        sys.stderr.write("%s%s" % (str(e), os.linesep))
+        return 2
+
+
+def main_dedup(argv):
+    '''
+    ``c4dplugwiz dedup``: move the template folder structures of a source 
+    data repository into its blob store (see :py:func:`dedup_templates`).
+    
+    :param list argv: the arguments following ``dedup``.
+    '''
+    from argparse import ArgumentParser
+    try:
+        parser = ArgumentParser(prog="c4dplugwiz dedup", 
+                                description="Store template folder structures in a content-addressed blob store "
+                                            "with one manifest per plugin type, so that files shared between "
+                                            "plugin types are only stored once.")
+        parser.add_argument('-s', '--source-data', dest='src', help="path to rootdir with source folder structures. You can also set the environment variable '" + DEFAULT_ENV_DATA + "'. [default: %(default)s]")
+        parser.add_argument('-t', '--type', dest='plugin_types', action='append', metavar='plugin_type', help="plugin type to store. Can be given more than once. [default: all]")
+        parser.add_argument('--remove', dest='remove', action='store_true', help="delete the folder structures after storing them, so that their manifests are used.")
+        parser.set_defaults(src=get_data_path())
+        args = parser.parse_args(argv)
+        
+        source_datapath = canonicalize_path(args.src)
+        if not is_valid_path(source_datapath):
+            raise CLIError("E: source data path invalid.")
+        stats = dedup_templates(source_datapath, args.plugin_types, remove=args.remove)
+        print("Stored %d files as %d blobs: %d of %d bytes." % 
+              (stats['files'], stats['blobs'], stats['storedBytes'], stats['bytes']))
+        return 0
+    except Exception as e:
+        if DEBUG or TESTRUN:
+            raise(e)
+        sys.stderr.write("%s%s" % (str(e), os.linesep))
+        return 2
+
+
+def main_pack(argv):
+    '''
+    ``c4dplugwiz pack``: compile a source data repository into a 
+    single :py:class:`TemplateBundle` file (see :py:func:`pack_templates`).
+    
+    :param list argv: the arguments following ``pack``.
+    '''
+    from argparse import ArgumentParser
+    try:
+        parser = ArgumentParser(prog="c4dplugwiz pack", 
+                                description="Compile a source data repository into one template bundle file, "
+                                            "which can then be passed to -s/--source-data.")
+        parser.add_argument('-s', '--source-data', dest='src', help="path to rootdir with source folder structures. You can also set the environment variable '" + DEFAULT_ENV_DATA + "'. [default: %(default)s]")
+        parser.add_argument('-o', '--output', dest='output', metavar='path', help="path of the bundle file. [default: source data path + '" + DEFAULT_BUNDLE_EXT + "']")
+        parser.set_defaults(src=get_data_path())
+        args = parser.parse_args(argv)
+        
+        source_datapath = canonicalize_path(args.src)
+        if not is_valid_path(source_datapath):
+            raise CLIError("E: source data path invalid.")
+        output = args.output
+        if output is None:
+            output = source_datapath.rstrip(os.sep) + DEFAULT_BUNDLE_EXT
+        stats = pack_templates(source_datapath, output)
+        print("Packed %d entries (%d distinct contents) into '%s': %d bytes." % 
+              (stats['entries'], stats['contents'], output, stats['bytes']))
+        return 0
+    except Exception as e:
+        if DEBUG or TESTRUN:
+            raise(e)
+        sys.stderr.write("%s%s" % (str(e), os.linesep))
+        return 2
+
+
+def main_stats(argv):
+    '''
+    ``c4dplugwiz stats``: summarize the run history (see :py:class:`RunHistory`) 
+    with the median and 95th percentile time and the throughput per plugin type.
+    
+    :param list argv: the arguments following ``stats``.
+    '''
+    from argparse import ArgumentParser
+    try:
+        parser = ArgumentParser(prog="c4dplugwiz stats", 
+                                description="Summarize the times and throughput of past generation runs "
+                                            "per plugin type, to see how template or rules changes affect them.")
+        parser.add_argument('--history', dest='history', metavar='path', help="path to the run history. [default: '" + DEFAULT_HISTORY_FILENAME + "' in the cache dir]")
+        parser.add_argument('-t', '--type', dest='plugin_type', help="only summarize runs of this plugin type.")
+        parser.add_argument('--by', dest='by', choices=['day', 'week', 'month'], help="summarize per period, to see trends. [default: all runs at once]")
+        parser.add_argument('--json', dest='json', action='store_true', help="print the summary as JSON.")
+        args = parser.parse_args(argv)
+        
+        history = RunHistory(args.history)
+        rows = summarize_history(history.records(), by=args.by, plugin_type=args.plugin_type)
+        if args.json:
+            print(json.dumps(rows, indent=1, sort_keys=True))
+            return 0
+        if len(rows) == 0:
+            print("No runs recorded in '%s'." % history.path)
+            return 0
+        def rate(value):
+            return '-' if value is None else '%.0f%%' % (value * 100.0)
+        def number(value, fmt):
+            return '-' if value is None else fmt % value
+        print("%-20s %-10s %6s %9s %9s %9s %8s %6s %6s" % 
+              ('type', 'period', 'runs', 'p50 ms', 'p95 ms', 'files/s', 'MB/s', 'index', 'textfx'))
+        for row in rows:
+            print("%-20s %-10s %6d %9.1f %9.1f %9s %8s %6s %6s" % 
+                  (row['type'], row['period'] or 'all', row['runs'], row['p50'] * 1000.0, row['p95'] * 1000.0, 
+                   number(row['filesPerSec'], '%.1f'), number(row['mbPerSec'], '%.2f'), 
+                   rate(row['cache']['index']), rate(row['cache']['textfx'])))
+        return 0
+    except Exception as e:
+        if DEBUG or TESTRUN:
+            raise(e)
+        sys.stderr.write("%s%s" % (str(e), os.linesep))
+        return 2
+
+
+def positive_float(value):
+    '''Argument type for options which need a number greater than zero.'''
+    from argparse import ArgumentTypeError
+    try:
+        number = float(value)
+    except ValueError:
+        raise ArgumentTypeError("invalid number: %r" % value)
+    if not number > 0:
+        raise ArgumentTypeError("must be greater than zero: %r" % value)
+    return number
+
+def check_optional_values(args, options):
+    '''
+    Options with an optional value, e.g. ``--profile [path]``, take the next 
+    argument as their value, so in ``--profile 1000002 "My Plugin"`` the plugin 
+    id ends up as the path and the plugin name as the plugin id. 
+    
+    :param options: dict of ``{option: (dest, metavar)}`` to check.
+    :raise: CLIError if the value of one of ``options`` looks like a plugin 
+        id while the positional arguments are incomplete without it.
+    '''
+    if args.plugin_id is not None and args.plugin_name is not None:
+        return
+    for option, (dest, metavar) in sorted(options.iteritems()):
+        value = getattr(args, dest)
+        try:
+            int(value)
+        except (TypeError, ValueError):
+            continue
+        raise CLIError("E: %s took the plugin id '%s' as its value. Use %s=%s, or put %s after the plugin id and name." % 
+                       (option, value, option, metavar, option))
+
+COMMANDS = {
+    'index': main_index,
+    'dedup': main_dedup,
+    'pack': main_pack,
+    'stats': main_stats
+}
+
+
 def main(argv=None, extend=True):  # IGNORE:C0111
     '''
     :param list argv: a list of arguments to use instead of ``sys.argv``.
@@ -1321,6 +4515,9 @@ def main(argv=None, extend=True):  # IGNORE:C0111
         else:
             sys.argv = argv
     
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        return COMMANDS[sys.argv[1]](sys.argv[2:])
+    
     program_name = "c4dplugwiz"  # IGNORE:W0612 @UnusedVariable
     program_version = "v%s" % __versionstr__
     program_build_date = str(__updated__)
@@ -1339,22 +4536,38 @@ def main(argv=None, extend=True):  # IGNORE:C0111
 
 ''' % (program_shortdesc, str(__date__))
 
+    from argparse import ArgumentParser, RawDescriptionHelpFormatter
+    profiler = None
+    sampler = None
+    memory = None
+    filesystem = None
     try:
         # Setup argument parser
         parser = ArgumentParser(description=program_license, formatter_class=RawDescriptionHelpFormatter)
         
         # flags (optional)
         parser.add_argument('-l', '--list-tokens', dest='list_tokens', action="store_true", help="list available tokens plus forms and exit.")
+        parser.add_argument('-e', '--examples', dest='examples', action="store_true", help="with --list-tokens, also show the value of each token for the given id, name, author and org.")
+        parser.add_argument('--only', dest='datums', action='append', metavar='datum', help="with --list-tokens, only list tokens of this datum, e.g. 'PluginName'. Can be given more than once.")
         parser.add_argument("-v", "--verbose", dest="verbose", action="count", help="set verbosity level [default: %(default)s]")
         parser.add_argument('-V', '--version', action='version', version=program_version_message)
         parser.add_argument('-f', '--force', dest='overwrite', action="store_true", help="overwrite existing target folders [default: %(default)s]")
         parser.add_argument('-c', '--create-rootdir', dest='createdir', action="store_true", help="create destination path if it doesn't exist [default: %(default)s]")
         parser.add_argument('-t', '--type', dest="plugin_type", help="type of plugin to create. Determines which subfolder is used from the sourcedata rootdir [default: %(default)s]")
-        parser.add_argument('-s', '--source-data', dest='src', help="path to rootdir with source folder structures. Must have one folder structure per plugin type. You can also set the environment variable '" + DEFAULT_ENV_DATA + "'. [default: %(default)s]")
+        parser.add_argument('-s', '--source-data', dest='src', help="path to rootdir with source folder structures, or a template bundle (see 'c4dplugwiz pack'), zip or tar file of it. Must have one folder structure per plugin type. You can also set the environment variable '" + DEFAULT_ENV_DATA + "'. [default: %(default)s]")
         parser.add_argument('-r', '--rules-file-name', dest='rules_file', metavar='str', help="rules file name. If None, looks for a file 'rules.py' relative to the main data dir or relative to each plugin type's template folder structure. If this is None, falls back to looking in the sourcedata rootdir. [default: %(default)s]")
-        parser.add_argument('-a', '--author', dest='author', help="name of the plugin author to be used in file/rootdir name replacements. You can also set the environment variable '" + DEFAULT_ENV_AUTHOR + "'. [default: %(default)s]")
-        parser.add_argument('-o', '--org', dest='org', help="name of the organization the author belongs to, used for file/rootdir name replacements. You can also set the environment variable '" + DEFAULT_ENV_ORG + "'. [default: %(default)s]")
+        parser.add_argument('-a', '--author', dest='author', help="name of the plugin author to be used in file/rootdir name replacements. You can also set the environment variable '" + DEFAULT_ENV_AUTHOR + "'. [default: full name of the logged on user]")
+        parser.add_argument('-o', '--org', dest='org', help="name of the organization the author belongs to, used for file/rootdir name replacements. You can also set the environment variable '" + DEFAULT_ENV_ORG + "'. [default: none]")
         parser.add_argument('-d', '--destination', dest='dest', help="name of the destination folder. [default: %(default)s]")
+        parser.add_argument('--timeout', dest='timeout', type=float, metavar='seconds', help="give up after this many seconds. The partially generated plugin is removed, an overwritten plugin is put back. [default: %(default)s]")
+        parser.add_argument('--stats', dest='stats', nargs='?', const='text', metavar='format', help="after generating, print wall and CPU time, files, bytes and throughput per phase as a table or, with --stats=json, as JSON. Formats are 'text' and 'json', given as --stats=format (with a space, the next argument is taken as the format, e.g. the plugin id). Sent as a 'stats' event with --events. [default: %(default)s]")
+        parser.add_argument('--profile', dest='profile', nargs='?', const=DEFAULT_PROFILE_FILENAME, metavar='path', help="profile this run with cProfile. Writes pstats data to path, given as --profile=path (with a space, the next argument is taken as the path, e.g. the plugin id), collapsed stacks for flame graph tools next to it, and prints the slowest functions to stderr. [default: %(default)s, with --profile: " + DEFAULT_PROFILE_FILENAME + "]")
+        parser.add_argument('--trace-memory', dest='trace_memory', action='store_true', help="after generating, print the resident memory at the start and end of each phase and the object types with the most new objects. Only objects tracked by the garbage collector are counted, and counting them slows the run down. Sent as a 'memory' event with --events. [default: %(default)s]")
+        parser.add_argument('--count-fs', dest='count_fs', action='store_true', help="after generating, print the number and latency of filesystem operations per phase. Sent as a 'filesystem' event with --events. [default: %(default)s]")
+        parser.add_argument('--sample', dest='sample', nargs='?', const=DEFAULT_SAMPLES_FILENAME, metavar='path', help="profile this run by sampling stacks, with less overhead than --profile. Writes collapsed stacks for flame graph tools to path, given as --sample=path (with a space, the next argument is taken as the path, e.g. the plugin id), while running and at the end. [default: %(default)s, with --sample: " + DEFAULT_SAMPLES_FILENAME + "]")
+        parser.add_argument('--sample-rate', dest='sample_rate', type=positive_float, metavar='Hz', default=SAMPLING_RATE, help="stack samples per second taken with --sample. [default: %(default)s]")
+        parser.add_argument('--no-history', dest='history', action='store_false', help="don't add this run to the run history in the cache dir, see 'c4dplugwiz stats'. Recording the history times every phase of the run, which adds a little overhead, so use this e.g. when measuring.")
+        parser.add_argument('--events', dest='events', choices=['ndjson'], help="stream progress events to stdout, one JSON object per line. Turns off verbose output. [default: %(default)s]")
         
         # positional arguments (required)
         parser.add_argument(dest="plugin_id", help="unique ID of the plugin (obtained from www.PluginCafe.com)", metavar="id", nargs="?")
@@ -1362,8 +4575,9 @@ def main(argv=None, extend=True):  # IGNORE:C0111
         
         # Environment variable defaults
         default_source = get_data_path()
-        default_author = get_author_name()
-        default_org = get_company_name()
+        # author and org are looked up by the wizard when needed
+        default_author = None
+        default_org = None
 
         parser.set_defaults(src=default_source, plugin_type=PLUGIN_TYPE_DEFAULT, 
                             author=default_author, org=default_org, verbose=0, 
@@ -1372,9 +4586,57 @@ def main(argv=None, extend=True):  # IGNORE:C0111
         # Process arguments
         args = parser.parse_args()
         
+        # validate before starting to profile, so a failed 
+        # invocation doesn't leave any output behind
+        if not args.list_tokens:
+            check_optional_values(args, {'--profile': ('profile', 'path'), '--sample': ('sample', 'path'), 
+                                         '--stats': ('stats', 'format')})
+            if args.plugin_id is None:
+                raise CLIError("E: missing plugin id.")
+            if args.plugin_name is None:
+                raise CLIError("E: missing plugin name.")
+            if args.src is None or not is_valid_source(canonicalize_path(args.src)):
+                raise CLIError("E: source data path invalid.")
+        
+        if args.stats not in (None, 'text', 'json'):
+            raise CLIError("E: invalid --stats format '%s', choose from 'text' and 'json'." % args.stats)
+        
+        # fail before the run instead of losing its profile after it
+        for option, path in (('--profile', args.profile), ('--sample', args.sample)):
+            if path is not None:
+                dirpath = os.path.dirname(os.path.abspath(path))
+                if not os.path.isdir(dirpath) or not os.access(dirpath, os.W_OK):
+                    raise CLIError("E: can't write %s output to '%s': folder doesn't exist or isn't writable." % 
+                                   (option, path))
+        
+        if args.profile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if args.sample is not None:
+            sampler = SamplingProfiler(args.sample, rate=args.sample_rate)
+            sampler.start()
+        
         global g_verbose  # IGNORE:W0601
         
         g_verbose = args.verbose
+        events = None
+        if args.events == 'ndjson':
+            # stdout belongs to the event stream
+            g_verbose = 0
+            events = NDJSONEventWriter(sys.stdout)
+        stats = None
+        if args.stats is not None or args.history:
+            stats = events = GenerationStats(events)
+        if args.trace_memory:
+            memory = events = MemoryTracer(events)
+            memory.start()
+        if args.count_fs:
+            filesystem = events = FileSystemCounter(events)
+            filesystem.start()
+        cancel = None
+        if args.timeout is not None:
+            cancel = CancellationToken(timeout=args.timeout)
         list_tokens = args.list_tokens
         paths = [args.dest]
         plugin_id = args.plugin_id
@@ -1402,15 +4664,16 @@ def main(argv=None, extend=True):  # IGNORE:C0111
         if rules_file:
             config['rulesFile'] = rules_file
         
-        # Steps
-        # 1. Create and setup wizard. 
-        
-        # This also creates and fills the token table
-        # as well as the rules list.
-        pw = PluginWizard(config, plugin_type)
-
         if list_tokens:
-            # print token table to stdout and exit
+            # served from class level metadata, no need to 
+            # look at the source data or set up a wizard
+            datums = args.datums
+            if datums is not None:
+                unknown = [d for d in datums if d not in PluginWizard.token_forms]
+                if len(unknown) > 0:
+                    raise CLIError("E: unknown datum: %s. Choose from %s" % 
+                                   (", ".join(unknown), ", ".join(sorted(PluginWizard.token_forms))))
+            table = TokenTable.for_config(config) if args.examples else None
             indent = 3
             spaces = " " * indent
             print("Listing token table...")
@@ -1421,15 +4684,18 @@ def main(argv=None, extend=True):  # IGNORE:C0111
             print("%sDatumAsForm2" % (spaces))
             print("%s..." % (spaces))
             print("")
-            print(pw.get_tokentable_listing(indent))
+            print(PluginWizard.get_tokentable_listing(indent, table=table, datums=datums))
             return 0
-        else:
-            if plugin_id is None:
-                raise CLIError("E: missing plugin id.")
-            if plugin_name is None:
-                raise CLIError("E: missing plugin name.")
-            if source_datapath is None or not is_valid_path(source_datapath):
-                raise CLIError("E: source data path invalid.")
+        
+        index = load_template_index(source_datapath)
+        
+        # Steps
+        # 1. Create and setup wizard. 
+        
+        # This also creates the token table
+        # and fills the rules list.
+        pw = PluginWizard(config, plugin_type, index=index, events=events)
+        plugin_type = pw.plugin_type
                         
         if g_verbose > 0:
             print("Verbose mode on")
@@ -1438,13 +4704,13 @@ def main(argv=None, extend=True):  # IGNORE:C0111
             print("")
             if rules_file is not None or pw._rules_filepath is not None:
                 print("     Using rules file at '%s' with %d rules and %d tokens." % 
-                      (format_relpath(pw._rules_filepath), len(pw._rules_list), len(pw._token_table.values())))
+                      (format_relpath(pw._rules_filepath), len(pw._rules_list), len(pw._token_table)))
 
         source = canonicalize_path(os.path.join(source_datapath, plugin_type))
 
         if not os.path.exists(source_datapath):
             raise CLIError("source data doesn't exist at path: '%s'" % canonicalize_path(source_datapath))
-        if not os.path.exists(source):
+        if not template_exists(source_datapath, plugin_type):
             raise CLIError("couldn't find template folder structure for plugin type '%s' at '%s'" % 
                            (plugin_type, source))
 
@@ -1453,50 +4719,44 @@ def main(argv=None, extend=True):  # IGNORE:C0111
             print("Using template structure '%s'" % format_relpath(source))
             print("")
                         
+        textfx = TextFX.cache_info()
         for destpath in paths:
             if g_verbose > 0:
                 print("Processing destination '%s'" % os.path.realpath(destpath))
                 print("")
-                
-            real_destpath = canonicalize_path(os.path.realpath(destpath))
-            full_destpath = os.path.join(real_destpath, plugin_type)
-            named_fulldestpath = canonicalize_path(os.path.join(real_destpath, plugin_name))
-            dest_parentdir, destdir = real_destpath, plugin_type  # IGNORE:W0612 #@UnusedVariable
             
-            if not os.path.exists(dest_parentdir):
-                if createdir:
-                    os.makedirs(dest_parentdir, mode=0o755)
-                    if not os.path.exists(dest_parentdir):
-                        raise CLIError("creating parent dir for destination '%s'  failed. skipping..." % destpath)
-                else:
-                    raise CLIError("destination '%s' doesn't exist. skipping..." % destpath)
-                                    
-            # 2. Copy folder structure(s)
-            if overwrite and os.path.exists(named_fulldestpath):
-                if g_verbose > 0:
-                    print("Overwriting destination dir at '%s'" %  (os.path.relpath(named_fulldestpath, 
-                                                                                    os.path.realpath(os.curdir))))
-                try:
-                    su.rmtree(named_fulldestpath, onerror=rmtree_onerror)
-                    su.copytree(source, named_fulldestpath, ignore=copytree_ignore)
-                except Exception as e:
-                    raise CLIError("E: %s" % str(e))
+            # 2. - 4. Copy folder structure, then do file name and content replacements
+            pw.generate(destpath, overwrite=overwrite, createdir=createdir, cancel=cancel)
+        
+        if args.history:
+            RunHistory().record(pw, stats, textfx)
+        
+        if args.stats is not None:
+            summary = stats.summary()
+            if args.events is not None:
+                # keep stdout a valid event stream
+                stats({'event': 'stats', 'time': time.time(), 'pluginId': plugin_id, 'phases': summary})
+            elif args.stats == 'json':
+                print(json.dumps(summary, indent=1))
             else:
-                try:
-                    if g_verbose > 0:
-                        print("Copying template folder structure to destination.")
-                    su.copytree(source, named_fulldestpath, ignore=copytree_ignore)
-                except OSError, e:
-                    if 'exists' in str(e):
-                        raise CLIError("dir exists: '%s'%sUse -f/--force to overwrite" % (full_destpath, os.linesep))          
-
-            pw.set_destdir(named_fulldestpath)
-            
-            # 3. Do file name replacements
-            pw.process_names(overwrite=overwrite)
-            
-            # 4. Do file content replacements
-            pw.process_contents()
+                print(stats.format())
+        
+        if memory is not None:
+            types = memory.top_types()
+            memory.stop()
+            if args.events is not None:
+                memory({'event': 'memory', 'time': time.time(), 'pluginId': plugin_id, 
+                        'phases': memory.summary(), 'types': types})
+            else:
+                print(memory.format(types))
+        
+        if filesystem is not None:
+            filesystem.stop()
+            if args.events is not None:
+                filesystem({'event': 'filesystem', 'time': time.time(), 'pluginId': plugin_id, 
+                            'phases': filesystem.summary()})
+            else:
+                print(filesystem.format())
             
         return 0
     except KeyboardInterrupt:
@@ -1507,6 +4767,20 @@ def main(argv=None, extend=True):  # IGNORE:C0111
         sys.stderr.write("%s%s" % (str(e), os.linesep))
         sys.stderr.write("for help use --help")
         return 2
+    finally:
+        # also when failing, so the filesystem functions are put back
+        if filesystem is not None:
+            filesystem.stop()
+        if memory is not None:
+            memory.stop()
+        if profiler is not None:
+            profiler.disable()
+            try:
+                save_profile(profiler, args.profile)
+            except (IOError, OSError) as e:
+                sys.stderr.write("E: couldn't write profile: %s%s" % (e, os.linesep))
+        if sampler is not None:
+            sampler.stop()
 
 
 if __name__ == "__main__":
@@ -1526,19 +4800,11 @@ if __name__ == "__main__":
               u'1000001', u"AB_NoiseShader"])
         sys.exit(0)
     if PROFILE:
-        import cProfile
-        import pstats
-        if os.path.isdir('testrun', onerror=rmtree_onerror):
-            su.rmtree('testrun')
+        if os.path.isdir('testrun'):
+            su.rmtree('testrun', onerror=rmtree_onerror)
         #os.environ[DEFAULT_ENV_DATA] = "../tests/data"
         os.environ[DEFAULT_ENV_AUTHOR] = "Andre Berg"
         os.environ[DEFAULT_ENV_ORG] = "Iris VFX"
-        profile_filename = 'c4dplugwiz_profile.pstats'
-        cProfile.run('main(["-v", "-c", "--type=shaderplugin", "-f", "-s=c4dplugwiz_data/cpp", -d=testrun", "1000001", "My Plugin"])', profile_filename)
-        statsfile = open("profile_stats.txt", "wb")
-        p = pstats.Stats(profile_filename, stream=statsfile)
-        stats = p.strip_dirs().sort_stats('cumulative')
-        print(stats.print_stats(), file=statsfile)
-        statsfile.close()
-        sys.exit(0)
+        sys.exit(main(['-v', '-c', '-f', '--type=shaderplugin', '--source-data=c4dplugwiz_data/cpp', 
+                       '--destination=testrun', '--profile=c4dplugwiz_profile.pstats', '1000001', 'My Plugin']))
     sys.exit(main())
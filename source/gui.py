@@ -37,6 +37,7 @@ sys.setdefaultencoding("utf-8")  # IGNORE:E1101 @UndefinedVariable
 
 import os
 import re
+import threading
 from ConfigParser import ConfigParser
 
 __all__ = []
@@ -54,11 +55,13 @@ PROFILE = 0 or ('ProfileLevel' in os.environ and os.environ['ProfileLevel'] > 0)
 
 import c4dplugwiz
 
-from c4dplugwiz import (CLIError, main as c4dplugwiz_main, CONFIG_DEFAULT, 
+from c4dplugwiz import (CLIError, CONFIG_DEFAULT, 
                         PLUGIN_ID_TESTING, DEFAULT_ENV_AUTHOR, DEFAULT_ENV_ORG, DEFAULT_ENV_DATA, 
                         g_win, g_osx, canonicalize_path as canonicalizePath, is_valid_path as isValidPath,
                         is_valid_plugin_id as isValidPluginId, is_valid_plugin_name as isValidPluginName,
-                        get_parent_dirpath)    
+                        get_parent_dirpath, get_author_name, get_company_name,
+                        GenerationEngine, TemplatePreview, get_template_info,
+                        CancellationToken, GenerationCancelled, RunHistory)    
 
 try:
     from PyQt4 import QtGui, QtCore
@@ -70,12 +73,14 @@ PLUGINCAFE_GETID_LINK = 'http://www.plugincafe.com/forum/developer.asp'
 
 SETTINGS_FILE_PATH = os.path.join(os.path.split(os.path.realpath(__file__))[0], "settings.ini")
 
+# shared by all generation runs of this process, keeps the template 
+# index and rules of the data dirs used so far warm
+ENGINE = GenerationEngine(history=RunHistory())
+
+# columns QFileSystemModel has, followed by the ones TemplateFileSystemModel adds
+FILESYSTEM_COLUMNS = 4
+TEMPLATE_INFO_COLUMNS = ["Files", "Total Size", "Tokens", "Rules"]
 
-try:
-    pw = c4dplugwiz.PluginWizard
-    tokenTableStr = pw.get_tokentable_listing()
-except Exception as e:
-    tokenTableStr = ""
 
 if g_win:
     txtsize = "13px"
@@ -159,7 +164,7 @@ directory names as well as file contents.
 </pre>
 
 </span>
-""" % (txtsize, tokenTableStr)
+"""
 
 TEMPLATE_HELP_STYLED = """
 <!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" 
@@ -261,7 +266,27 @@ TEMPLATE_HELP_STYLED = """
       </div>
    </div>
 </body>
-</html>""" % (tokenTableStr)
+</html>"""
+
+
+def getTemplateHelp(styled=True, _cache={}):
+    '''
+    Return the template help as HTML, including the listing of magic tokens.
+    
+    The listing is only built the first time the help is asked for, 
+    not when the GUI starts up.
+    '''
+    if styled not in _cache:
+        try:
+            tokenTableStr = c4dplugwiz.PluginWizard.get_tokentable_listing()
+        except Exception:
+            tokenTableStr = ""
+        if styled:
+            _cache[styled] = TEMPLATE_HELP_STYLED % (tokenTableStr)
+        else:
+            _cache[styled] = TEMPLATE_HELP_PLAIN % (txtsize, tokenTableStr)
+    return _cache[styled]
+
 
 def showError(msg, parent=None):
     QtGui.QMessageBox.warning(parent, "Error", str(msg), QtGui.QMessageBox.Ok)
@@ -274,6 +299,40 @@ def openPath(path):
         showError("Couldn't open '%s': %s" % (path, e))
 
 
+def formatSize(numbytes):
+    for unit in ["bytes", "KB", "MB"]:
+        if numbytes < 1024:
+            return ("%d %s" if unit == "bytes" else "%.1f %s") % (numbytes, unit)
+        numbytes /= 1024.0
+    return "%.1f GB" % numbytes
+
+
+def parsePluginTable(text):
+    '''
+    Parse lines of plugin ID and name pairs, e.g. pasted from a spreadsheet
+    or a PluginCafe ID export. Fields can be separated by tabs, semicolons,
+    commas or whitespace. Empty lines, comments (#) and lines which don't 
+    start with a number, such as headers, are skipped.
+    
+    :return: list of ``(pluginId, pluginName)`` tuples.
+    '''
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        for sep in ('\t', ';', ','):
+            if sep in line:
+                fields = [f.strip().strip('"') for f in line.split(sep, 1)]
+                break
+        else:
+            fields = line.split(None, 1)
+        if len(fields) < 2 or not fields[0].isdigit():
+            continue
+        rows.append((fields[0], fields[1]))
+    return rows
+
+
 def tryDecode(s):
     try:
         return s.decode(sys.getdefaultencoding())
@@ -287,8 +346,22 @@ class PluginWizardGui(QtGui.QWizard):
         self.setSubTitleFormat(1)   # Qt::TextFormat enum Qt::RichText == 1
 
         self.state = {}
-        self.loadSettings()
-                
+        self.worker = None
+        self.progressDialog = None
+        
+        # the preview on the conclusion page is rendered in the background,
+        # a short while after the last change to the details
+        self.previewWorker = PreviewWorker(self)
+        self.previewWorker.ready.connect(self.previewReady)
+        self.previewWorker.failed.connect(self.previewFailed)
+        self.previewTimer = QtCore.QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(300)
+        self.previewTimer.timeout.connect(self.requestPreview)
+        self.previewFile = None
+        self.lastPreview = None
+        
+        # the pages only build their widgets when they are first shown
         self.addPage(IntroPage())
         self.addPage(DetailsPage())
         self.addPage(TemplatePage())
@@ -301,29 +374,30 @@ class PluginWizardGui(QtGui.QWizard):
         return self.state
     
     def updateCurrentState(self):
-        conclusionPage = self.page(3)
-        destPathComboBox = conclusionPage.directoryComboBox
+        # pages that haven't been shown yet have no fields or 
+        # widgets to read from, so keep what we know for those
+        newState = dict(self.state)
+        if self.page(1).isBuilt:
+            newState.update({
+                'pluginId': str(self.field("pluginId")),
+                'pluginName': str(self.field("pluginName")),
+                'author': str(self.field("author")),
+                'org': str(self.field("org"))
+            })
         templatePage = self.page(2)
-        pluginId = str(self.field("pluginId"))
-        pluginName = str(self.field("pluginName"))      
-        destinationPath = str(destPathComboBox.itemText(self.field("destinationPath")))
-        author = str(self.field("author"))
-        org = str(self.field("org"))
-        overwrite = bool(self.field('overwrite'))
-        template = templatePage.selectedTemplate
-        templatePath = templatePage.selectedTemplatePath
-        source = str(templatePage.currentPath)
-        newState = {
-            'pluginId': pluginId,
-            'pluginName': pluginName,
-            'author': author,
-            'org': org,
-            'overwrite': overwrite,
-            'template': template,
-            'srcdataPath': source,
-            'templatePath': templatePath,
-            'destinationPath': destinationPath
-        }
+        if templatePage.isBuilt:
+            newState.update({
+                'template': templatePage.selectedTemplate,
+                'srcdataPath': str(templatePage.currentPath),
+                'templatePath': templatePage.selectedTemplatePath
+            })
+        conclusionPage = self.page(3)
+        if conclusionPage.isBuilt:
+            destPathComboBox = conclusionPage.directoryComboBox
+            newState.update({
+                'overwrite': bool(self.field('overwrite')),
+                'destinationPath': str(destPathComboBox.itemText(self.field("destinationPath")))
+            })
         # if DEBUG: print("updateCurrentState: %r" % newState)
         self.state = newState
         return True
@@ -363,6 +437,9 @@ class PluginWizardGui(QtGui.QWizard):
         return state
   
     def accept(self, *args, **kwargs):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        
         self.updateCurrentState()
         
         destination = self.state['destinationPath']
@@ -371,7 +448,6 @@ class PluginWizardGui(QtGui.QWizard):
             return
         
         overwrite = bool(self.state['overwrite'])
-        pluginId = self.state["pluginId"]
         pluginName = self.state["pluginName"]
         
         if overwrite is False and os.path.exists(os.path.join(destination, pluginName)):
@@ -380,49 +456,130 @@ class PluginWizardGui(QtGui.QWizard):
                       "Overwrite? is set to %s." % (pluginName, str(overwrite)))
             return
         
-        author = self.state["author"]
-        org = self.state["org"]
         template = self.state['template']
-        templatePath = self.state['templatePath']
-        source = get_parent_dirpath(templatePath)
         
         try:
             self.saveSettings()
         except Exception as e:  # IGNORE:W0703
             print("E: couldn't save settings: %s" % e)
 
-        args = ["--verbose", "--create-rootdir", "--source-data=%s" % source,
-                '--destination=%s' % destination, "--org=%s" % org, "--author=%s" % author, 
-                "--type=%s" % template, pluginId, pluginName]
+        # the preview shares the TextFX caches with the generation
+        self.previewTimer.stop()
+        self.previewWorker.wait()
+        config = self.makeConfig()
+        
+        # generate on a worker thread so the wizard stays responsive,
+        # the wizard is only closed once the worker succeeded
+        self.worker = GenerationWorker(config, template, destination, overwrite, parent=self)
+        self.progressDialog = QtGui.QProgressDialog("Creating plugin...", "Cancel", 0, 0, self)
+        self.progressDialog.setWindowTitle("Creating Plugin")
+        self.progressDialog.setWindowModality(QtCore.Qt.WindowModal)
+        self.progressDialog.setAutoReset(False)
+        self.progressDialog.setAutoClose(False)
+        self.progressDialog.setMinimumDuration(500)
+        self.progressDialog.canceled.connect(self.worker.cancel)
+        self.worker.progressChanged.connect(self.updateProgress)
+        self.worker.succeeded.connect(self.generationSucceeded)
+        self.worker.failed.connect(self.generationFailed)
+        self.worker.cancelled.connect(self.generationCancelled)
+        self.worker.start()
+    
+    def makeConfig(self):
+        '''Make a c4dplugwiz config from the current state.'''
+        config = dict(CONFIG_DEFAULT)
+        config.update({
+            'pluginId': self.state["pluginId"],
+            'pluginName': self.state["pluginName"],
+            'author': self.state["author"],
+            'org': self.state["org"],
+            'srcdataPath': get_parent_dirpath(self.state['templatePath'])
+        })
+        return config
+    
+    def schedulePreview(self):
+        # restarts the timer, so only the last of a quick 
+        # succession of changes is rendered
+        self.previewTimer.start()
         
-        if overwrite == True:
-            args.insert(2, '--force')
+    def requestPreview(self):
+        self.previewTimer.stop()
+        self.updateCurrentState()
+        state = self.state
+        for key in ('pluginId', 'pluginName', 'author', 'org', 'template', 'templatePath'):
+            if not state.get(key):
+                return
+        if not os.path.isdir(state['templatePath']):
+            return
+        self.previewWorker.request(self.makeConfig(), state['template'], self.previewFile)
+        
+    def previewReady(self, tree, relpath, text):
+        self.lastPreview = (tree, relpath, text)
+        conclusionPage = self.page(3)
+        if conclusionPage.isBuilt:
+            conclusionPage.showPreview(tree, relpath, text)
             
-        # if DEBUG: print("args = %r" % args)
-        result = -1
-        errMsg = "Unknown error."
-        try:
-            result = c4dplugwiz_main(args, extend=False)
-        except Exception as e:
-            errMsg = "Error: " + str(e)
-        if result == 0:
-            openPath(os.path.realpath(os.path.join(destination, pluginName)))
-            super(PluginWizardGui, self).accept()
+    def previewFailed(self, errMsg):
+        conclusionPage = self.page(3)
+        if conclusionPage.isBuilt:
+            conclusionPage.showPreview([], '', "Preview not available: %s" % errMsg)
+    
+    def updateProgress(self, phase, done, total, path):
+        dialog = self.progressDialog
+        if dialog is None or dialog.wasCanceled():
+            return
+        if phase == 'copy':
+            dialog.setLabelText("Copying template...")
+        elif phase == 'names':
+            dialog.setLabelText("Renaming '%s'" % os.path.basename(path))
+        else:
+            dialog.setLabelText("Processing '%s'" % os.path.basename(path))
+        if total < 0:
+            # busy indicator
+            dialog.setRange(0, 0)
+        else:
+            dialog.setRange(0, total)
+            dialog.setValue(done)
+    
+    def closeProgressDialog(self):
+        if self.progressDialog is not None:
+            self.progressDialog.close()
+            self.progressDialog = None
+    
+    def generationSucceeded(self, pluginPath):
+        self.closeProgressDialog()
+        openPath(os.path.realpath(pluginPath))
+        answer = QtGui.QMessageBox.question(self, "Plugin Created", 
+                                            "Created '%s'.\n\nCreate another plugin?" % pluginPath,
+                                            QtGui.QMessageBox.Yes | QtGui.QMessageBox.No, 
+                                            QtGui.QMessageBox.No)
+        if answer == QtGui.QMessageBox.Yes:
+            # starts over with the details just used, 
+            # the next run reuses the warm ENGINE
+            self.restart()
         else:
-            showError("%s.\n\n"
-                      "Please double check that the selected data "
-                      "directory actually contains some valid templates." % (errMsg))
+            super(PluginWizardGui, self).accept()
+    
+    def generationFailed(self, errMsg):
+        self.closeProgressDialog()
+        showError("%s.\n\n"
+                  "Please double check that the selected data "
+                  "directory actually contains some valid templates." % (errMsg), parent=self)
+    
+    def generationCancelled(self):
+        self.closeProgressDialog()
     
     def handleIdChange(self, *args, **kwargs):
         # if DEBUG: print("handleIdChange: state = %r" % self.state)
         if self.currentId() == 1:
             # Details page
             self.state = self.loadSettings()
+            self.page(1).ensureBuilt()
             self.page(1).pluginIdLineEdit.selectAll()
             self.page(1).pluginIdLineEdit.setFocus()
         elif self.currentId() == 2:
             # Template page
             templatePage = self.page(2)
+            templatePage.ensureBuilt()
             templatePage.updateTemplateTree()
             self.updateCurrentState()
             templateTree = templatePage.templateTree
@@ -489,7 +646,310 @@ class PluginWizardGui(QtGui.QWizard):
                 return False
         return QtGui.QWizard.validateCurrentPage(self, *args, **kwargs)
 
+
+class GenerationWorker(QtCore.QThread):
+    '''
+    Generates a plugin off the UI thread.
+    
+    Emits ``progressChanged(phase, done, total, path)`` for each step
+    of :py:meth:`c4dplugwiz.PluginWizard.generate`, with a ``total`` of -1
+    where the number of steps isn't known, and then exactly one of 
+    ``succeeded(pluginPath)``, ``failed(errMsg)`` or ``cancelled()``.
+    '''
+    
+    progressChanged = QtCore.pyqtSignal(str, int, int, str)
+    succeeded = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+    
+    def __init__(self, config, template, destination, overwrite=False, parent=None):
+        super(GenerationWorker, self).__init__(parent)
+        self.config = config
+        self.template = template
+        self.destination = destination
+        self.overwrite = overwrite
+        self.token = CancellationToken()
+        
+    def cancel(self):
+        # the wizard rolls back what it generated so far
+        self.token.cancel()
+        
+    def reportProgress(self, phase, done, total, path):
+        self.progressChanged.emit(phase, done, -1 if total is None else total, path)
+        
+    def run(self):
+        try:
+            pluginPath = ENGINE.generate(self.config, self.destination, self.template, overwrite=self.overwrite, 
+                                         createdir=True, progress=self.reportProgress, cancel=self.token)
+        except GenerationCancelled:
+            self.cancelled.emit()
+            return
+        except Exception as e:
+            self.failed.emit("Error: " + str(e))
+            return
+        self.succeeded.emit(pluginPath)
+
+
+class PreviewWorker(QtCore.QThread):
+    '''
+    Renders the names and the selected file of a template for the preview 
+    on the conclusion page, without copying anything.
+    
+    Requests made while a preview is being rendered are coalesced, only
+    the latest one is rendered next. Emits ``ready(tree, relpath, text)`` 
+    with the list of ``(relpath, rendered relpath, isdir)`` tuples from 
+    :py:meth:`c4dplugwiz.TemplatePreview.tree` and the rendered contents 
+    of the file at ``relpath``, or ``failed(errMsg)``.
+    '''
+    
+    ready = QtCore.pyqtSignal(object, str, str)
+    failed = QtCore.pyqtSignal(str)
+    
+    def __init__(self, parent=None):
+        super(PreviewWorker, self).__init__(parent)
+        self.lock = threading.Lock()
+        self.pending = None
+        self.active = False
+        # one TemplatePreview per data dir and template, so that unchanged 
+        # names and files don't need to be read or rendered again
+        self.previews = {}
+        
+    def request(self, config, template, relpath=None):
+        with self.lock:
+            self.pending = (config, template, relpath)
+            if self.active:
+                return
+            self.active = True
+        # the previous run may not have returned yet
+        self.wait()
+        self.start()
+        
+    def run(self):
+        while True:
+            with self.lock:
+                request = self.pending
+                self.pending = None
+                if request is None:
+                    self.active = False
+                    return
+            config, template, relpath = request
+            try:
+                key = (config['srcdataPath'], template)
+                preview = self.previews.get(key)
+                if preview is None:
+                    preview = TemplatePreview(config, template)
+                    self.previews[key] = preview
+                else:
+                    preview.update(config)
+                tree = preview.tree()
+                files = [path for path, _, isdir in tree if not isdir]
+                if relpath not in files:
+                    relpath = files[0] if len(files) > 0 else None
+                text = preview.render_file(relpath) if relpath is not None else ""
+            except Exception as e:
+                self.failed.emit(str(e))
+                continue
+            self.ready.emit(tree, relpath or "", text)
+
+
+class TemplateInfoWorker(QtCore.QThread):
+    '''
+    Gathers the info shown by :py:class:`TemplateFileSystemModel` off the 
+    UI thread. Emits ``infoReady(path, info)`` for each requested template 
+    folder, where ``info`` is the dict from :py:func:`c4dplugwiz.get_template_info`
+    plus the list of all ``dirs`` in the template, or None if it failed.
+    
+    The info comes from the template index of the data dir kept by 
+    ``ENGINE``, so no template file is read here. It is cached per 
+    template folder and only gathered again if the modification time 
+    of one of its folders changed, which is also what the file system 
+    watcher and the index notice.
+    '''
+    
+    infoReady = QtCore.pyqtSignal(str, object)
+    
+    def __init__(self, parent=None):
+        super(TemplateInfoWorker, self).__init__(parent)
+        self.lock = threading.Lock()
+        self.queue = []
+        self.active = False
+        self.cache = {}
+        
+    def request(self, path):
+        with self.lock:
+            if path not in self.queue:
+                self.queue.append(path)
+            if self.active:
+                return
+            self.active = True
+        # the previous run may not have returned yet
+        self.wait()
+        self.start()
+    
+    @staticmethod
+    def stamp(path):
+        '''Return the modification times of path and all folders below it, and the folders.'''
+        dirs = []
+        for dirpath, dirnames, _ in os.walk(path):
+            dirnames[:] = [d for d in dirnames if d not in c4dplugwiz.DEFAULT_DIR_EXCLUDES]
+            dirs.append(dirpath)
+        return tuple(os.stat(d).st_mtime for d in dirs), dirs
+        
+    def run(self):
+        while True:
+            with self.lock:
+                if len(self.queue) == 0:
+                    self.active = False
+                    return
+                path = self.queue.pop(0)
+            try:
+                stamp, dirs = self.stamp(path)
+                cached = self.cache.get(path)
+                if cached is not None and cached[0] == stamp:
+                    info = cached[1]
+                else:
+                    srcdata_path, plugin_type = os.path.split(path)
+                    info = get_template_info(srcdata_path, plugin_type, index=ENGINE.index(srcdata_path))
+                    info['dirs'] = dirs
+                    self.cache[path] = (stamp, info)
+            except Exception as e:
+                if DEBUG: print("E: couldn't gather info for template at '%s': %s" % (path, e))
+                info = None
+            self.infoReady.emit(path, info)
+
+
+class TemplateFileSystemModel(QtGui.QFileSystemModel):
+    '''
+    File system model of the data directory which adds columns with the 
+    number of files, total size, magic tokens and rules file of each 
+    template folder. 
+    
+    The info is gathered in the background by a :py:class:`TemplateInfoWorker` 
+    when a template is first shown and gathered again whenever a 
+    file system watcher reports changes in the template folder.
+    '''
+    
+    def __init__(self, parent=None):
+        super(TemplateFileSystemModel, self).__init__(parent)
+        self.templateRoot = None
+        self.infos = {}
+        self.worker = TemplateInfoWorker(self)
+        self.worker.infoReady.connect(self.infoReady)
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.directoryChanged)
+        self.watched = set()
+        
+    def setTemplateRoot(self, path):
+        self.templateRoot = os.path.normpath(path)
+        return self.setRootPath(path)
+    
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return FILESYSTEM_COLUMNS + len(TEMPLATE_INFO_COLUMNS)
+    
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and section >= FILESYSTEM_COLUMNS:
+            if role == QtCore.Qt.DisplayRole:
+                return TEMPLATE_INFO_COLUMNS[section - FILESYSTEM_COLUMNS]
+            return None
+        return super(TemplateFileSystemModel, self).headerData(section, orientation, role)
+    
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if index.column() < FILESYSTEM_COLUMNS:
+            return super(TemplateFileSystemModel, self).data(index, role)
+        if role not in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return None
+        path = os.path.normpath(self.filePath(index))
+        if os.path.dirname(path) != self.templateRoot:
+            # only template folders get info, not what's in them
+            return None
+        if path not in self.infos:
+            self.infos[path] = None
+            self.worker.request(path)
+        info = self.infos[path]
+        if info is None:
+            return "..."
+        if len(info) == 0:
+            return ""
+        column = TEMPLATE_INFO_COLUMNS[index.column() - FILESYSTEM_COLUMNS]
+        if column == "Files":
+            return str(info['files'])
+        elif column == "Total Size":
+            return formatSize(info['bytes'])
+        elif column == "Tokens":
+            if role == QtCore.Qt.ToolTipRole:
+                return "\n".join(info['tokens'])
+            return ", ".join(info['tokens'])
+        else:
+            rulesFile = info['rulesFile']
+            if rulesFile is None:
+                return "none"
+            if role == QtCore.Qt.ToolTipRole:
+                return rulesFile
+            return os.path.relpath(rulesFile, self.templateRoot)
+        
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        if column >= FILESYSTEM_COLUMNS:
+            column = 0
+        return super(TemplateFileSystemModel, self).sort(column, order)
+    
+    def templateChanged(self, path):
+        idx = self.index(path)
+        if idx.isValid():
+            self.dataChanged.emit(self.index(idx.row(), FILESYSTEM_COLUMNS, idx.parent()),
+                                  self.index(idx.row(), self.columnCount() - 1, idx.parent()))
+        
+    def infoReady(self, path, info):
+        self.infos[path] = info if info is not None else {}
+        if info is not None:
+            newDirs = [d for d in info['dirs'] if d not in self.watched]
+            if len(newDirs) > 0:
+                self.watched.update(newDirs)
+                self.watcher.addPaths(newDirs)
+        self.templateChanged(path)
+        
+    def directoryChanged(self, dirpath):
+        if self.templateRoot is None:
+            return
+        relpath = os.path.relpath(os.path.normpath(dirpath), self.templateRoot)
+        if relpath == os.curdir or relpath.startswith(os.pardir):
+            return
+        path = os.path.join(self.templateRoot, relpath.split(os.sep)[0])
+        if not os.path.isdir(dirpath):
+            # the watcher drops removed folders by itself
+            self.watched.discard(dirpath)
+        if path in self.infos:
+            # gathered again when shown next
+            del self.infos[path]
+            self.templateChanged(path)
+
+    
+class LazyWizardPage(QtGui.QWizardPage):
+    '''
+    Wizard page that builds its widgets the first time it is shown.
     
+    Subclasses put the construction of their widgets and fields into
+    :py:meth:`setupPage` instead of ``__init__`` and call 
+    :py:meth:`ensureBuilt` before touching any of them.
+    '''
+    
+    def __init__(self, parent=None):
+        super(LazyWizardPage, self).__init__(parent)
+        self.isBuilt = False
+        
+    def ensureBuilt(self):
+        if not self.isBuilt:
+            self.isBuilt = True
+            self.setupPage()
+    
+    def setupPage(self):
+        pass
+    
+    def initializePage(self):
+        self.ensureBuilt()
+        
+
 class IntroPage(QtGui.QWizardPage):    
     def __init__(self, parent=None):
         super(IntroPage, self).__init__(parent)
@@ -512,13 +972,14 @@ class IntroPage(QtGui.QWizardPage):
         self.setLayout(layout)
 
 
-class DetailsPage(QtGui.QWizardPage):
+class DetailsPage(LazyWizardPage):
     def __init__(self, parent=None):
         super(DetailsPage, self).__init__(parent)
         
         self.setTitle("Plugin Details")
         self.setSubTitle("Please enter the following details about your new plugin.")
         
+    def setupPage(self):
         self.state = PluginWizardGui.loadSettings()
                 
         spacer = QtGui.QSpacerItem(40, 20)
@@ -554,6 +1015,9 @@ class DetailsPage(QtGui.QWizardPage):
         self.registerField("pluginName*", self.pluginNameLineEdit)
         self.registerField("author", self.authorLineEdit)
         self.registerField("org", self.orgLineEdit)
+        
+        for lineEdit in (self.pluginIdLineEdit, self.pluginNameLineEdit, self.authorLineEdit, self.orgLineEdit):
+            lineEdit.textChanged.connect(self.detailsChanged)
                 
         self.pluginIdLineEdit.setToolTip('You can use a whole number in the range 1000001-1000010 for testing purposes')
 
@@ -591,7 +1055,13 @@ class DetailsPage(QtGui.QWizardPage):
         
         self.setLayout(verticalLayout)
         
-    def initializePage(self):  
+    def detailsChanged(self, *args, **kwargs):
+        wizard = self.wizard()
+        if wizard is not None:
+            wizard.schedulePreview()
+        
+    def initializePage(self):
+        self.ensureBuilt()
         if 'pluginId' in self.state:
             self.setField("pluginId", self.state['pluginId'])
             self.pluginIdLineEdit.setText(self.state['pluginId'])
@@ -614,7 +1084,7 @@ class DetailsPage(QtGui.QWizardPage):
             self.setField("author", author)
             self.authorLineEdit.setText(author)
         else:
-            author = tryDecode(CONFIG_DEFAULT['author'])
+            author = tryDecode(get_author_name())
             self.setField("author", author)
             self.authorLineEdit.setText(author)
  
@@ -625,11 +1095,11 @@ class DetailsPage(QtGui.QWizardPage):
             self.setField("org", os.environ[DEFAULT_ENV_ORG])
             self.orgLineEdit.setText(os.environ[DEFAULT_ENV_ORG])
         else:
-            self.setField("org", CONFIG_DEFAULT['org'])
-            self.orgLineEdit.setText(CONFIG_DEFAULT['org'])
+            self.setField("org", get_company_name())
+            self.orgLineEdit.setText(get_company_name())
          
 
-class TemplatePage(QtGui.QWizardPage):
+class TemplatePage(LazyWizardPage):
     '''Template selection page.'''
     
     def __init__(self, parent=None):
@@ -639,14 +1109,16 @@ class TemplatePage(QtGui.QWizardPage):
                          "By default the data directory is in the same location "
                          "as this wizard but you can select a different directory below.")
 
-        self.state = PluginWizardGui.loadSettings()
-        
         self.selectedTemplate = None
         self.selectedTemplatePath = None
         self.currentPath = None
         self.currentDir = None
         self.showTemplatePaths = False  # show full paths in a second column in templates table?
-
+        self.fileSystemModel = None
+        
+    def setupPage(self):
+        self.state = PluginWizardGui.loadSettings()
+        
         if isValidPath(RESPATH):
             self.updatePath(RESPATH)
                 
@@ -664,9 +1136,10 @@ class TemplatePage(QtGui.QWizardPage):
         
         spacer = QtGui.QSpacerItem(40, 20)
         
-        self.fileSystemModel = QtGui.QFileSystemModel()
+        # the model starts watching and populating once it gets a root 
+        # path, which happens in updateTemplateTree when the page is shown
+        self.fileSystemModel = TemplateFileSystemModel()
         self.fileSystemModel.setReadOnly(True)
-        self.fileSystemModel.setRootPath(self.currentPath)
         self.fileSystemModel.setFilter(QtCore.QDir.Dirs | QtCore.QDir.NoDotAndDotDot)
 
         self.templateTree = self.createTemplateTree()
@@ -696,9 +1169,8 @@ class TemplatePage(QtGui.QWizardPage):
         
         self.setLayout(mainLayout)
         
-        self.updateTemplateTree()
-        
     def initializePage(self, *args, **kwargs):
+        self.ensureBuilt()
         if 'srcdataPath' in self.state:
             dataDir = self.state['srcdataPath']
         elif DEFAULT_ENV_DATA in os.environ:
@@ -721,6 +1193,7 @@ class TemplatePage(QtGui.QWizardPage):
                 idx = self.templateTree.currentIndex()
             self.selectedTemplate = self.fileSystemModel.fileName(idx)
             self.selectedTemplatePath = self.fileSystemModel.filePath(idx)
+            self.wizard().schedulePreview()
             return True
         except:
             return False
@@ -729,7 +1202,7 @@ class TemplatePage(QtGui.QWizardPage):
         path = self.getPathFromDirectoryComboBox()
         if path is None:
             return
-        self.fileSystemModel.setRootPath(path)
+        self.fileSystemModel.setTemplateRoot(path)
         self.templateTree.setRootIndex(self.fileSystemModel.index(path))
     
     def updatePath(self, path):
@@ -837,7 +1310,9 @@ class TemplatePage(QtGui.QWizardPage):
         templateTree = QtGui.QTreeView()
         templateTree.setSortingEnabled(True)
         templateTree.setModel(self.fileSystemModel)
-        templateTree.setRootIndex(self.fileSystemModel.index(self.currentPath))
+        # always 'Folder' and empty for folders
+        templateTree.hideColumn(1)
+        templateTree.hideColumn(2)
 
         templateTree.clicked.connect(self.updateSelectedTemplate)
         templateTree.activated.connect(self.openTemplateFolder)
@@ -848,12 +1323,13 @@ class TemplatePage(QtGui.QWizardPage):
         return templateTree
     
     
-class ConclusionPage(QtGui.QWizardPage):
+class ConclusionPage(LazyWizardPage):
     def __init__(self, parent=None):
         super(ConclusionPage, self).__init__(parent)
                 
         self.setTitle("Confirmation")
         
+    def setupPage(self):
         self.state = PluginWizardGui.loadSettings()
         
         label = QtGui.QLabel("Please verify that the following info is correct. Be very conscious about "
@@ -897,8 +1373,27 @@ class ConclusionPage(QtGui.QWizardPage):
         gridLayout.addWidget(browseButton, 1, 2)
         gridLayout.addWidget(self.overwriteCheckBox, 2, 1)
         
+        batchButton = self.createButton("Batch...", self.batch)
+        batchButton.setToolTip("Create many plugins from this template at once, "
+                               "from a table of plugin IDs and names.")
+        gridLayout.addWidget(batchButton, 2, 2)
+        
         mainLayout.insertLayout(3, gridLayout)
         
+        self.previewList = QtGui.QListWidget()
+        self.previewList.itemClicked.connect(self.previewItemClicked)
+        self.previewList.setToolTip("Names of the folders and files of the new plugin. "
+                                    "Click a file to preview its contents.")
+        self.previewText = QtGui.QPlainTextEdit()
+        self.previewText.setReadOnly(True)
+        self.previewText.setLineWrapMode(QtGui.QPlainTextEdit.NoWrap)
+        previewSplitter = QtGui.QSplitter()
+        previewSplitter.addWidget(self.previewList)
+        previewSplitter.addWidget(self.previewText)
+        
+        mainLayout.addWidget(QtGui.QLabel("Preview:"))
+        mainLayout.addWidget(previewSplitter)
+        
         self.registerField("destinationPath", self.directoryComboBox)
         self.registerField("overwrite", self.overwriteCheckBox)
                     
@@ -906,8 +1401,14 @@ class ConclusionPage(QtGui.QWizardPage):
          
     def initializePage(self):
         if DEBUG: print("initialize Conclusion page")
+        self.ensureBuilt()
           
         self.updateBrowserText()
+        
+        wizard = self.wizard()
+        if wizard.lastPreview is not None:
+            self.showPreview(*wizard.lastPreview)
+        wizard.requestPreview()
  
         if 'overwrite' in self.state and self.state['overwrite'] is not None:
             self.setField("overwrite", self.state['overwrite'])
@@ -926,6 +1427,32 @@ class ConclusionPage(QtGui.QWizardPage):
             comboBox.setCurrentIndex(comboBox.findText(destinationPath))
 
         
+    def batch(self):
+        window = BatchWindow(self.wizard())
+        window.exec_()
+        
+    def showPreview(self, tree, relpath, text):
+        self.previewList.clear()
+        for path, rendered, isdir in tree:
+            if isdir:
+                rendered += os.sep
+            item = QtGui.QListWidgetItem(rendered)
+            item.setData(QtCore.Qt.UserRole, path)
+            item.setToolTip(path)
+            if isdir:
+                item.setFlags(QtCore.Qt.ItemIsEnabled)
+            self.previewList.addItem(item)
+            if path == relpath:
+                self.previewList.setCurrentItem(item)
+        self.previewText.setPlainText(text)
+        
+    def previewItemClicked(self, item):
+        if not (item.flags() & QtCore.Qt.ItemIsSelectable):
+            return
+        wizard = self.wizard()
+        wizard.previewFile = item.data(QtCore.Qt.UserRole)
+        wizard.requestPreview()
+        
     def updatePath(self, path): 
         if isValidPath(path):
             self.destinationPath = os.path.realpath(path)
@@ -1014,6 +1541,217 @@ class ConclusionPage(QtGui.QWizardPage):
 
 
 
+class BatchWorker(QtCore.QThread):
+    '''
+    Generates a list of plugins with :py:meth:`c4dplugwiz.GenerationEngine.generate_many`.
+    Emits ``rowFinished(row, pluginPath, errMsg)`` for each plugin, with 
+    an empty ``errMsg`` on success, and ``finishedAll()`` at the end.
+    '''
+    
+    rowFinished = QtCore.pyqtSignal(int, str, str)
+    finishedAll = QtCore.pyqtSignal()
+    
+    def __init__(self, configs, template, destination, overwrite=False, workers=4, parent=None):
+        super(BatchWorker, self).__init__(parent)
+        self.configs = configs
+        self.template = template
+        self.destination = destination
+        self.overwrite = overwrite
+        self.workers = workers
+        self.token = CancellationToken()
+        
+    def cancel(self):
+        # plugins in progress are rolled back, no more are started
+        self.token.cancel()
+        
+    def rowDone(self, row, pluginPath, error):
+        if isinstance(error, GenerationCancelled):
+            # left for finishedAll to mark as cancelled
+            return
+        if error is None:
+            self.rowFinished.emit(row, pluginPath, "")
+        else:
+            self.rowFinished.emit(row, "", str(error) or error.__class__.__name__)
+        
+    def run(self):
+        ENGINE.generate_many(self.configs, self.destination, self.template, overwrite=self.overwrite, 
+                             createdir=True, workers=self.workers, done=self.rowDone, cancel=self.token)
+        self.finishedAll.emit()
+        
+
+class BatchWindow(QtGui.QDialog):
+    '''
+    Generates many plugins at once from a table of plugin IDs and names, 
+    with the template, author, organization and destination chosen in 
+    the wizard.
+    '''
+    
+    def __init__(self, wizard):
+        super(BatchWindow, self).__init__(wizard)
+        self.setWindowTitle("Batch Generation")
+        self.wizard = wizard
+        self.worker = None
+        self.startTime = None
+        self.total = 0
+        self.finishedCount = 0
+        self.failedCount = 0
+        self.setupGui()
+        
+    def setupGui(self):
+        state = self.wizard.getCurrentState()
+        infoLabel = QtGui.QLabel("Paste or import plugin IDs and names, one plugin per line. "
+                                 "Each plugin is created from template <b>%s</b> in <b>%s</b>." % 
+                                 (state['template'], state['destinationPath']))
+        infoLabel.setWordWrap(True)
+        
+        self.table = QtGui.QTableWidget(0, 3)
+        self.table.setHorizontalHeaderLabels(["Plugin ID", "Plugin Name", "Status"])
+        self.table.horizontalHeader().setStretchLastSection(True)
+        
+        pasteButton = QtGui.QPushButton("&Paste")
+        pasteButton.clicked.connect(self.paste)
+        importButton = QtGui.QPushButton("&Import...")
+        importButton.clicked.connect(self.importFile)
+        clearButton = QtGui.QPushButton("C&lear")
+        clearButton.clicked.connect(self.clear)
+        
+        workersLabel = QtGui.QLabel("Workers:")
+        self.workersSpinBox = QtGui.QSpinBox()
+        self.workersSpinBox.setRange(1, 16)
+        self.workersSpinBox.setValue(4)
+        self.workersSpinBox.setToolTip("Number of plugins generated at the same time.")
+        
+        self.statusLabel = QtGui.QLabel("")
+        self.generateButton = QtGui.QPushButton("&Generate")
+        self.generateButton.clicked.connect(self.generate)
+        self.cancelButton = QtGui.QPushButton("Cancel")
+        self.cancelButton.setEnabled(False)
+        self.cancelButton.clicked.connect(self.cancel)
+        
+        topLayout = QtGui.QHBoxLayout()
+        topLayout.addWidget(pasteButton)
+        topLayout.addWidget(importButton)
+        topLayout.addWidget(clearButton)
+        topLayout.addStretch()
+        topLayout.addWidget(workersLabel)
+        topLayout.addWidget(self.workersSpinBox)
+        
+        bottomLayout = QtGui.QHBoxLayout()
+        bottomLayout.addWidget(self.statusLabel)
+        bottomLayout.addStretch()
+        bottomLayout.addWidget(self.generateButton)
+        bottomLayout.addWidget(self.cancelButton)
+        
+        mainLayout = QtGui.QVBoxLayout()
+        mainLayout.addWidget(infoLabel)
+        mainLayout.addLayout(topLayout)
+        mainLayout.addWidget(self.table)
+        mainLayout.addLayout(bottomLayout)
+        self.setLayout(mainLayout)
+        self.resize(QtCore.QSize(600, 450))
+        
+    def addRows(self, rows):
+        for pluginId, pluginName in rows:
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self.table.setItem(row, 0, QtGui.QTableWidgetItem(pluginId))
+            self.table.setItem(row, 1, QtGui.QTableWidgetItem(pluginName))
+            self.setStatus(row, "")
+        
+    def setStatus(self, row, text, toolTip=None):
+        item = QtGui.QTableWidgetItem(text)
+        item.setFlags(QtCore.Qt.ItemIsEnabled)
+        if toolTip is not None:
+            item.setToolTip(toolTip)
+        self.table.setItem(row, 2, item)
+        
+    def paste(self):
+        self.addRows(parsePluginTable(QtGui.QApplication.clipboard().text()))
+        
+    def importFile(self):
+        path = QtGui.QFileDialog.getOpenFileName(self, "Import Plugin IDs and Names", QtCore.QDir.homePath(),
+                                                 "Tables (*.csv *.tsv *.txt);;All Files (*)")
+        if not path:
+            return
+        try:
+            with open(path, 'rb') as f:
+                self.addRows(parsePluginTable(tryDecode(f.read())))
+        except (IOError, OSError) as e:
+            showError("Couldn't import '%s': %s" % (path, e), parent=self)
+            
+    def clear(self):
+        if self.worker is None or not self.worker.isRunning():
+            self.table.setRowCount(0)
+            self.statusLabel.setText("")
+        
+    def generate(self):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        state = self.wizard.getCurrentState()
+        configs = []
+        for row in range(self.table.rowCount()):
+            pluginId = self.table.item(row, 0).text().strip()
+            pluginName = self.table.item(row, 1).text().strip()
+            if not isValidPluginId(pluginId) or not isValidPluginName(pluginName):
+                showError("Row %d: invalid plugin ID or name." % (row + 1), parent=self)
+                return
+            config = self.wizard.makeConfig()
+            config.update({'pluginId': pluginId, 'pluginName': pluginName})
+            configs.append(config)
+            self.setStatus(row, "Queued")
+        if len(configs) == 0:
+            return
+        self.finishedCount = 0
+        self.failedCount = 0
+        self.total = len(configs)
+        self.startTime = QtCore.QTime()
+        self.startTime.start()
+        self.worker = BatchWorker(configs, state['template'], state['destinationPath'], 
+                                  overwrite=bool(state['overwrite']), 
+                                  workers=self.workersSpinBox.value(), parent=self)
+        self.worker.rowFinished.connect(self.rowFinished)
+        self.worker.finishedAll.connect(self.finishedAll)
+        self.generateButton.setEnabled(False)
+        self.cancelButton.setEnabled(True)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.worker.start()
+        
+    def rowFinished(self, row, pluginPath, errMsg):
+        self.finishedCount += 1
+        if errMsg:
+            self.failedCount += 1
+            self.setStatus(row, "Failed: %s" % errMsg, errMsg)
+        else:
+            self.setStatus(row, "Done", pluginPath)
+        self.updateStatusLabel()
+        
+    def updateStatusLabel(self):
+        elapsed = max(self.startTime.elapsed(), 1) / 1000.0
+        text = "%d of %d done, %.1f plugins/s" % (self.finishedCount, self.total, self.finishedCount / elapsed)
+        if self.failedCount > 0:
+            text += ", %d failed" % self.failedCount
+        self.statusLabel.setText(text)
+        
+    def finishedAll(self):
+        for row in range(self.table.rowCount()):
+            if self.table.item(row, 2).text() == "Queued":
+                self.setStatus(row, "Cancelled")
+        self.updateStatusLabel()
+        self.generateButton.setEnabled(True)
+        self.cancelButton.setEnabled(False)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.AllEditTriggers)
+        
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            
+    def reject(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            self.worker.wait()
+        super(BatchWindow, self).reject()
+
+
 class HelpWindow(QtGui.QDialog):
     
     def __init__(self):
@@ -1023,7 +1761,7 @@ class HelpWindow(QtGui.QDialog):
         self.setWindowTitle("Template Help")
 
     def setupGui(self):
-        self.textEdit.setHtml(TEMPLATE_HELP_STYLED)
+        self.textEdit.setHtml(getTemplateHelp())
         self.textEdit.setReadOnly(True)
         
         mainLayout = QtGui.QVBoxLayout()
@@ -1032,6 +1770,28 @@ class HelpWindow(QtGui.QDialog):
         self.setLayout(mainLayout)
         
 
+def createWizard():
+    '''Create and show the wizard. Needs a QApplication.'''
+    wizard = PluginWizardGui()
+    wizard.setWindowTitle("CINEMA 4D Plugin Wizard")
+    wizard.window().setStyleSheet("QWizard { background: white; }")
+    
+    wizard.show()
+    
+    if g_osx:
+        w = 725
+        h = 425
+        wizard.setMinimumSize(w, h)
+        wizard.window().resize(w, h)
+        wizard.setPixmap(QtGui.QWizard.BackgroundPixmap, QtGui.QPixmap("images/c4dr14bg.png"))
+    else:
+        w = 525
+        h = 425
+        wizard.setMinimumSize(w, h)
+        wizard.window().resize(w, h)
+    return wizard
+
+
 def main(argv=None):  # IGNORE:C0111
     if isinstance(argv, list):
         sys.argv.extend(argv)
@@ -1048,23 +1808,7 @@ def main(argv=None):  # IGNORE:C0111
                             QtCore.QLibraryInfo.location(QtCore.QLibraryInfo.TranslationsPath))):
             app.installTranslator(translator)
             
-        wizard = PluginWizardGui()
-        wizard.setWindowTitle("CINEMA 4D Plugin Wizard")
-        wizard.window().setStyleSheet("QWizard { background: white; }")
-        
-        wizard.show()
-        
-        if g_osx:
-            w = 725
-            h = 425
-            wizard.setMinimumSize(w, h)
-            wizard.window().resize(w, h)
-            wizard.setPixmap(QtGui.QWizard.BackgroundPixmap, QtGui.QPixmap("images/c4dr14bg.png"))
-        else:
-            w = 525
-            h = 425
-            wizard.setMinimumSize(w, h)
-            wizard.window().resize(w, h)
+        wizard = createWizard()
         
         return app.exec_()
     
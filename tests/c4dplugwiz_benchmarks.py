@@ -0,0 +1,265 @@
+# encoding: utf-8
+'''
+Benchmarks for the :py:class:`c4dplugwiz.TextFX` name pipeline.
+
+Every function that takes part in building the token table is run
+against generated corpora (pure ASCII, German umlauts, Greek, combining
+diacritics and mixed names) of varying length and the results are
+reported as ops/sec and as the result size: the mean size in bytes
+of what each call returns (strings and containers included), which
+grows if a change makes the pipeline produce more than it needs to.
+It says nothing about the memory a call allocates while it runs.
+
+Timings only compare well on the machine they were taken on, so no
+baseline is kept in the repository. Save one locally before changing
+the pipeline and compare against it afterwards. Without a path,
+``textfx_baseline.json`` next to this script is used::
+
+    python c4dplugwiz_benchmarks.py --save
+    python c4dplugwiz_benchmarks.py --compare
+    python c4dplugwiz_benchmarks.py --compare my_baseline.json
+
+When comparing, the exit status is 1 if any benchmark got slower than
+the baseline by more than ``--tolerance`` percent.
+
+Memoization is disabled by default so that the raw cost per call is
+measured. Pass ``--cached`` to measure with the TextFX caches enabled.
+
+``--bulk`` additionally times :py:meth:`c4dplugwiz.TextFX.transform_many`
+against calling :py:meth:`c4dplugwiz.TextFX.all_forms` for each name, on
+``--bulk-size`` names of each kind of corpus::
+
+    python c4dplugwiz_benchmarks.py --only all_forms --bulk
+
+@author: andre
+'''
+from __future__ import print_function
+
+import json
+import os
+import random
+import sys
+import time
+
+from argparse import ArgumentParser
+
+from c4dplugwiz import TextFX, BASE_NAME_FORMS, TEXTFX_CACHE_SIZE
+
+
+CURDIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_BASELINE = os.path.join(CURDIR, 'textfx_baseline.json')
+CORPUS_SIZE = 200
+BULK_SIZE = 20000
+CORPUS_SEED = 20131007
+WORD_LENGTHS = {
+    'short': (1, 2),
+    'medium': (3, 5),
+    'long': (8, 14)
+}
+
+SYLLABLES = {
+    'ascii': [u'ma', u'ke', u'Awe', u'so', u'me', u'But', u'ton', u'RSS', u'Gen', u'er',
+              u'a', u'tor', u'Plug', u'in', u'_', u'-', u'(', u')', u'!', u'2'],
+    'umlauts': [u'Mä', u'ke', u'Über', u'sö', u'me', u'Grü', u'ße', u'Straß', u'e', u'Öl',
+                u'kü', u'Äsb', u'ëst'],
+    'greek': [u'α', u'β', u'Γάμ', u'μα', u'Δέλ', u'τα', u'πλ', u'ουγκ', u'ίν', u'Ζή', u'τα', u'Ω'],
+    # decomposed, i.e. letters followed by combining diacritical marks
+    'diacritics': [u'De\u0301', u'ja\u0300', u'vu', u'C\u0327a', u'ne', u'Sn\u0303o', u're',
+                   u'Ho\u0308', u'te\u0302', u'l', u'Ma\u030a', u'rk']
+}
+SYLLABLES['mixed'] = sum(SYLLABLES.values(), [])
+
+
+def make_corpus(kind, length, size=CORPUS_SIZE, seed=CORPUS_SEED):
+    '''
+    Generate ``size`` names made of syllables of ``kind``,
+    with a number of words per name given by ``WORD_LENGTHS[length]``.
+    '''
+    rand = random.Random('%s-%s-%s' % (seed, kind, length))
+    syllables = SYLLABLES[kind]
+    minwords, maxwords = WORD_LENGTHS[length]
+    corpus = []
+    for _ in xrange(size):
+        words = []
+        for _ in xrange(rand.randint(minwords, maxwords)):
+            words.append(u''.join(rand.choice(syllables) for _ in xrange(rand.randint(1, 3))))
+        corpus.append(u' '.join(words))
+    return corpus
+
+
+def get_benchmarks():
+    '''Return a list of ``(name, callable taking one word)`` tuples.'''
+    benchmarks = [
+        ('sanitize', lambda word: TextFX.sanitize(word, safechar='', replace_umlauts=True,
+                                                  replace_diacritics=True, replace_greek=True)),
+        ('clean', lambda word: TextFX.clean(word, safechar=' ')),
+        ('to_camelcase', lambda word: TextFX.to_camelcase(word)),
+        ('split_camelcase', lambda word: TextFX.split_camelcase(word)),
+        ('abbreviate', lambda word: TextFX.abbreviate(word)),
+        ('all_forms', lambda word: TextFX.all_forms(word)),
+    ]
+    for form in BASE_NAME_FORMS:
+        benchmarks.append(('transform:%s' % form, lambda word, form=form: TextFX.transform(word, form)))
+    return benchmarks
+
+
+def measure_speed(func, corpus, min_time=0.2):
+    '''Return ops/sec for calling ``func`` on each word of ``corpus``, repeated for at least ``min_time`` seconds.'''
+    calls = 0
+    start = time.time()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for word in corpus:
+            func(word)
+        calls += len(corpus)
+        elapsed = time.time() - start
+    return calls / elapsed
+
+
+def deep_sizeof(obj):
+    '''Return the size in bytes of ``obj`` including the items of lists, tuples, sets and dicts.'''
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(value) for key, value in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+
+def measure_result_size(func, corpus):
+    '''
+    Return the mean size in bytes of the results of calling ``func`` on each 
+    word of ``corpus``. Python 2 has no way to trace allocations, so this 
+    stands in for the memory each call costs.
+    '''
+    return float(sum(deep_sizeof(func(word)) for word in corpus)) / len(corpus)
+
+
+def run(cached=False, min_time=0.2, only=None):
+    '''
+    Run all benchmarks against all corpora.
+
+    :return: dict of ``{'benchmark/corpus-length': {'ops': ..., 'bytes': ...}}``
+    '''
+    results = {}
+    TextFX.set_cache_size(TEXTFX_CACHE_SIZE if cached else 0)
+    for name, func in get_benchmarks():
+        if only and only not in name:
+            continue
+        for kind in sorted(SYLLABLES):
+            for length in sorted(WORD_LENGTHS):
+                corpus = make_corpus(kind, length)
+                TextFX.clear_caches()
+                key = '%s/%s-%s' % (name, kind, length)
+                results[key] = {
+                    'ops': measure_speed(func, corpus, min_time),
+                    'bytes': measure_result_size(func, corpus)
+                }
+    TextFX.set_cache_size(TEXTFX_CACHE_SIZE)
+    return results
+
+
+def run_bulk(size=BULK_SIZE, cached=False):
+    '''
+    Time ``transform_many`` against an ``all_forms`` loop on ``size``
+    names of each kind of corpus.
+
+    :return: dict of ``{kind: {'loop': seconds, 'bulk': seconds}}``
+    '''
+    results = {}
+    TextFX.set_cache_size(TEXTFX_CACHE_SIZE if cached else 0)
+    for kind in sorted(SYLLABLES):
+        corpus = make_corpus(kind, 'medium', size=size)
+        TextFX.clear_caches()
+        start = time.time()
+        expected = [TextFX.all_forms(word) for word in corpus]
+        loop = time.time() - start
+        TextFX.clear_caches()
+        start = time.time()
+        actual = TextFX.transform_many(corpus)
+        bulk = time.time() - start
+        if actual != expected:
+            raise AssertionError("transform_many and all_forms disagree on the %s corpus" % kind)
+        results[kind] = {'loop': loop, 'bulk': bulk}
+    TextFX.set_cache_size(TEXTFX_CACHE_SIZE)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Print a comparison of ``results`` against ``baseline``.
+
+    :return: list of keys which regressed by more than ``tolerance`` percent.
+    '''
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old_ops = baseline[key]['ops']
+        new_ops = results[key]['ops']
+        change = (new_ops - old_ops) / old_ops * 100.0
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print("%-40s %12.0f %12.0f %+8.1f%%%s" % (key, old_ops, new_ops, change, flag))
+    return regressions
+
+
+def print_results(results):
+    print("%-40s %12s %18s" % ("benchmark/corpus", "ops/sec", "result size (B)"))
+    for key in sorted(results):
+        entry = results[key]
+        print("%-40s %12.0f %18.0f" % (key, entry['ops'], entry['bytes']))
+
+
+def print_bulk_results(results, size):
+    print("%-18s %12s %16s %8s" % ("corpus", "all_forms", "transform_many", "speedup"))
+    for kind in sorted(results):
+        entry = results[kind]
+        print("%-18s %10.3f s %14.3f s %7.1fx" % ("%s-%d" % (kind, size), entry['loop'], entry['bulk'],
+                                                  entry['loop'] / entry['bulk']))
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Benchmark the TextFX name pipeline.")
+    parser.add_argument('--save', metavar='path', nargs='?', const=DEFAULT_BASELINE, 
+                        help="save results as baseline to path. [default path: %s]" % DEFAULT_BASELINE)
+    parser.add_argument('--compare', metavar='path', nargs='?', const=DEFAULT_BASELINE, 
+                        help="compare results against the baseline at path. [default path: %s]" % DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help="allowed slowdown in percent before a benchmark counts as regressed [default: %(default)s]")
+    parser.add_argument('--min-time', dest='min_time', type=float, default=0.2,
+                        help="min. seconds to run each benchmark for [default: %(default)s]")
+    parser.add_argument('--cached', action='store_true', help="keep TextFX memoization enabled.")
+    parser.add_argument('--only', metavar='str', help="only run benchmarks whose name contains str.")
+    parser.add_argument('--bulk', action='store_true', help="also compare transform_many with an all_forms loop.")
+    parser.add_argument('--bulk-size', dest='bulk_size', type=int, default=BULK_SIZE,
+                        help="names per corpus for --bulk [default: %(default)s]")
+    args = parser.parse_args(argv)
+
+    results = run(cached=args.cached, min_time=args.min_time, only=args.only)
+    print_results(results)
+    if args.bulk:
+        print("")
+        print_bulk_results(run_bulk(args.bulk_size, cached=args.cached), args.bulk_size)
+
+    if args.save:
+        dirpath = os.path.dirname(args.save)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        with open(args.save, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1, sort_keys=True, 
+                      separators=(',', ': '))
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        print("")
+        print("%-40s %12s %12s %9s" % ("benchmark/corpus", "baseline", "current", "change"))
+        if len(compare(results, baseline, args.tolerance)) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# encoding: utf-8
+'''
+Warm-run benchmark for :py:class:`c4dplugwiz.GenerationEngine`.
+
+An engine reads each template into memory on its first run and serves
+later runs from there. This script generates the same plugin type
+in-process and reports the wall time (min and median over ``--repeat``
+runs) of:
+
+    plain   a new ``PluginWizard`` for each run
+    cold    the first run of a new engine
+    warm    the second run of the same engine
+
+The exit status is 1 if the warm runs aren't faster than both the
+cold runs and the plain ones::
+
+    python c4dplugwiz_engine_benchmarks.py
+    python c4dplugwiz_engine_benchmarks.py -s ../source/c4dplugwiz_data/python -t cmdplugin
+
+@author: andre
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+
+CURDIR = os.path.dirname(os.path.realpath(__file__))
+SOURCEDIR = os.path.realpath(os.path.join(CURDIR, os.pardir, 'source'))
+DEFAULT_SRCDATA = os.path.join(SOURCEDIR, 'c4dplugwiz_data', 'cpp')
+DEFAULT_TYPE = 'shaderplugin'
+
+sys.path.insert(0, SOURCEDIR)
+
+import c4dplugwiz  # @UnresolvedImport
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def run(srcdata_path, plugin_type, repeat=10):
+    '''
+    Run all scenarios ``repeat`` times each.
+
+    :return: dict of ``{scenario: {'min': ms, 'median': ms}}``
+    '''
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.environ['C4DPLUGWIZ_CACHE'] = os.path.join(tempdir, 'cache')
+        config = dict(c4dplugwiz.CONFIG_DEFAULT, srcdataPath=srcdata_path, pluginId='1000001',
+                      author='Bench Author', org='Bench Org')
+        runs = []
+        def timed(generate):
+            # a new plugin name each time, so no run has to overwrite
+            runs.append(None)
+            plugin_config = dict(config, pluginName='Bench Plugin %d' % len(runs))
+            start = time.time()
+            generate(plugin_config)
+            return (time.time() - start) * 1000.0
+        def plain(plugin_config):
+            c4dplugwiz.PluginWizard(plugin_config, plugin_type).generate(tempdir)
+        timings = {'plain': [], 'cold': [], 'warm': []}
+        # warm up the OS file cache first
+        timed(plain)
+        for _ in range(repeat):
+            timings['plain'].append(timed(plain))
+            engine = c4dplugwiz.GenerationEngine()
+            generate = lambda plugin_config: engine.generate(plugin_config, tempdir, plugin_type)
+            timings['cold'].append(timed(generate))
+            timings['warm'].append(timed(generate))
+        return dict((name, {'min': min(values), 'median': median(values)})
+                    for name, values in timings.items())
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Compare warm GenerationEngine runs with cold and plain ones.")
+    parser.add_argument('-s', '--srcdata', default=DEFAULT_SRCDATA,
+                        help="source data dir [default: %(default)s]")
+    parser.add_argument('-t', '--type', default=DEFAULT_TYPE,
+                        help="plugin type to generate [default: %(default)s]")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="runs per scenario [default: %(default)s]")
+    args = parser.parse_args(argv)
+
+    results = run(os.path.realpath(args.srcdata), args.type, args.repeat)
+    print("%-8s %10s %10s" % ("scenario", "min", "median"))
+    for name in ('plain', 'cold', 'warm'):
+        print("%-8s %7.1f ms %7.1f ms" % (name, results[name]['min'], results[name]['median']))
+    warm = results['warm']['median']
+    print("")
+    print("warm runs are %.1fx as fast as cold runs and %.1fx as fast as plain runs" %
+          (results['cold']['median'] / warm, results['plain']['median'] / warm))
+    return 0 if warm < results['cold']['median'] and warm < results['plain']['median'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+# encoding: utf-8
+'''
+Cold-start benchmark for the ``c4dplugwiz`` command line tool.
+
+Editors and build scripts run the wizard as a short-lived process, so
+the fixed cost of starting it matters more than raw throughput. This
+script starts a fresh interpreter for each of the following scenarios
+and reports the wall time (min and median over ``--repeat`` runs):
+
+    import       ``import c4dplugwiz``
+    version      ``c4dplugwiz.py --version``
+    list-tokens  ``c4dplugwiz.py --list-tokens``
+    generate     generate a plugin from the test templates
+
+If the interpreter supports ``-X importtime`` (Python 3.7+), the slowest
+imports of ``import c4dplugwiz`` are listed as well. Otherwise the
+modules loaded by the import are counted instead.
+
+Medians are checked against the budget in ``startup_budget.json``::
+
+    python c4dplugwiz_startup.py
+    python c4dplugwiz_startup.py --budget my_budget.json --repeat 20
+
+The exit status is 1 if any scenario exceeds its budget.
+
+@author: andre
+'''
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+
+CURDIR = os.path.dirname(os.path.realpath(__file__))
+SOURCEDIR = os.path.realpath(os.path.join(CURDIR, os.pardir, 'source'))
+SOURCESDIR = os.path.join(CURDIR, 'data', 'sources')
+SCRIPT = os.path.join(SOURCEDIR, 'c4dplugwiz.py')
+DEFAULT_BUDGET = os.path.join(CURDIR, 'startup_budget.json')
+
+
+def get_scenarios(destdir):
+    '''Return a list of ``(name, list of interpreter args)`` tuples.'''
+    return [
+        ('import', ['-c', 'import c4dplugwiz']),
+        ('version', [SCRIPT, '--version']),
+        ('list-tokens', [SCRIPT, '--list-tokens', '-s', SOURCESDIR]),
+        ('generate', [SCRIPT, '-c', '-f', '-s', SOURCESDIR, '-t', 'contenttests', '-d', destdir,
+                      '-a', 'Bench Author', '-o', 'Bench Org', '1000001', 'Bench Plugin'])
+    ]
+
+
+def get_env(cachedir):
+    '''Environment for the child processes, isolated from the user's cache dir.'''
+    env = dict(os.environ)
+    pythonpath = env.get('PYTHONPATH')
+    env['PYTHONPATH'] = SOURCEDIR if not pythonpath else os.pathsep.join([SOURCEDIR, pythonpath])
+    env['C4DPLUGWIZ_CACHE'] = cachedir
+    # measure with compiled .pyc files, as installed copies have them
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env.setdefault('C4DPLUGWIZ_AUTHORNAME', 'Bench Author')
+    return env
+
+
+def run_once(python, args, env):
+    '''Run ``python`` with ``args`` and return the wall time in milliseconds.'''
+    start = time.time()
+    proc = subprocess.Popen([python] + args, cwd=SOURCEDIR, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    elapsed = (time.time() - start) * 1000.0
+    # argparse's --version exits with 0 as well
+    if proc.returncode != 0:
+        raise RuntimeError("'%s' failed with exit status %d:%s%s" %
+                           (' '.join(args), proc.returncode, os.linesep, err or out))
+    return elapsed
+
+
+def median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2 == 1:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def import_profile(python, env, top=10):
+    '''
+    Return ``(kind, lines)`` describing what ``import c4dplugwiz`` loads:
+    the ``top`` slowest imports as reported by ``-X importtime`` or, if
+    the interpreter doesn't support it, the names of all loaded modules.
+    '''
+    proc = subprocess.Popen([python, '-X', 'importtime', '-c', 'import c4dplugwiz'], cwd=SOURCEDIR,
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    if not isinstance(err, str):
+        err = err.decode('utf-8', 'replace')
+    rows = []
+    for line in err.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        rows.append((int(parts[1]), int(parts[0]), parts[2].rstrip()))
+    if rows:
+        rows.sort(reverse=True)
+        lines = ["%8.1f ms %8.1f ms  %s" % (cumulative / 1000.0, own / 1000.0, name)
+                 for cumulative, own, name in rows[:top]]
+        return 'importtime', lines
+    code = ('import sys; before = set(sys.modules); import c4dplugwiz; '
+            'print(" ".join(sorted(m for m in set(sys.modules) - before if sys.modules[m] is not None)))')
+    proc = subprocess.Popen([python, '-c', code], cwd=SOURCEDIR, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError("importing c4dplugwiz failed:%s%s" % (os.linesep, err))
+    if not isinstance(out, str):
+        out = out.decode('utf-8', 'replace')
+    return 'modules', out.split()
+
+
+def run(python, repeat=10):
+    '''
+    Run all scenarios ``repeat`` times each.
+
+    :return: dict of ``{scenario: {'min': ms, 'median': ms}}``
+    '''
+    tempdir = tempfile.mkdtemp()
+    try:
+        env = get_env(os.path.join(tempdir, 'cache'))
+        results = {}
+        for name, args in get_scenarios(os.path.join(tempdir, 'output')):
+            # warm up the OS file cache and write .pyc files first,
+            # cold here means a new process, not a cold disk
+            run_once(python, args, env)
+            timings = [run_once(python, args, env) for _ in range(repeat)]
+            results[name] = {'min': min(timings), 'median': median(timings)}
+        return results, import_profile(python, env)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def check_budget(results, budget):
+    '''
+    Print results next to the budget.
+
+    :return: list of scenarios whose median exceeds the budget.
+    '''
+    over = []
+    print("%-14s %10s %10s %10s" % ("scenario", "min", "median", "budget"))
+    for name in sorted(results):
+        limit = budget.get(name)
+        flag = ''
+        if limit is not None and results[name]['median'] > limit:
+            flag = '  OVER BUDGET'
+            over.append(name)
+        print("%-14s %7.1f ms %7.1f ms %10s%s" % (name, results[name]['min'], results[name]['median'],
+                                                 'n/a' if limit is None else '%.0f ms' % limit, flag))
+    return over
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Measure the cold-start time of the c4dplugwiz CLI.")
+    parser.add_argument('--python', default=sys.executable,
+                        help="interpreter to run c4dplugwiz with [default: %(default)s]")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="runs per scenario [default: %(default)s]")
+    parser.add_argument('--budget', metavar='path', default=DEFAULT_BUDGET,
+                        help="JSON file with the max. median in ms per scenario [default: %(default)s]")
+    parser.add_argument('--save', metavar='path', help="save results to path.")
+    args = parser.parse_args(argv)
+
+    results, (kind, lines) = run(args.python, args.repeat)
+    with open(args.budget, 'r') as f:
+        budget = json.load(f)
+    over = check_budget(results, budget)
+    print("")
+    if kind == 'importtime':
+        print("Slowest imports (cumulative, self):")
+    else:
+        print("Modules loaded by 'import c4dplugwiz' (%d):" % len(lines))
+    for line in lines:
+        print("   %s" % line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': args.python, 'results': results}, f, indent=1, sort_keys=True)
+    return 1 if len(over) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,9 +9,27 @@ import codecs
 import os
 import re
 import shutil
+import sys
+import tempfile
+import json
+import zipfile
+import tarfile
+import time
 import unittest
 
-from c4dplugwiz import TextFX, PluginWizard, CLIError, PLUGIN_TYPE_DEFAULT
+from contextlib import closing
+from StringIO import StringIO
+
+from c4dplugwiz import (TextFX, PluginWizard, CLIError, TemplateIndex, PLUGIN_TYPE_DEFAULT, 
+                        TEXTFX_CACHE_SIZE, BASE_NAME_FORMS, DEFAULT_BLOBDIR,
+                        dedup_templates, copy_template, list_plugin_types, pack_templates, 
+                        open_template_archive, read_source_file, TemplateBundle, ZipTemplateArchive,
+                        TarTemplateArchive, TemplateArchive,
+                        get_author_name, DEFAULT_ENV_AUTHOR, DEFAULT_ENV_CACHE, TokenTable, TemplatePreview,
+                        get_template_info, GenerationEngine, NDJSONEventWriter, CancellationToken,
+                        GenerationCancelled, ROLLBACK_SUFFIX, GenerationStats, save_profile, MemoryTracer,
+                        FileSystemCounter, SamplingProfiler, RunHistory, summarize_history, percentile)
+import c4dplugwiz
 
 
 CURDIR = os.path.abspath(os.curdir)
@@ -223,6 +241,144 @@ class TestTextFX(unittest.TestCase):
                                      replace_greek=True, 
                                      allowed_chars=r'\\')
             self.assertEqual(result, expected[i])
+
+    def testAllForms(self):
+        '''Test all_forms and transform against known results for every form'''
+        # results of the original implementation, which computed each form on its own
+        expected = {
+            u'Make Awesome Button': {
+                'Entered': u'Make Awesome Button',
+                'Cleaned': u'Make Awesome Button',
+                'Uppercase': u'MAKE AWESOME BUTTON',
+                'Lowercase': u'make awesome button',
+                'ID': u'MakeAwesomeButton',
+                'UppercaseID': u'MAKEAWESOMEBUTTON',
+                'LowercaseID': u'makeawesomebutton',
+                'UppercaseIDSep': u'MAKE_AWESOME_BUTTON',
+                'LowercaseIDSep': u'make_awesome_button',
+                'Abbreviation': u'MAB',
+                'Initials': u'MAB'
+            },
+            u'RSS Generator': {
+                'Entered': u'RSS Generator',
+                'Cleaned': u'RSS Generator',
+                'Uppercase': u'RSS GENERATOR',
+                'Lowercase': u'rss generator',
+                'ID': u'RSSGenerator',
+                'UppercaseID': u'RSSGENERATOR',
+                'LowercaseID': u'rssgenerator',
+                'UppercaseIDSep': u'RSS_GENERATOR',
+                'LowercaseIDSep': u'rss_generator',
+                'Abbreviation': u'RG',
+                'Initials': u'RG'
+            },
+            u'AndisSSuper_PluginSTOP ': {
+                'Entered': u'AndisSSuper_PluginSTOP ',
+                'Cleaned': u'AndisSSuper_PluginSTOP ',
+                'Uppercase': u'ANDISSSUPER_PLUGINSTOP ',
+                'Lowercase': u'andisssuper_pluginstop ',
+                'ID': u'AndisSSuper_PluginSTOP_',
+                'UppercaseID': u'ANDISSSUPERPLUGINSTOP',
+                'LowercaseID': u'andisssuperpluginstop',
+                'UppercaseIDSep': u'ANDISSSUPER_PLUGINSTOP_',
+                'LowercaseIDSep': u'andisssuper_pluginstop_',
+                'Abbreviation': u'ASPS',
+                'Initials': u'ASP'
+            },
+            u'hot_flaming cats': {
+                'Entered': u'hot_flaming cats',
+                'Cleaned': u'hot_flaming cats',
+                'Uppercase': u'HOT_FLAMING CATS',
+                'Lowercase': u'hot_flaming cats',
+                'ID': u'Hot_flaming_cats',
+                'UppercaseID': u'HOTFLAMINGCATS',
+                'LowercaseID': u'hotflamingcats',
+                'UppercaseIDSep': u'HOT_FLAMING_CATS',
+                'LowercaseIDSep': u'hot_flaming_cats',
+                'Abbreviation': u'',
+                'Initials': u''
+            },
+            u'Süper Düper Plügin': {
+                'Entered': u'Süper Düper Plügin',
+                'Cleaned': u'Sueper Dueper Pluegin',
+                'Uppercase': u'SÜPER DÜPER PLÜGIN',
+                'Lowercase': u'süper düper plügin',
+                'ID': u'SueperDueperPluegin',
+                'UppercaseID': u'SUEPERDUEPERPLUEGIN',
+                'LowercaseID': u'sueperdueperpluegin',
+                'UppercaseIDSep': u'SUEPER_DUEPER_PLUEGIN',
+                'LowercaseIDSep': u'sueper_dueper_pluegin',
+                'Abbreviation': u'SDP',
+                'Initials': u'SDP'
+            },
+            u'Déjà-vu (_+=?!)': {
+                'Entered': u'Déjà-vu (_+=?!)',
+                'Cleaned': u'Deja-vu (_+= !)',
+                'Uppercase': u'DÉJÀ-VU (_+=?!)',
+                'Lowercase': u'déjà-vu (_+=?!)',
+                'ID': u'Deja-vu_(_+=_!)',
+                'UppercaseID': u'DEJA-VU(+=!)',
+                'LowercaseID': u'deja-vu(+=!)',
+                'UppercaseIDSep': u'DEJA-VU_(_+=_!)',
+                'LowercaseIDSep': u'deja-vu_(_+=_!)',
+                'Abbreviation': u'D',
+                'Initials': u'D'
+            },
+            u'Süper Düper πPlugin': {
+                'Entered': u'Süper Düper πPlugin',
+                'Cleaned': u'Sueper Dueper piPlugin',
+                'Uppercase': u'SÜPER DÜPER ΠPLUGIN',
+                'Lowercase': u'süper düper πplugin',
+                'ID': u'SueperDueperPiplugin',
+                'UppercaseID': u'SUEPERDUEPERPIPLUGIN',
+                'LowercaseID': u'sueperdueperpiplugin',
+                'UppercaseIDSep': u'SUEPER_DUEPER_PIPLUGIN',
+                'LowercaseIDSep': u'sueper_dueper_piplugin',
+                'Abbreviation': u'SDP',
+                'Initials': u'SDP'
+            }
+        }
+        for sample, forms in expected.items():
+            self.assertEqual(TextFX.all_forms(sample), forms)
+            for form in BASE_NAME_FORMS:
+                self.assertEqual(TextFX.transform(sample, form), forms[form])
+        self.assertEqual(TextFX.all_forms(u'Make Awesome Button', ['ID', 'Initials']), 
+                         {'ID': u'MakeAwesomeButton', 'Initials': u'MAB'})
+        self.assertRaises(ValueError, TextFX.all_forms, u'Make Awesome Button', ['Bogus'])
+
+    def testTransformMany(self):
+        '''Test that bulk transformation matches all_forms, duplicates included'''
+        data = [u'Make Awesome Button', u'André Berg', 'RSS Generator', '', 
+                u'Déjà-vu (_+=?!)', u'Make Awesome Button']
+        data += ['Plugin %d (copy)' % i for i in range(64)]
+        TextFX.clear_caches()
+        results = TextFX.transform_many(data)
+        # the batch doesn't go through (and evict from) the memoization caches
+        self.assertEqual(sum(info['misses'] for info in TextFX.cache_info().values()), 0)
+        self.assertEqual(len(results), len(data))
+        for sample, forms in zip(data, results):
+            self.assertEqual(forms, TextFX.all_forms(sample))
+        results = TextFX.transform_many(data[:2], ['ID', 'Initials'])
+        self.assertEqual(results[0], {'ID': 'MakeAwesomeButton', 'Initials': 'MAB'})
+        self.assertEqual(TextFX.transform_many(data[:2], []), [{}, {}])
+        self.assertRaises(ValueError, TextFX.transform_many, data[:2], ['Bogus'])
+
+    def testTransformCache(self):
+        '''Test memoization of TextFX transforms'''
+        TextFX.clear_caches()
+        first = TextFX.transform(u'Make Awesome Button', 'ID')
+        second = TextFX.transform(u'Make Awesome Button', 'ID')
+        self.assertEqual(first, second)
+        info = TextFX.cache_info()['transform']
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 1)
+        try:
+            TextFX.set_cache_size(2)
+            for sample in ['Super Duper Plugin', 'RSS Generator', 'My Plugin']:
+                TextFX.transform(sample, 'ID')
+            self.assertEqual(TextFX.cache_info()['transform']['size'], 2)
+        finally:
+            TextFX.set_cache_size(TEXTFX_CACHE_SIZE)
             
 
 class TestFolderStructure(unittest.TestCase):
@@ -251,6 +407,23 @@ class TestFolderStructure(unittest.TestCase):
                 text_expected = re.sub(search, replace, text_expected)
         
         return self.assertMultiLineEqual(text_actual, text_expected)
+    
+    def mainError(self, args, cwd):
+        '''Run the command line with ``args`` in ``cwd`` and return the error it failed with.'''
+        argv = ['c4dplugwiz', '-s', os.path.abspath(SOURCESDIR), '-t', 'contenttests', '-d', cwd] + args
+        curdir = os.getcwd()
+        stderr = sys.stderr
+        os.chdir(cwd)
+        sys.stderr = StringIO()
+        try:
+            try:
+                self.assertEqual(c4dplugwiz.main(argv, extend=False), 2)
+                return sys.stderr.getvalue()
+            except CLIError as e:
+                return str(e)
+        finally:
+            sys.stderr = stderr
+            os.chdir(curdir)
       
     def testInitialization(self):        
         bogusrootdir = './data/doesnexist'
@@ -268,6 +441,43 @@ class TestFolderStructure(unittest.TestCase):
         self.assertEqual(os.path.join(CURDIR, 'data', 'rules.py'), pw._rules_filepath)
         self.assertTrue(len(pw._rules_list) > 0)
         
+    def testLazyTokenTable(self):
+        config = dict(CONFIG_DEFAULT)
+        config['author'] = None
+        pw = PluginWizard(config)
+        self.assertEqual(len(pw._token_table), len(PluginWizard.token_forms))
+        self.assertFalse(pw._token_table.is_built('AuthorName'))
+        self.assertEqual(pw._token_table['PluginName']['UppercaseID'], 'MAKEAWESOMEBUTTON')
+        self.assertFalse(pw._token_table.is_built('AuthorName'))
+        
+    def testTokenTableListing(self):
+        listing = PluginWizard.get_tokentable_listing()
+        self.assertTrue('PluginNameAsUppercaseID' in listing)
+        table = TokenTable.for_config({'pluginId': 1000003, 'pluginName': "Make Awesome Button", 
+                                       'author': None, 'org': None})
+        listing = PluginWizard.get_tokentable_listing(table=table, datums=['PluginName'])
+        self.assertTrue('PluginNameAsUppercaseID: MAKEAWESOMEBUTTON' in listing)
+        self.assertFalse('AuthorName' in listing)
+        self.assertFalse(table.is_built('AuthorName'))
+        
+    def testAuthorNameCache(self):
+        tempdir = tempfile.mkdtemp()
+        environ = dict(os.environ)
+        try:
+            os.environ.pop(DEFAULT_ENV_AUTHOR, None)
+            os.environ[DEFAULT_ENV_CACHE] = tempdir
+            get_author_name.cached = None
+            with open(os.path.join(tempdir, 'author.json'), 'w') as f:
+                json.dump({'name': 'Cached Author', 'time': time.time()}, f)
+            self.assertEqual(get_author_name(), 'Cached Author')
+            os.environ[DEFAULT_ENV_AUTHOR] = 'Env Author'
+            self.assertEqual(get_author_name(), 'Env Author')
+        finally:
+            get_author_name.cached = None
+            os.environ.clear()
+            os.environ.update(environ)
+            shutil.rmtree(tempdir)
+        
     def testFileNameProcessing(self):
         rootdir = os.path.abspath('./data/output/filenametests')
         sourcedir = os.path.abspath('./data/sources/filenametests')
@@ -296,6 +506,20 @@ class TestFolderStructure(unittest.TestCase):
                 m += 1
         self.assertEqual(n, m, 'number of input files should equal number expected output files')
         
+    def testFileNameProcessingWithoutRules(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            shutil.copy2(os.path.join(SOURCESDIR, 'filenametests', '%!ID!%.txt'), tempdir)
+            config = dict(CONFIG_DEFAULT)
+            del config['rulesFile']
+            pw = PluginWizard(config, 'contenttests')
+            pw.set_destdir(tempdir)
+            pw.process_names(overwrite=True)
+            self.assertEqual(pw._rules_filepath, None)
+            self.assertEqual(os.listdir(tempdir), ['%s.txt' % config['pluginId']])
+        finally:
+            shutil.rmtree(tempdir)
+        
     def testFileContentsProcessing(self):
         destdir = os.path.abspath('./data/output/contenttests')
         sourcedir = os.path.abspath('./data/sources/contenttests')
@@ -321,6 +545,621 @@ class TestFolderStructure(unittest.TestCase):
                 m += 1
         self.assertEqual(n, m, 'number of input files should equal number expected output files')
 
+    def testGenerate(self):
+        tempdir = tempfile.mkdtemp()
+        steps = []
+        try:
+            config = dict(CONFIG_DEFAULT)
+            pw = PluginWizard(config, 'contenttests', progress=lambda *args: steps.append(args))
+            destpath = pw.generate(os.path.join(tempdir, 'plugins'), createdir=True)
+            self.assertEqual(destpath, os.path.join(os.path.realpath(tempdir), 'plugins', config['pluginName']))
+            self.assertTrue(os.path.isdir(destpath))
+            self.assertEqual(steps[0][0], 'copy')
+            contents = [step for step in steps if step[0] == 'contents']
+            self.assertEqual(len(contents), len(os.listdir(destpath)))
+            self.assertEqual(contents[-1][1:3], (len(contents), len(contents)))
+            self.assertRaises(CLIError, pw.generate, os.path.join(tempdir, 'plugins'))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testEvents(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            stream = StringIO()
+            pw = PluginWizard(dict(CONFIG_DEFAULT), 'contenttests', events=NDJSONEventWriter(stream))
+            destpath = pw.generate(tempdir)
+            self.assertRaises(CLIError, pw.generate, tempdir)
+            events = [json.loads(line) for line in stream.getvalue().splitlines()]
+            phases = [(e['event'], e['phase']) for e in events if e['event'] in ('start', 'end')]
+            self.assertEqual(phases[:2], [('start', 'rules'), ('end', 'rules')])
+            self.assertEqual(phases[2:10], [('start', 'generate'), ('start', 'copy'), ('end', 'copy'), 
+                                            ('start', 'names'), ('end', 'names'), 
+                                            ('start', 'contents'), ('end', 'contents'), ('end', 'generate')])
+            files = [e for e in events if e['event'] == 'file']
+            self.assertEqual(len(files), 1)
+            self.assertEqual(files[0]['bytes'], os.path.getsize(os.path.join(destpath, 'testfile1.py')))
+            self.assertEqual(events[-2]['event'], 'error')
+            self.assertEqual((events[-1]['event'], events[-1]['phase']), ('end', 'generate'))
+            self.assertTrue(all(e['pluginId'] == CONFIG_DEFAULT['pluginId'] for e in events))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testStats(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            events = []
+            stats = GenerationStats(events.append)
+            pw = PluginWizard(dict(CONFIG_DEFAULT), 'contenttests', events=stats)
+            destpath = pw.generate(tempdir)
+            pw.generate(tempdir, overwrite=True)
+            summary = stats.summary()
+            self.assertEqual(list(summary), ['rules', 'rmtree', 'copy', 'names', 'contents', 'generate'])
+            self.assertEqual(summary['generate']['runs'], 2)
+            source = os.path.join(SOURCESDIR, 'contenttests', 'testfile1.py')
+            self.assertEqual(summary['copy']['files'], 2)
+            self.assertEqual(summary['copy']['bytes'], 2 * os.path.getsize(source))
+            self.assertEqual(summary['rmtree']['runs'], 1)
+            self.assertEqual(summary['contents']['files'], 2)
+            self.assertEqual(summary['generate']['bytes'], 2 * os.path.getsize(os.path.join(destpath, 'testfile1.py')))
+            self.assertTrue(summary['generate']['wall'] >= summary['contents']['wall'] > 0)
+            self.assertEqual(summary['rules']['filesPerSec'], None)
+            self.assertTrue(summary['contents']['mbPerSec'] > 0)
+            self.assertEqual(len([e for e in events if e['event'] == 'end']), 
+                             sum(entry['runs'] for entry in summary.values()))
+            self.assertTrue('contents' in stats.format())
+            # with a space the plugin id is taken as the format
+            message = self.mainError(['--stats', '1000002', 'Keep Me'], tempdir)
+            self.assertTrue('--stats=format' in message)
+            message = self.mainError(['--stats=yaml', '1000002', 'Keep Me'], tempdir)
+            self.assertTrue("invalid --stats format 'yaml'" in message)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testTraceMemory(self):
+        tempdir = tempfile.mkdtemp()
+        tracer = MemoryTracer()
+        tracer.start()
+        try:
+            PluginWizard(dict(CONFIG_DEFAULT), 'contenttests', events=tracer).generate(tempdir)
+            types = tracer.top_types()
+            summary = tracer.summary()
+            self.assertEqual(list(summary), ['rules', 'copy', 'names', 'contents', 'generate'])
+            self.assertEqual(summary['generate']['runs'], 1)
+            if c4dplugwiz.current_rss() is not None:
+                entry = summary['generate']
+                self.assertEqual(entry['rssGrowth'], entry['rssEnd'] - entry['rssStart'])
+                self.assertTrue(entry['rssEnd'] >= summary['contents']['rssEnd'] > 0)
+            self.assertTrue(0 < len(types) <= c4dplugwiz.TRACE_MEMORY_TOP)
+            self.assertEqual(types, sorted(types, key=lambda t: -t[2]))
+            self.assertTrue('contents' in tracer.format(types))
+            # nothing is recorded once stopped
+            tracer.stop()
+            PluginWizard(dict(CONFIG_DEFAULT), 'contenttests', events=tracer).generate(tempdir, overwrite=True)
+            self.assertEqual(tracer.summary()['generate']['runs'], 1)
+        finally:
+            tracer.stop()
+            shutil.rmtree(tempdir)
+
+    def testCountFileSystem(self):
+        tempdir = tempfile.mkdtemp()
+        rename = os.rename
+        counter = FileSystemCounter()
+        counter.start()
+        try:
+            PluginWizard(dict(CONFIG_DEFAULT), 'contenttests', events=counter).generate(tempdir)
+        finally:
+            counter.stop()
+            shutil.rmtree(tempdir)
+        self.assertTrue(os.rename is rename)
+        summary = counter.summary()
+        self.assertEqual(summary['copy']['operations']['shutil.copytree']['count'], 1)
+        self.assertEqual(summary['names']['operations']['os.walk']['count'], 1)
+        # the backup and the processed file
+        self.assertEqual(summary['contents']['operations']['open']['count'], 2)
+        self.assertTrue(summary['contents']['operations']['os.rename']['count'] >= 1)
+        self.assertFalse('os.path.getsize' in summary['contents']['operations'])
+        self.assertTrue(summary['copy']['syscalls'] > 0)
+        self.assertFalse('shutil.rmtree' in summary.get('other', {}).get('operations', {}))
+        self.assertTrue('round-trips' in counter.format())
+        # put back when the command line fails too
+        try:
+            result = c4dplugwiz.main(['c4dplugwiz', '--count-fs', '--trace-memory', '--no-history', 
+                                      '-s', SOURCESDIR, '1000001'], extend=False)
+            self.assertEqual(result, 2)
+        except CLIError:
+            pass
+        self.assertTrue(os.rename is rename)
+
+    def testProfile(self):
+        import cProfile
+        tempdir = tempfile.mkdtemp()
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            PluginWizard(dict(CONFIG_DEFAULT), 'contenttests').generate(tempdir)
+            profiler.disable()
+            stream = StringIO()
+            path = os.path.join(tempdir, 'run.pstats')
+            collapsed_path = save_profile(profiler, path, top=5, stream=stream)
+            self.assertEqual(collapsed_path, os.path.join(tempdir, 'run.collapsed.txt'))
+            self.assertTrue(os.path.isfile(path))
+            self.assertTrue('render_line' in stream.getvalue())
+            with open(collapsed_path) as f:
+                stacks = [line.rsplit(' ', 1) for line in f.read().splitlines()]
+            self.assertTrue(all(int(count) > 0 for _, count in stacks))
+            self.assertTrue(any(stack.split(';')[-1].endswith('(render_line)') and '(_process_content)' in stack 
+                                for stack, _ in stacks))
+            # reported like other command line errors, before the run
+            missing = os.path.join(tempdir, 'missing', 'run.pstats')
+            try:
+                self.assertEqual(c4dplugwiz.main(['c4dplugwiz', '--profile=' + missing], extend=False), 2)
+            except CLIError:
+                pass
+            self.assertFalse(os.path.exists(os.path.dirname(missing)))
+            # with a space the plugin id is taken as the path
+            message = self.mainError(['--profile', '1000002', 'Keep Me'], tempdir)
+            self.assertTrue('--profile=path' in message)
+            self.assertEqual(sorted(os.listdir(tempdir)), ['Make Awesome Button', 'run.collapsed.txt', 'run.pstats'])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testRunHistory(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            history = RunHistory(os.path.join(tempdir, 'cache', 'history.ndjson'))
+            engine = GenerationEngine(history=history)
+            for i in range(3):
+                engine.generate(dict(CONFIG_DEFAULT, pluginName='Logged Plugin %d' % i), tempdir, 'contenttests')
+            self.assertRaises(CLIError, engine.generate, dict(CONFIG_DEFAULT, pluginName='Logged Plugin 0'), 
+                              tempdir, 'contenttests')
+            records = list(history.records())
+            # failed runs aren't recorded
+            self.assertEqual(len(records), 3)
+            self.assertEqual(records[0]['type'], 'contenttests')
+            self.assertEqual(records[0]['files'], 1)
+            self.assertTrue(records[0]['wall'] >= records[0]['phases']['contents'] > 0)
+            with open(history.path, 'ab') as f:
+                f.write('{"cut short')
+            rows = summarize_history(history.records(), by='day')
+            self.assertEqual(len(rows), 1)
+            self.assertEqual(rows[0]['runs'], 3)
+            self.assertEqual(rows[0]['p95'], max(r['wall'] for r in records))
+            self.assertTrue(rows[0]['filesPerSec'] > 0)
+            self.assertEqual(summarize_history(history.records(), plugin_type='filenametests'), [])
+            self.assertEqual(percentile([3, 1, 2, 4], 50), 2)
+            self.assertEqual(percentile(range(1, 101), 95), 95)
+            self.assertEqual(percentile([], 50), None)
+            size = c4dplugwiz.HISTORY_MAX_BYTES
+            try:
+                c4dplugwiz.HISTORY_MAX_BYTES = 0
+                history.append({'time': 0})
+            finally:
+                c4dplugwiz.HISTORY_MAX_BYTES = size
+            self.assertTrue(os.path.isfile(history.path + '.old'))
+            # records missing keys are skipped
+            history.append(dict(records[0], cache=None))
+            history.append(dict((key, value) for key, value in records[0].items() if key != 'cache'))
+            self.assertEqual(len(list(history.records())), 4)
+            rows = summarize_history(history.records())
+            self.assertEqual(rows[0]['runs'], 4)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testSamplingProfiler(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'samples.txt')
+            engine = GenerationEngine()
+            configs = [dict(CONFIG_DEFAULT, pluginName='Sampled Plugin %d' % i) for i in range(20)]
+            with SamplingProfiler(path, rate=1000, flush_interval=0.01) as sampler:
+                start = time.time()
+                engine.generate_many(configs, tempdir, 'contenttests', workers=2)
+                while not os.path.exists(path) and time.time() - start < 5:
+                    time.sleep(0.01)
+                # written periodically, before being stopped
+                self.assertTrue(os.path.exists(path))
+            self.assertTrue(sampler.samples > 0)
+            with open(path) as f:
+                stacks = [line.rsplit(' ', 1) for line in f.read().splitlines()]
+            self.assertTrue(sum(int(count) for _, count in stacks) >= sampler.samples)
+            self.assertTrue(any('(generate_many)' in stack for stack, _ in stacks))
+            self.assertRaises(ValueError, SamplingProfiler, path, rate=0)
+            self.assertRaises(ValueError, SamplingProfiler, path, rate=-10)
+            self.assertEqual(c4dplugwiz.positive_float('2.5'), 2.5)
+            from argparse import ArgumentTypeError
+            for value in ('0', '-1', 'nan', 'fast'):
+                self.assertRaises(ArgumentTypeError, c4dplugwiz.positive_float, value)
+            # with a space the plugin id is taken as the path
+            outdir = os.path.join(tempdir, 'cli')
+            os.mkdir(outdir)
+            message = self.mainError(['--sample', '1000002', 'Keep Me'], outdir)
+            self.assertTrue('--sample=path' in message)
+            self.assertEqual(os.listdir(outdir), [])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testCancellation(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            config = dict(CONFIG_DEFAULT)
+            self.assertTrue(CancellationToken(timeout=-1).cancelled)
+            self.assertFalse(CancellationToken(timeout=60).cancelled)
+            pw = PluginWizard(config, 'contenttests')
+            self.assertRaises(GenerationCancelled, pw.generate, tempdir, cancel=CancellationToken(timeout=-1))
+            self.assertEqual(os.listdir(tempdir), [])
+            destpath = pw.generate(tempdir)
+            marker = os.path.join(destpath, 'marker.txt')
+            open(marker, 'w').close()
+            # cancelled while renaming: the overwritten plugin is put back
+            token = CancellationToken()
+            def progress(phase, done, total, path):
+                if phase == 'names':
+                    token.cancel()
+            pw = PluginWizard(config, 'contenttests', progress=progress)
+            self.assertRaises(GenerationCancelled, pw.generate, tempdir, overwrite=True, cancel=token)
+            self.assertTrue(os.path.isfile(marker))
+            self.assertFalse(os.path.exists(destpath + ROLLBACK_SUFFIX))
+            # cancelled in the middle of a file: the file is put back unprocessed
+            source = os.path.join(SOURCESDIR, 'contenttests', 'testfile1.py')
+            shutil.copy2(source, os.path.join(destpath, 'testfile1.py'))
+            class Token(CancellationToken):
+                checks = 0
+                def check(self):
+                    self.checks += 1
+                    if self.checks == 3:
+                        self.cancel()
+                    return super(Token, self).check()
+            lines = c4dplugwiz.CANCEL_CHECK_LINES
+            try:
+                c4dplugwiz.CANCEL_CHECK_LINES = 1
+                pw.set_destdir(destpath)
+                self.assertRaises(GenerationCancelled, pw.process_contents, exclude='marker', cancel=Token())
+            finally:
+                c4dplugwiz.CANCEL_CHECK_LINES = lines
+            self.assertEqual(sorted(os.listdir(destpath)), ['marker.txt', 'testfile1.py'])
+            with open(source, 'rb') as f:
+                with open(os.path.join(destpath, 'testfile1.py'), 'rb') as g:
+                    self.assertEqual(g.read(), f.read())
+            results = GenerationEngine().generate_many([dict(config, pluginName='Never')], tempdir, 'contenttests', 
+                                                       cancel=CancellationToken(timeout=-1))
+            self.assertEqual(results, [])
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testEngine(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            engine = GenerationEngine()
+            first = engine.wizard(dict(CONFIG_DEFAULT), 'contenttests')
+            config = dict(CONFIG_ALT)
+            second = engine.wizard(config, 'contenttests')
+            self.assertTrue(engine.template(SOURCESDIR, 'contenttests') is first.template)
+            self.assertTrue(second.template is first.template)
+            self.assertEqual(second._rules_filepath, first._rules_filepath)
+            self.assertEqual(second._rules_list, first._rules_list)
+            self.assertTrue(second._rules_code is first._rules_code)
+            self.assertEqual(len(engine._rules), 1)
+            # cached rules are executed again for each wizard
+            rules_filepath = os.path.join(tempdir, 'rules.py')
+            with open(rules_filepath, 'w') as f:
+                f.write("RULES = {'STAMP': os.urandom(8).encode('hex')}\n")
+            config_rules = dict(CONFIG_DEFAULT, rulesFile=rules_filepath)
+            first_rules = engine.wizard(dict(config_rules), 'contenttests')._rules_list
+            third = engine.wizard(dict(config_rules), 'contenttests')
+            self.assertEqual(len(engine._rules), 2)
+            self.assertNotEqual(third._rules_list, first_rules)
+            os.remove(rules_filepath)
+            destpath = engine.generate(config, tempdir, 'contenttests')
+            with codecs.open(os.path.join(destpath, 'testfile1.py'), 'r', 'utf-8') as f:
+                self.assertTrue('MYGREATESTPLUGIN' in f.read())
+            configs = [dict(CONFIG_DEFAULT, pluginName='Batch Plugin %d' % i) for i in range(6)]
+            configs.append(dict(CONFIG_DEFAULT, pluginName=config['pluginName']))
+            done = []
+            results = engine.generate_many(configs, tempdir, 'contenttests', workers=3, 
+                                           done=lambda *args: done.append(args))
+            self.assertEqual(sorted(results), sorted(done))
+            self.assertEqual(sorted(i for i, _, _ in results), range(7))
+            for i, path, error in results:
+                if i < 6:
+                    self.assertEqual(error, None)
+                    self.assertTrue(os.path.isfile(os.path.join(path, 'testfile1.py')))
+                else:
+                    # exists already and overwrite is False
+                    self.assertTrue(isinstance(error, CLIError))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testEngineTemplate(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            srcdir = os.path.join(tempdir, 'sources')
+            shutil.copytree(os.path.join(SOURCESDIR, 'contenttests'), os.path.join(srcdir, 'contenttests'))
+            with open(os.path.join(srcdir, 'contenttests', 'plain.txt'), 'w') as f:
+                f.write('nothing to replace in here\n')
+            config = dict(CONFIG_DEFAULT, srcdataPath=srcdir)
+            del config['rulesFile']
+            expected = PluginWizard(dict(config), 'contenttests').generate(os.path.join(tempdir, 'plain'), 
+                                                                           createdir=True)
+            engine = GenerationEngine()
+            engine.generate(dict(config), os.path.join(tempdir, 'cold'), 'contenttests', createdir=True)
+            opened = []
+            def recording_open(path, *args):
+                opened.append((path, args))
+                return open(path, *args)
+            events = []
+            c4dplugwiz.open = recording_open
+            try:
+                warm = engine.generate(dict(config), os.path.join(tempdir, 'warm'), 'contenttests', 
+                                       createdir=True, events=events.append)
+            finally:
+                del c4dplugwiz.open
+            # served from memory, files are only written
+            self.assertTrue(len(opened) > 0)
+            self.assertTrue(all(args == ('wb',) and not path.startswith(srcdir) for path, args in opened))
+            self.assertEqual(sorted(os.listdir(warm)), sorted(os.listdir(expected)))
+            for filename in os.listdir(expected):
+                with open(os.path.join(expected, filename), 'rb') as f:
+                    with open(os.path.join(warm, filename), 'rb') as g:
+                        self.assertEqual(g.read(), f.read())
+            skipped = [os.path.basename(e['path']) for e in events if e['event'] == 'skip']
+            self.assertEqual(skipped, ['plain.txt'])
+            # files edited in place are read again
+            template = engine.template(srcdir, 'contenttests')
+            with open(os.path.join(srcdir, 'contenttests', 'plain.txt'), 'w') as f:
+                f.write('now with %!PluginNameAsID!%\n')
+            self.assertTrue(template.is_stale())
+            destpath = engine.generate(dict(config), tempdir, 'contenttests')
+            with open(os.path.join(destpath, 'plain.txt')) as f:
+                self.assertEqual(f.read(), 'now with MakeAwesomeButton\n')
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testPreview(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            config = dict(CONFIG_DEFAULT)
+            preview = TemplatePreview(config, 'contenttests')
+            destpath = PluginWizard(dict(config), 'contenttests').generate(tempdir)
+            tree = preview.tree()
+            self.assertEqual([rendered for _, rendered, _ in tree], sorted(os.listdir(destpath)))
+            for relpath, rendered, _ in tree:
+                with codecs.open(os.path.join(destpath, rendered), 'r', 'utf-8') as f:
+                    self.assertMultiLineEqual(preview.render_file(relpath), f.read())
+            # only what uses the changed value is rendered again
+            preview = TemplatePreview(config, 'filenametests')
+            names = dict((relpath, rendered) for relpath, rendered, _ in preview.tree())
+            self.assertEqual(names['%!PluginNameAsUppercaseID!%.txt'], 'MAKEAWESOMEBUTTON.txt')
+            rendered = preview._rendered[('name', '%!OrgName!%.h')]
+            preview.update({'pluginName': 'Other Button'})
+            names = dict((relpath, rendered) for relpath, rendered, _ in preview.tree())
+            self.assertEqual(names['%!PluginNameAsUppercaseID!%.txt'], 'OTHERBUTTON.txt')
+            self.assertTrue(preview._rendered[('name', '%!OrgName!%.h')] is rendered)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def testTemplateInfo(self):
+        info = get_template_info(SOURCESDIR, 'contenttests')
+        self.assertEqual(info['files'], 1)
+        self.assertEqual(info['bytes'], os.path.getsize(os.path.join(SOURCESDIR, 'contenttests', 'testfile1.py')))
+        self.assertEqual(info['tokens'], ['ID', 'PluginName', 'PluginNameAsID', 'PluginNameAsUppercaseID'])
+        self.assertEqual(info['rulesFile'], None)
+        self.assertTrue('OrgNameAsAbbreviation' in get_template_info(SOURCESDIR, 'filenametests')['tokens'])
+
+
+class TestTemplateIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tempdir, 'index.json')
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    def testTemplateInfo(self):
+        index = TemplateIndex(SOURCESDIR, self.index_path).update()
+        for plugin_type in index.plugin_types:
+            self.assertEqual(get_template_info(SOURCESDIR, plugin_type, index=index), 
+                             get_template_info(SOURCESDIR, plugin_type))
+    
+    def testBuildAndLoad(self):
+        index = TemplateIndex(SOURCESDIR, self.index_path).update()
+        self.assertTrue(os.path.exists(self.index_path))
+        self.assertEqual(index.plugin_types, ['contenttests', 'filenametests'])
+        entry = index.files('contenttests')['testfile1.py']
+        self.assertFalse(entry['binary'])
+        self.assertEqual(entry['size'], os.path.getsize(os.path.join(SOURCESDIR, 'contenttests', 'testfile1.py')))
+        self.assertEqual(index.tokens('contenttests'), ['ID', 'PluginName', 'PluginNameAsID', 'PluginNameAsUppercaseID'])
+        self.assertTrue('AuthorNameAsAbbreviation' in index.tokens('filenametests'))
+        
+        loaded = TemplateIndex(SOURCESDIR, self.index_path)
+        self.assertTrue(loaded.load())
+        self.assertFalse(loaded.is_stale(check_files=True))
+        self.assertEqual(loaded.files('filenametests'), index.files('filenametests'))
+    
+    def testStaleness(self):
+        srcdir = os.path.join(self.tempdir, 'sources')
+        shutil.copytree(os.path.join(SOURCESDIR, 'contenttests'), os.path.join(srcdir, 'contenttests'))
+        index = TemplateIndex(srcdir, self.index_path).update()
+        self.assertFalse(index.is_stale())
+        # make sure the dir mtime changes even on file systems with coarse timestamps
+        time.sleep(1.1)
+        with open(os.path.join(srcdir, 'contenttests', 'inert.txt'), 'w') as f:
+            f.write('nothing to replace in here')
+        self.assertTrue(index.is_stale())
+        opened = []
+        def recording_open(path, *args):
+            opened.append(os.path.basename(path))
+            return open(path, *args)
+        c4dplugwiz.open = recording_open
+        try:
+            index.update()
+        finally:
+            del c4dplugwiz.open
+        self.assertFalse(index.is_stale())
+        # only the new file is read again
+        self.assertTrue('inert.txt' in opened)
+        self.assertFalse('testfile1.py' in opened)
+        inert = os.path.join(srcdir, 'contenttests', 'inert.txt')
+        self.assertFalse(index.needs_processing('contenttests', 'inert.txt', None))
+        templated = os.path.join(srcdir, 'contenttests', 'testfile1.py')
+        self.assertTrue(index.needs_processing('contenttests', 'testfile1.py', None))
+        # rules files are told apart by their contents, not just their path
+        rules_filepath = os.path.join(srcdir, 'rules.py')
+        with open(rules_filepath, 'w') as f:
+            f.write("RULES = {'unused': 'x'}\n")
+        index.update()
+        rules_filepath = index.rules_file('contenttests')
+        self.assertFalse(index.needs_processing('contenttests', 'inert.txt', rules_filepath))
+        mtime = os.stat(rules_filepath).st_mtime
+        with open(rules_filepath, 'w') as f:
+            f.write("RULES = {'nothing': 'x'}\n")
+        os.utime(rules_filepath, (mtime, mtime))
+        index = TemplateIndex(srcdir, self.index_path)
+        self.assertTrue(index.load())
+        self.assertTrue(index.needs_processing('contenttests', 'inert.txt', rules_filepath))
+    
+    def testSkipUnchanged(self):
+        srcdir = os.path.join(self.tempdir, 'sources')
+        shutil.copytree(os.path.join(SOURCESDIR, 'contenttests'), os.path.join(srcdir, 'contenttests'))
+        for filename in ['plain.txt', '%!PluginNameAsID!%.txt']:
+            with open(os.path.join(srcdir, 'contenttests', filename), 'w') as f:
+                f.write('nothing to replace in here\n')
+        index = TemplateIndex(srcdir, self.index_path).update()
+        events = []
+        destpath = os.path.join(self.tempdir, 'output')
+        os.mkdir(destpath)
+        # the same rules as the index was built with, i.e. none
+        config = dict(CONFIG_DEFAULT, srcdataPath=srcdir)
+        del config['rulesFile']
+        plugin_path = PluginWizard(config, 'contenttests', index=index, events=events.append).generate(destpath)
+        skipped = sorted(os.path.basename(e['path']) for e in events 
+                         if e['event'] == 'skip' and e['reason'] == 'unchanged')
+        # decided by the template file, also for files renamed by then
+        self.assertEqual(skipped, ['MakeAwesomeButton.txt', 'plain.txt'])
+        processed = [os.path.basename(e['path']) for e in events if e['event'] == 'file']
+        self.assertEqual(processed, ['testfile1.py'])
+        with open(os.path.join(plugin_path, 'plain.txt')) as f:
+            self.assertEqual(f.read(), 'nothing to replace in here\n')
+
+
+class TestTemplateStore(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.srcdir = os.path.join(self.tempdir, 'sources')
+        shutil.copytree(SOURCESDIR, self.srcdir)
+        # a second plugin type sharing all files with the first one
+        shutil.copytree(os.path.join(SOURCESDIR, 'contenttests'), os.path.join(self.srcdir, 'contenttests_r14'))
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    def testDedup(self):
+        stats = dedup_templates(self.srcdir, remove=True)
+        self.assertEqual(stats['blobs'], len(os.listdir(os.path.join(self.srcdir, DEFAULT_BLOBDIR))))
+        self.assertTrue(stats['blobs'] < stats['files'])
+        self.assertTrue(stats['storedBytes'] < stats['bytes'])
+        self.assertEqual(list_plugin_types(self.srcdir), ['contenttests', 'contenttests_r14', 'filenametests'])
+        for plugin_type in ['contenttests_r14', 'filenametests']:
+            destpath = os.path.join(self.tempdir, 'output', plugin_type)
+            copy_template(self.srcdir, plugin_type, destpath)
+            original = os.path.join(SOURCESDIR, plugin_type.replace('_r14', ''))
+            for dirpath, _, filenames in os.walk(original):
+                for filename in filenames:
+                    relpath = os.path.relpath(os.path.join(dirpath, filename), original)
+                    with open(os.path.join(original, relpath), 'rb') as f1:
+                        with open(os.path.join(destpath, relpath), 'rb') as f2:
+                            self.assertEqual(f1.read(), f2.read())
+    
+    def testIndex(self):
+        expected = TemplateIndex(self.srcdir, os.path.join(self.tempdir, 'expected.json')).update()
+        dedup_templates(self.srcdir, remove=True)
+        index = TemplateIndex(self.srcdir, os.path.join(self.tempdir, 'index.json')).update()
+        self.assertEqual(index.plugin_types, expected.plugin_types)
+        for plugin_type in index.plugin_types:
+            self.assertEqual(index.tokens(plugin_type), expected.tokens(plugin_type))
+            self.assertEqual(sorted(index.files(plugin_type)), sorted(expected.files(plugin_type)))
+        self.assertFalse(index.is_stale(check_files=True))
+
+
+class TestTemplateArchive(unittest.TestCase):
+    
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+    
+    def assertSameTree(self, original, copy):
+        for dirpath, _, filenames in os.walk(original):
+            for filename in filenames:
+                relpath = os.path.relpath(os.path.join(dirpath, filename), original)
+                with open(os.path.join(original, relpath), 'rb') as f1:
+                    with open(os.path.join(copy, relpath), 'rb') as f2:
+                        self.assertEqual(f1.read(), f2.read())
+    
+    def testAbstract(self):
+        bundle_path = os.path.join(self.tempdir, 'sources.c4dtpl')
+        pack_templates(SOURCESDIR, bundle_path)
+        self.assertRaises(TypeError, TemplateArchive, bundle_path)
+    
+    def testBundle(self):
+        bundle_path = os.path.join(self.tempdir, 'sources.c4dtpl')
+        stats = pack_templates(SOURCESDIR, bundle_path)
+        self.assertEqual(stats['bytes'], os.path.getsize(bundle_path))
+        archive = open_template_archive(bundle_path)
+        self.assertTrue(isinstance(archive, TemplateBundle))
+        self.assertTrue(open_template_archive(bundle_path) is archive)
+        self.assertEqual(list_plugin_types(bundle_path), ['contenttests', 'filenametests'])
+        with open(os.path.join(SOURCESDIR, 'contenttests', 'testfile1.py'), 'rb') as f:
+            content = f.read()
+        self.assertEqual(archive.read('contenttests/testfile1.py'), content)
+        self.assertEqual(read_source_file(os.path.join(bundle_path, 'contenttests', 'testfile1.py')), content)
+        destpath = os.path.join(self.tempdir, 'output')
+        copy_template(bundle_path, 'filenametests', destpath)
+        self.assertSameTree(os.path.join(SOURCESDIR, 'filenametests'), destpath)
+    
+    def testZip(self):
+        zip_path = os.path.join(self.tempdir, 'sources.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            for dirpath, _, filenames in os.walk(SOURCESDIR):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    zf.write(filepath, os.path.relpath(filepath, SOURCESDIR))
+        self.assertTrue(isinstance(open_template_archive(zip_path), ZipTemplateArchive))
+        self.assertEqual(list_plugin_types(zip_path), ['contenttests', 'filenametests'])
+        destpath = os.path.join(self.tempdir, 'output')
+        copy_template(zip_path, 'contenttests', destpath)
+        self.assertSameTree(os.path.join(SOURCESDIR, 'contenttests'), destpath)
+        index = TemplateIndex(zip_path, os.path.join(self.tempdir, 'index.json')).update()
+        self.assertEqual(index.tokens('contenttests'), ['ID', 'PluginName', 'PluginNameAsID', 'PluginNameAsUppercaseID'])
+    
+    def testTar(self):
+        # archived together with its folder, like 'tar czf sources.tgz sources'
+        tar_path = os.path.join(self.tempdir, 'sources.tgz')
+        with closing(tarfile.open(tar_path, 'w:gz')) as tf:
+            tf.add(SOURCESDIR, 'sources')
+        self.assertTrue(isinstance(open_template_archive(tar_path), TarTemplateArchive))
+        self.assertEqual(list_plugin_types(tar_path), ['contenttests', 'filenametests'])
+        destpath = os.path.join(self.tempdir, 'output')
+        copy_template(tar_path, 'filenametests', destpath)
+        self.assertSameTree(os.path.join(SOURCESDIR, 'filenametests'), destpath)
+    
+    def testMain(self):
+        zip_path = os.path.join(self.tempdir, 'sources.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            for dirpath, _, filenames in os.walk(SOURCESDIR):
+                for filename in filenames:
+                    filepath = os.path.join(dirpath, filename)
+                    zf.write(filepath, os.path.join('sources', os.path.relpath(filepath, SOURCESDIR)))
+        destpath = os.path.join(self.tempdir, 'output')
+        result = c4dplugwiz.main(['c4dplugwiz', '-s', zip_path, '-t', 'contenttests', '-d', destpath, 
+                                  '-c', '--no-history', '1000001', 'Archive Plugin'], extend=False)
+        self.assertEqual(result, 0)
+        with codecs.open(os.path.join(destpath, 'Archive Plugin', 'testfile1.py'), 'r', 'utf-8') as f:
+            self.assertTrue('ARCHIVEPLUGIN' in f.read())
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,132 @@
+# encoding: utf-8
+'''
+Startup benchmark for the wizard GUI.
+
+Starts a fresh interpreter for each run which imports :py:mod:`gui`,
+creates the wizard and reports the wall time from launch until the
+event loop is idle with the first page on screen, i.e. when the wizard
+becomes interactive. The time it then takes to build each of the
+remaining pages on first display is reported as well.
+
+The GUI is run with ``QT_QPA_PLATFORM=offscreen`` so no display is
+needed where the Qt build supports the offscreen platform plugin. With
+a Qt 4 build without QPA an X server (e.g. Xvfb) is still required::
+
+    python gui_startup.py
+    python gui_startup.py --repeat 20 --save gui_startup.json
+
+The exit status is 1 if the median time to the first page exceeds the
+``gui`` entry of ``startup_budget.json``.
+
+@author: andre
+'''
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+from c4dplugwiz_startup import SOURCEDIR, DEFAULT_BUDGET, get_env, median
+
+
+def child(start):
+    '''Runs in the benchmarked process. Prints timings in ms as JSON.'''
+    sys.path.insert(0, SOURCEDIR)
+    import gui
+    from PyQt4 import QtGui, QtCore
+    timings = {'import': (time.time() - start) * 1000.0}
+    app = QtGui.QApplication(sys.argv[:1])
+    wizard = gui.createWizard()
+
+    def ready():
+        timings['firstPage'] = (time.time() - start) * 1000.0
+        for pageId in wizard.pageIds()[1:]:
+            page = wizard.page(pageId)
+            before = time.time()
+            if hasattr(page, 'ensureBuilt'):
+                page.ensureBuilt()
+            timings['page%d' % pageId] = (time.time() - before) * 1000.0
+        print(json.dumps(timings))
+        app.quit()
+
+    # fires once the first page has been shown and all pending events are processed
+    QtCore.QTimer.singleShot(0, ready)
+    app.exec_()
+    return 0
+
+
+def run_once(python, env):
+    '''Start the GUI once and return its timings.'''
+    proc = subprocess.Popen([python, os.path.realpath(__file__), '--child', repr(time.time())],
+                            cwd=SOURCEDIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError("GUI startup failed with exit status %d:%s%s" %
+                           (proc.returncode, os.linesep, err or out))
+    if not isinstance(out, str):
+        out = out.decode('utf-8', 'replace')
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(python, repeat=10):
+    '''
+    Start the GUI ``repeat`` times.
+
+    :return: dict of ``{measurement: {'min': ms, 'median': ms}}``
+    '''
+    tempdir = tempfile.mkdtemp()
+    try:
+        env = get_env(os.path.join(tempdir, 'cache'))
+        env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        # warm up, see c4dplugwiz_startup.run
+        run_once(python, env)
+        runs = [run_once(python, env) for _ in range(repeat)]
+        results = {}
+        for key in runs[0]:
+            values = [r[key] for r in runs]
+            results[key] = {'min': min(values), 'median': median(values)}
+        return results
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) == 2 and argv[0] == '--child':
+        return child(float(argv[1]))
+    parser = ArgumentParser(description="Measure the time until the wizard GUI is interactive.")
+    parser.add_argument('--python', default=sys.executable,
+                        help="interpreter to run the GUI with [default: %(default)s]")
+    parser.add_argument('--repeat', type=int, default=10,
+                        help="number of runs [default: %(default)s]")
+    parser.add_argument('--budget', metavar='path', default=DEFAULT_BUDGET,
+                        help="JSON file with the max. median in ms for the 'gui' entry [default: %(default)s]")
+    parser.add_argument('--save', metavar='path', help="save results to path.")
+    args = parser.parse_args(argv)
+
+    results = run(args.python, args.repeat)
+    with open(args.budget, 'r') as f:
+        limit = json.load(f).get('gui')
+    print("%-14s %10s %10s" % ("measurement", "min", "median"))
+    for key in sorted(results):
+        print("%-14s %7.1f ms %7.1f ms" % (key, results[key]['min'], results[key]['median']))
+    print("")
+    over = limit is not None and results['firstPage']['median'] > limit
+    print("first page: %.1f ms, budget: %s%s" % (results['firstPage']['median'],
+                                                 'n/a' if limit is None else '%.0f ms' % limit,
+                                                 '  OVER BUDGET' if over else ''))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': args.python, 'results': results}, f, indent=1, sort_keys=True)
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())